@@ -4,7 +4,7 @@ from .models import TaskQueue
 
 class TaskQueueAdmin(admin.ModelAdmin):
     list_display = ('module', 'function_name', 'is_periodic',
-                    'scheduled', 'status')
+                    'scheduled', 'priority', 'status')
 
     def function_name(self, obj):
         """
@@ -0,0 +1,195 @@
+"""
+Asyncio based worker: runs tasks defined as coroutine functions
+(``async def``) concurrently on a single event loop.
+
+Requires Python >= 3.5.
+"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+
+from .models import DEFAULT_QUEUE
+from .notify import Listener
+from .worker import (
+    EXIT_CHECK_INTERVAL,
+    TaskHandler,
+)
+
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncTaskHandler(object):
+    """
+    Claims tasks and runs up to concurrency tasks at the same time.
+    Coroutine functions are awaited on the event loop, other callables
+    are executed in a thread pool. All database access happens in a
+    single separate thread, so the event loop never blocks on the
+    database.
+    """
+
+    def __init__(self, exit_event, concurrency, queue=DEFAULT_QUEUE):
+        self.exit_event = exit_event
+        self.concurrency = max(1, concurrency)
+        self.handler = TaskHandler(exit_event, queue=queue)
+        self.db_executor = ThreadPoolExecutor(max_workers=1)
+        self.sync_executor = ThreadPoolExecutor(max_workers=self.concurrency)
+        self.loop = None
+        self.wakeup = None
+
+    def run_in_db(self, func, *args):
+        return self.loop.run_in_executor(self.db_executor, func, *args)
+
+    async def run(self):
+        """Main loop of the worker."""
+        self.loop = asyncio.get_event_loop()
+        self.wakeup = asyncio.Event()
+        listener = await self.run_in_db(Listener.create)
+        if listener:
+            self.loop.add_reader(
+                listener.fileno(), self.on_notification, listener)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        running = set()
+        try:
+            while not self.exit_event.is_set():
+                await semaphore.acquire()
+                task = await self.run_in_db(self.handler.get_next_task)
+                if task is None:
+                    semaphore.release()
+                    await self.idle()
+                    continue
+                future = asyncio.ensure_future(
+                    self.handle_task(task, semaphore))
+                running.add(future)
+                future.add_done_callback(running.discard)
+            if running:
+                await asyncio.wait(running)
+        finally:
+            if listener:
+                self.loop.remove_reader(listener.fileno())
+                await self.run_in_db(listener.close)
+            await self.run_in_db(self.handler.release_tasks)
+            await self.run_in_db(close_connection)
+            self.db_executor.shutdown()
+            self.sync_executor.shutdown()
+
+    def on_notification(self, listener):
+        listener.drain()
+        self.wakeup.set()
+
+    async def idle(self):
+        """
+        Waits for a notification about new tasks, but at most for the
+        idle time of the handler. Checks the exit_event every
+        EXIT_CHECK_INTERVAL seconds.
+        """
+        deadline = self.loop.time() + self.handler.idle_time
+        while not self.exit_event.is_set():
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                break
+            timeout = min(remaining, EXIT_CHECK_INTERVAL)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                continue
+            self.wakeup.clear()
+            break
+
+    async def handle_task(self, task, semaphore):
+        """
+        Executes a single task or a batch of tasks and releases the
+        semaphore afterwards. Errors of the worker itself (i.e. on
+        saving a task) are logged and the tasks are set to ERROR, so
+        they don't stay RUNNING.
+        """
+        tasks = getattr(task, 'batch_tasks', None) or [task]
+        try:
+            await self.execute(task)
+        except Exception as err:
+            logger.exception('autotask: handling of %s failed', task)
+            try:
+                await self.run_in_db(self.handler.abort_tasks, tasks, err)
+            except Exception:
+                logger.exception('autotask: aborting %s failed', task)
+        finally:
+            semaphore.release()
+
+    async def execute(self, task):
+        """
+        Executes a single task or a batch of tasks and stores the
+        results. Blocking calls run in the executors, so the event loop
+        never blocks on the database, on the serialization of results
+        or on the result store.
+        """
+        tasks = getattr(task, 'batch_tasks', None)
+        if tasks is None and task.is_periodic:
+            if await self.run_in_db(self.handler.apply_misfire_policy, task):
+                return
+        error = None
+        try:
+            if tasks is None:
+                callable, args, kwargs = await self.run_in_db(
+                    self.handler.prepare_call, task)
+            else:
+                callable, items = await self.run_in_db(
+                    self.handler.prepare_batch, tasks)
+                args, kwargs = (items,), {}
+            if asyncio.iscoroutinefunction(callable):
+                result = await callable(*args, **kwargs)
+            else:
+                result = await self.loop.run_in_executor(
+                    self.sync_executor,
+                    functools.partial(callable, *args, **kwargs))
+            if tasks is None:
+                await self.loop.run_in_executor(
+                    self.sync_executor,
+                    self.handler.store_result, task, result)
+            else:
+                await self.loop.run_in_executor(
+                    self.sync_executor,
+                    self.handler.store_batch_results, tasks, result)
+        except Exception as err:
+            # catch everything, because it is unknown
+            # what may had happen with the callable
+            error = err
+        if tasks is None:
+            await self.run_in_db(self.handler.finish_task, task, error)
+        else:
+            await self.run_in_db(self.handler.finish_batch, tasks, error)
+
+
+def close_connection():
+    # connection is a proxy to the connection of the calling thread
+    connection.close()
+
+
+def run_event_loop(exit_event, concurrency, queue=DEFAULT_QUEUE):
+    """
+    Runs an AsyncTaskHandler for the given queue on a new event loop
+    until the exit_event is set.
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        handler = AsyncTaskHandler(exit_event, concurrency, queue)
+        loop.run_until_complete(handler.run())
+    finally:
+        loop.close()
+
+
+def run_coroutine(coroutine):
+    """
+    Runs a coroutine to completion on a temporary event loop and
+    returns the result. Used by the synchronous workers for tasks
+    defined as coroutine functions.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
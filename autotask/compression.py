@@ -0,0 +1,140 @@
+"""
+Compression of large serialized arguments and results.
+
+Data with at least AUTOTASK_COMPRESSION_THRESHOLD bytes gets compressed
+by the codec set by AUTOTASK_COMPRESSION. The codec used for a blob is
+stored in the TaskQueue.compression flags of the task: two bits for
+every blob, so the arguments and the result are handled independently.
+"""
+
+import threading
+import zlib
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .conf import settings
+
+try:
+    import lzma
+except ImportError:
+    # not available with Python 2
+    lzma = None
+
+
+# codecs
+NONE = 0
+ZLIB = 1
+LZMA = 2
+
+CODECS = {
+    'zlib': ZLIB,
+    'lzma': LZMA,
+}
+
+# bit offsets of the blobs in the compression flags
+ARGUMENTS = 0
+RESULT = 2
+
+
+def get_codec(flags, blob):
+    """Returns the codec of the blob from the compression flags."""
+    return (flags >> blob) & 3
+
+
+def set_codec(flags, blob, codec):
+    """Returns the compression flags with the codec set for the blob."""
+    return (flags & ~(3 << blob)) | (codec << blob)
+
+
+class CompressionStats(object):
+    """
+    Counts the compressed data of the current process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.compressed = 0  # number of compressed blobs
+            # number of blobs not compressible below their size:
+            self.uncompressed = 0
+            self.bytes_in = 0  # size of the compressed blobs
+            self.bytes_out = 0  # size after compression
+
+    def add(self, size, compressed_size=None):
+        with self.lock:
+            if compressed_size is None:
+                self.uncompressed += 1
+            else:
+                self.compressed += 1
+                self.bytes_in += size
+                self.bytes_out += compressed_size
+
+    def get_stats(self):
+        """
+        Returns a dictionary with the counters and the compression ratio
+        (compressed size / original size of the compressed blobs).
+        """
+        with self.lock:
+            ratio = None
+            if self.bytes_in:
+                ratio = self.bytes_out / float(self.bytes_in)
+            return {
+                'compressed': self.compressed,
+                'uncompressed': self.uncompressed,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'ratio': ratio,
+            }
+
+
+stats = CompressionStats()
+
+
+def get_compression_codec():
+    """Returns the codec set by AUTOTASK_COMPRESSION."""
+    name = settings.AUTOTASK_COMPRESSION
+    if not name:
+        return NONE
+    try:
+        codec = CODECS[name]
+    except KeyError:
+        raise ImproperlyConfigured(
+            'unknown autotask compression: {}'.format(name))
+    if codec == LZMA and lzma is None:
+        raise ImproperlyConfigured('lzma is not available')
+    return codec
+
+
+def compress(data):
+    """
+    Returns a tuple (data, codec). The data gets compressed if it is
+    at least AUTOTASK_COMPRESSION_THRESHOLD bytes long and compression
+    reduces the size. Otherwise the data is returned unchanged with
+    the codec NONE.
+    """
+    codec = get_compression_codec()
+    if codec == NONE or len(data) < settings.AUTOTASK_COMPRESSION_THRESHOLD:
+        return data, NONE
+    if codec == LZMA:
+        compressed = lzma.compress(data)
+    else:
+        compressed = zlib.compress(data)
+    if len(compressed) >= len(data):
+        stats.add(len(data))
+        return data, NONE
+    stats.add(len(data), len(compressed))
+    return compressed, codec
+
+
+def decompress(data, codec):
+    """Returns the data decompressed by the given codec."""
+    if codec == ZLIB:
+        return zlib.decompress(data)
+    if codec == LZMA:
+        if lzma is None:
+            raise ImproperlyConfigured('lzma is not available')
+        return lzma.decompress(data)
+    return data
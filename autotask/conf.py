@@ -16,13 +16,30 @@ class Settings(object):
         """
         Set some useable defaults.
         """
+        self.AUTOTASK_ASYNC_CONCURRENCY = 10
+        self.AUTOTASK_BULK_CHUNK_SIZE = 500
+        self.AUTOTASK_CLAIM_BATCH_SIZE = 1
         self.AUTOTASK_CLEAN_INTERVALL = 600
+        self.AUTOTASK_COMPRESSION = 'zlib'
+        self.AUTOTASK_COMPRESSION_THRESHOLD = 1024
         self.AUTOTASK_HANDLE_TASK_IDLE_TIME = 10
         self.AUTOTASK_IS_ACTIVE = False
+        self.AUTOTASK_PRELOAD_MODULES = ()
+        self.AUTOTASK_NOTIFY_DIR = None
+        self.AUTOTASK_USE_NOTIFY = True
         self.AUTOTASK_WORKERS = 1
         self.AUTOTASK_WORKER_EXECUTABLE = 'python'
+        self.AUTOTASK_WORKER_MODE = 'process'
         self.AUTOTASK_WORKER_MONITOR_INTERVALL = 5
+        self.AUTOTASK_WORKER_THREADS = 4
+        self.AUTOTASK_PRIORITY_AGING = None
+        self.AUTOTASK_PRIORITY_AGING_LIMIT = None  # highest queued priority
+        self.AUTOTASK_QUEUES = None
+        self.AUTOTASK_RECLAIM_TIMEOUT = None
+        self.AUTOTASK_RESULT_STORE_DIR = None
+        self.AUTOTASK_RESULT_STORE_THRESHOLD = None
         self.AUTOTASK_RETRY_DELAY = 2
+        self.AUTOTASK_SERIALIZER = 'pickle'
         self.DEBUG = True  # used for running pytest with threads
 
     def _get_overrides(self):
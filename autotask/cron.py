@@ -1,17 +1,247 @@
-
+import bisect
 import calendar
+from collections import OrderedDict
 import datetime
 from datetime import timedelta
+import itertools
 import re
+import threading
 
 from django.conf import settings
 from django.utils.timezone import (
+    get_default_timezone,
     is_aware,
     make_aware,
+    make_naive,
     now,
+    utc,
+)
+
+from .timezones import (
+    get_timezone,
+    zone_offsets,
 )
 
 
+# max. number of years to search for the next schedule. Even a schedule
+# for the 29th of February is found within this period.
+SEARCH_YEARS = 10
+
+# bit-mask of the days 1-31 of a month (bit 0 is unused)
+ALL_DAYS = (1 << 32) - 2
+
+# max. number of compiled schedules cached per process
+CACHE_SIZE = 256
+
+DOW_NAMES = {
+    'MON': 0, 'TUE': 1, 'WED': 2, 'THU': 3, 'FRI': 4, 'SAT': 5, 'SUN': 6,
+}
+
+MONTH_NAMES = {
+    'JAN': 1, 'FEB': 2, 'MAR': 3, 'APR': 4, 'MAY': 5, 'JUN': 6,
+    'JUL': 7, 'AUG': 8, 'SEP': 9, 'OCT': 10, 'NOV': 11, 'DEC': 12,
+}
+
+# the crontab fields in the order used by autotask:
+# (name, min. value, max. value, names for values)
+FIELDS = (
+    ('minutes', 0, 59, None),
+    ('hours', 0, 23, None),
+    ('dow', 0, 6, DOW_NAMES),
+    ('months', 1, 12, MONTH_NAMES),
+    ('dom', 1, 31, None),
+)
+
+# macros in the order 'minutes hours dow months dom'
+MACROS = {
+    '@yearly': '0 0 * 1 1',
+    '@annually': '0 0 * 1 1',
+    '@monthly': '0 0 * * 1',
+    '@weekly': '0 0 SUN * *',
+    '@daily': '0 0 * * *',
+    '@midnight': '0 0 * * *',
+    '@hourly': '0 * * * *',
+}
+
+# an element of a field: '*', a value or a range, with an optional step
+ELEMENT_PATTERN = re.compile(
+    r'^(?:\*|(?P<first>\w+)(?:-(?P<last>\w+))?)(?:/(?P<step>\d+))?$')
+
+
+class CompiledSchedule(object):
+    """
+    Compiled representation of the crontab data for fast calculation
+    of the next schedule: sorted tuples of the allowed minutes and hours
+    and bit-masks of the allowed months and days. The allowed days of a
+    month depend on the weekday of its first day only, so the day-masks
+    are precomputed for all seven weekdays.
+    All arguments are lists of integers or None for all valid values.
+    """
+
+    def __init__(self, minutes=None, hours=None,
+                 dow=None, months=None, dom=None):
+        self.minutes = tuple(sorted(set(minutes or range(60))))
+        self.hours = tuple(sorted(set(hours or range(24))))
+        # all allowed times of a day as sorted (hour, minute) tuples:
+        self.times = tuple(
+            (hour, minute) for hour in self.hours for minute in self.minutes)
+        self.month_mask = get_mask(months or range(1, 13))
+        self.dom_mask = get_mask(dom) if dom else 0
+        self.dow_mask = get_mask(dow) if dow else 0
+        # allowed days by the weekday of the first day of a month:
+        self.day_masks = tuple(
+            self.get_day_mask(weekday) for weekday in range(7))
+
+    def get_day_mask(self, first_weekday):
+        """
+        Returns the bit-mask of the allowed days of a month starting
+        with the given weekday. If dom and dow are given, the allowed
+        days complement each other.
+        """
+        if not self.dom_mask and not self.dow_mask:
+            return ALL_DAYS
+        mask = self.dom_mask
+        for day in range(1, 32):
+            if self.dow_mask >> ((first_weekday + day - 1) % 7) & 1:
+                mask |= 1 << day
+        return mask
+
+    def month_allowed(self, month):
+        return bool(self.month_mask >> month & 1)
+
+    def day_allowed(self, year, month, day):
+        first_weekday, _ = calendar.monthrange(year, month)
+        return bool(self.day_masks[first_weekday] >> day & 1)
+
+    def hour_allowed(self, hour):
+        return hour in self.hours
+
+    def get_next_time(self, hour, minute):
+        """
+        Returns the first allowed time (hour, minute) of a day not
+        before the given time or None if there is none left.
+        """
+        index = bisect.bisect_left(self.hours, hour)
+        if index == len(self.hours):
+            return None
+        next_hour = self.hours[index]
+        if next_hour == hour:
+            minute_index = bisect.bisect_left(self.minutes, minute)
+            if minute_index < len(self.minutes):
+                return hour, self.minutes[minute_index]
+            if index + 1 == len(self.hours):
+                return None
+            next_hour = self.hours[index + 1]
+        return next_hour, self.minutes[0]
+
+    def get_next(self, schedule):
+        """
+        Returns the next allowed schedule after the given naive
+        datetime as a naive datetime with seconds set to zero.
+        Needs at most two day-steps per month and is bounded by
+        SEARCH_YEARS. Raises a ValueError if there is no allowed
+        schedule in this period (i.e. for the 30th of February).
+        """
+        schedule = (schedule.replace(second=0, microsecond=0) +
+                    timedelta(minutes=1))
+        year, month, day = schedule.year, schedule.month, schedule.day
+        hour, minute = schedule.hour, schedule.minute
+        for _ in range(SEARCH_YEARS * 12):
+            if self.month_mask >> month & 1:
+                first_weekday, days = calendar.monthrange(year, month)
+                mask = self.day_masks[first_weekday] & get_days_mask(days)
+                # remove the days before day:
+                mask = mask >> day << day
+                while mask:
+                    next_day = (mask & -mask).bit_length() - 1
+                    if next_day == day:
+                        time = self.get_next_time(hour, minute)
+                    else:
+                        time = self.hours[0], self.minutes[0]
+                    if time:
+                        return datetime.datetime(
+                            year, month, next_day, *time)
+                    # no time left for the day:
+                    mask &= mask - 1
+            # first moment of the next month
+            month += 1
+            if month > 12:
+                month = 1
+                year += 1
+            day = 1
+            hour = minute = 0
+        raise ValueError('no schedule found within {} years'.format(
+            SEARCH_YEARS))
+
+    def iter_days(self, schedule):
+        """
+        Generator for the allowed days after the given naive datetime.
+        Yields tuples (date, index) with index of the first allowed time
+        of the day in self.times. Raises a ValueError if there is no
+        allowed day within SEARCH_YEARS.
+        """
+        schedule = (schedule.replace(second=0, microsecond=0) +
+                    timedelta(minutes=1))
+        year, month, day = schedule.year, schedule.month, schedule.day
+        first_index = bisect.bisect_left(
+            self.times, (schedule.hour, schedule.minute))
+        empty_months = 0
+        while empty_months < SEARCH_YEARS * 12:
+            empty_months += 1
+            if self.month_mask >> month & 1:
+                first_weekday, days = calendar.monthrange(year, month)
+                mask = self.day_masks[first_weekday] & get_days_mask(days)
+                mask = mask >> day << day
+                while mask:
+                    next_day = (mask & -mask).bit_length() - 1
+                    index = first_index if next_day == day else 0
+                    if index < len(self.times):
+                        empty_months = 0
+                        yield datetime.date(year, month, next_day), index
+                    mask &= mask - 1
+            month += 1
+            if month > 12:
+                month = 1
+                year += 1
+            day = 1
+            first_index = 0
+        raise ValueError('no schedule found within {} years'.format(
+            SEARCH_YEARS))
+
+    def get_array(self, schedule, end=None, n=None):
+        """
+        Returns the allowed schedules after the given naive datetime
+        as a numpy datetime64 array with minute resolution. The array
+        ends with the last schedule not after the naive datetime end
+        or after n schedules. At least one of both must be given.
+        The schedules of a day are calculated as a single vector.
+        Requires numpy.
+        """
+        import numpy
+        if end is None and n is None:
+            raise ValueError('end or n is required')
+        offsets = numpy.array(
+            [hour * 60 + minute for hour, minute in self.times],
+            dtype='timedelta64[m]')
+        chunks = []
+        size = 0
+        for date, index in self.iter_days(schedule):
+            if end is not None and date > end.date():
+                break
+            chunk = numpy.datetime64(date, 'm') + offsets[index:]
+            chunks.append(chunk)
+            size += len(chunk)
+            if n is not None and size >= n:
+                break
+        if not chunks:
+            return numpy.array([], dtype='datetime64[m]')
+        schedules = numpy.concatenate(chunks)
+        if end is not None:
+            schedules = schedules[:numpy.searchsorted(
+                schedules, numpy.datetime64(end, 'm'), side='right')]
+        return schedules[:n]
+
+
 class CronScheduler(object):
     """
     Schedules a cron task.
@@ -23,7 +253,7 @@ class CronScheduler(object):
     """
 
     def __init__(self, last_schedule=None, minutes=None, hours=None,
-                 dow=None, months=None, dom=None, crontab=None):
+                 dow=None, months=None, dom=None, crontab=None, tz=None):
         """
         Inits the scheduler with values according the crontab-format.
 
@@ -37,86 +267,225 @@ class CronScheduler(object):
         run [0-6] (0 for monday up to 6 for sunday).
         month: list of integers for the months a task should run [1-12]
         dom: list of intergs for the day in a month a task should run [1-31]
+        tz: timezone of the wall-clock time the crontab refers to, as
+        name (like 'Europe/Berlin') or tzinfo. Defaults to None for the
+        timezone of the last_schedule (UTC for schedules from the
+        database).
         """
         self.last_schedule = last_schedule or now()
+        self.tz = get_timezone(tz) if tz is not None else None
+        self.zone = zone_offsets.get(self.tz) if self.tz else None
         if crontab:
-            self.parse_crontab(crontab)
+            fields, self.schedule = schedule_cache.get(crontab=crontab)
+            # copies, so the cached data can't get modified:
+            (self.minutes, self.hours, self.dow,
+             self.months, self.dom) = [
+                list(values) if values is not None else None
+                for values in fields]
         else:
             self.minutes = minutes
             self.hours = hours
             self.dow = dow
             self.months = months
             self.dom = dom
+            _, self.schedule = schedule_cache.get(
+                fields=(minutes, hours, dow, months, dom))
 
     def parse_crontab(self, crontab):
         """
-        Parses a simple crontab-string with five patterns:
+        Parses a crontab-string with five patterns and sets the
+        according attributes. See parse_crontab() for the format.
+        Raises a ValueError if the crontab could not be parsed.
+        """
+        if not crontab:
+            return False
+        fields = parse_crontab(crontab)
+        self.minutes, self.hours, self.dow, self.months, self.dom = fields
 
-        Minute [0,59]
-        Hour [0,23]
-        Day of the month [1,31]
-        Month of the year [1,12]
-        Day of the week ([0,6] with 0=Monday)
+    def get_next_schedule(self, last_schedule=None):
+        """
+        Returns the next schedule after last_schedule (defaults to the
+        last_schedule given on init) as a datetime-object. The seconds
+        of the schedule are always zero.
+        """
+        ls = last_schedule or self.last_schedule
+        if self.tz is not None:
+            return self.from_utc(self.get_next_instant(self.get_utc(ls)))
+        tzinfo = ls.tzinfo if is_aware(ls) else None
+        next_schedule = self.schedule.get_next(ls.replace(tzinfo=None))
+        return self.localize(next_schedule, tzinfo)
 
-        Each of these patterns can be either an asterisk (meaning all
-        valid values), an element, or a list of elements separated by
-        commas. An element shall be either a number or two numbers
-        separated by a hyphen (meaning an inclusive range).
+    def get_next_instant(self, instant):
+        """
+        Returns the next schedule after the naive UTC instant by the
+        wall-clock time of self.tz as naive UTC instant. Every local
+        time allowed by the crontab runs once: local times skipped at
+        the start of daylight saving time run shifted forward by the
+        gap, repeated local times at the end of daylight saving time
+        run at their first occurrence (or at the second one, if the
+        first has already passed).
+        """
+        local = self.zone.to_local(instant)
+        while True:
+            local = self.schedule.get_next(local)
+            for fold in (0, 1):
+                next_instant = self.zone.to_utc(local, fold)
+                if next_instant > instant:
+                    return next_instant
 
-        A day-range for a month like 1-4,12,20-25 is also ok. But keep
-        in mind that no spaces are allowed as spaces are the separators
-        between the patterns.
+    def iter_instants(self, start, end=None):
+        """
+        Generator for the schedules by get_next_instant() after start
+        up to and including end (naive UTC instants).
+        """
+        instant = start
+        while True:
+            instant = self.get_next_instant(instant)
+            if end is not None and instant > end:
+                return
+            yield instant
 
-        Some examples:
+    @staticmethod
+    def get_utc(schedule):
+        """
+        Returns the schedule as naive datetime in UTC. Naive schedules
+        are in the default timezone.
+        """
+        if not is_aware(schedule):
+            schedule = make_aware(schedule, get_default_timezone())
+        return schedule.astimezone(utc).replace(tzinfo=None)
 
-        * * * * *               runs every minute
-        5 * * * *               runs every five minutes
-        30 7 0 4,7 10-15        runs at 7:30 on mondays and also from the
-                                10th to 15th of a month, but only in april
-                                and july
+    def from_utc(self, instant):
+        """
+        Returns the naive UTC instant as aware datetime in self.tz or
+        as naive datetime in the default timezone if USE_TZ is not set.
+        """
+        schedule = instant.replace(tzinfo=utc).astimezone(self.tz)
+        if not settings.USE_TZ:
+            return make_naive(schedule, get_default_timezone())
+        return schedule
 
-        May raise errors if the crontab could not be parsed. The
-        crontab-content is *not* checked for correctness).
+    def iter_schedules(self, start=None, end=None):
         """
-        if not crontab:
-            return False
-        outer = []
-        for item in crontab.split():
-            item = item.strip()
-            if item == '*':
-                outer.append(None)
-                continue
-            inner = []
-            for element in item.split(','):
-                mo = re.match(r'(\d+)-(\d+)', element)
-                if mo:
-                    inner.extend([i for i in range(
-                        int(mo.group(1)), int(mo.group(2))+1)])
+        Generator for the schedules after start (defaults to the
+        last_schedule given on init) up to and including end. Without
+        end the generator is endless. The schedules are the same as
+        returned by consecutive calls of get_next_schedule() but are
+        calculated day by day instead of one by one (unless a timezone
+        is set by tz).
+        """
+        start = start or self.last_schedule
+        if self.tz is not None:
+            if end is not None:
+                end = self.get_utc(end)
+            for instant in self.iter_instants(self.get_utc(start), end):
+                yield self.from_utc(instant)
+            return
+        tzinfo = start.tzinfo if is_aware(start) else None
+        if end is not None:
+            end = self.get_naive(end, tzinfo)
+        for date, index in self.schedule.iter_days(
+                start.replace(tzinfo=None)):
+            year, month, day = date.year, date.month, date.day
+            times = self.schedule.times[index:]
+            day_tzinfo = self.get_day_tzinfo(
+                datetime.datetime(year, month, day, *times[0]),
+                datetime.datetime(year, month, day, *times[-1]),
+                tzinfo)
+            for hour, minute in times:
+                schedule = datetime.datetime(year, month, day, hour, minute)
+                if end is not None and schedule > end:
+                    return
+                if day_tzinfo is not None:
+                    yield schedule.replace(tzinfo=day_tzinfo)
                 else:
-                    inner.append(int(element))
-            outer.append(inner)
-        self.minutes, self.hours, self.dow, self.months, self.dom = outer
+                    yield self.localize(schedule, tzinfo)
 
-    def get_next_schedule(self, last_schedule=None):
+    def get_day_tzinfo(self, first, last, tzinfo):
         """
-        Returns the next schedule based on the current date as a
-        datetime-object.
+        Returns the tzinfo for all schedules of a day from first to
+        last (naive datetimes). Localizing every schedule is expensive
+        (i.e. with pytz), but the utc-offset changes at most once a
+        day: if it is the same for the first and the last schedule it
+        is the same for the whole day. Returns None if the schedules of
+        the day have to be localized one by one or should stay naive.
         """
-        ls = last_schedule or self.last_schedule
-        next_schedule = self.find_next_schedule(ls)
-        if not self.month_allowed(next_schedule):
-            schedule = self.set_allowed_month(next_schedule)
-            return self.get_next_schedule(schedule)
-        if settings.USE_TZ and not is_aware(next_schedule):
-            next_schedule = make_aware(next_schedule)
-        return next_schedule
+        if tzinfo is not None or not settings.USE_TZ:
+            return tzinfo
+        first = self.localize(first, tzinfo)
+        if first.utcoffset() == self.localize(last, tzinfo).utcoffset():
+            return first.tzinfo
+        return None
+
+    def next_n(self, n, start=None, as_array=False):
+        """
+        Returns a list of the next n schedules after start (defaults
+        to the last_schedule given on init). If as_array is True the
+        schedules are returned as a numpy datetime64 array instead
+        (see get_schedule_array()).
+        """
+        if as_array:
+            return self.get_schedule_array(start=start, n=n)
+        return list(itertools.islice(self.iter_schedules(start), n))
+
+    def get_schedule_array(self, start=None, end=None, n=None):
+        """
+        Returns the schedules after start (defaults to the last_schedule
+        given on init) up to and including end or limited to n
+        schedules as a numpy datetime64 array with minute resolution.
+        At least end or n must be given. As numpy datetimes have no
+        timezone the schedules are the wall-clock times in the timezone
+        of start. If a timezone is set by tz, the schedules are the UTC
+        instants instead (calculated one by one). Requires numpy.
+        """
+        start = start or self.last_schedule
+        if self.tz is not None:
+            import numpy
+            if end is None and n is None:
+                raise ValueError('end or n is required')
+            if end is not None:
+                end = self.get_utc(end)
+            instants = self.iter_instants(self.get_utc(start), end)
+            return numpy.array(
+                list(itertools.islice(instants, n)), dtype='datetime64[m]')
+        tzinfo = start.tzinfo if is_aware(start) else None
+        if end is not None:
+            end = self.get_naive(end, tzinfo)
+        return self.schedule.get_array(
+            start.replace(tzinfo=None), end=end, n=n)
+
+    @staticmethod
+    def localize(schedule, tzinfo):
+        """
+        Returns the naive schedule with the given tzinfo or as aware
+        datetime in the current timezone if tzinfo is None and USE_TZ
+        is set.
+        """
+        if tzinfo is not None:
+            return schedule.replace(tzinfo=tzinfo)
+        if settings.USE_TZ:
+            return make_aware(schedule)
+        return schedule
+
+    @staticmethod
+    def get_naive(schedule, tzinfo):
+        """
+        Returns the schedule as naive datetime in the timezone tzinfo
+        or in the current timezone if tzinfo is None.
+        """
+        if not is_aware(schedule):
+            return schedule
+        if tzinfo is not None:
+            return schedule.astimezone(tzinfo).replace(tzinfo=None)
+        return make_naive(schedule)
 
     def set_allowed_month(self, schedule):
         """
         Modifies the schedule to the first day of the next allowed
         month and returns this new schedule.
         """
-        month = get_next_value(schedule.month, self.months)
+        month = get_next_value(
+            schedule.month, sorted(self.months or range(1, 13)))
         if month > schedule.month:
             year = schedule.year
         else:
@@ -128,75 +497,32 @@ class CronScheduler(object):
         Returns a boolean whether the scheduled month is allowed by the
         crontab data.
         """
-        if not self.months:
-            return True
-        return schedule.month in self.months
+        return self.schedule.month_allowed(schedule.month)
 
     def day_allowed(self, schedule):
         """
         Returns a boolean whether the scheduled day is allowed by the
         crontab data.
         """
-        if not self.dom and not self.dow:
-            # every day is allowed
-            return True
-        if self.dom and schedule.day in self.dom:
-            # day of month is allowed
-            return True
-        weekday = calendar.weekday(schedule.year, schedule.month, schedule.day)
-        if self.dow and weekday in self.dow:
-            # weekday is allowed
-            return True
-        return False
+        return self.schedule.day_allowed(
+            schedule.year, schedule.month, schedule.day)
 
     def hour_allowed(self, schedule):
         """
         Returns a boolean whether the scheduled hour is allowed by the
         crontab data.
         """
-        if not self.hours:
-            return True
-        return schedule.hour in self.hours
+        return self.schedule.hour_allowed(schedule.hour)
 
     def find_next_schedule(self, last_schedule):
         """
         Finds the next allowed day and time according to the crontab
         data. It has to be assumed that last_schedule may not be a valid
         schedule (may be initialized with now()).
-        Returns a datetime-object.
-        """
-        # short cut
-        ls = last_schedule
-        next_minute = self.get_next_minute(ls)
-        if next_minute > ls.minute:
-            # same day, same hour
-            delta = next_minute - ls.minute
-            if self.hour_allowed(ls):
-                return ls + timedelta(minutes=delta)
-        next_hour = self.get_next_hour(ls)
-        if next_hour > ls.hour:
-            # same day
-            if self.day_allowed(ls):
-                delta_hours = next_hour - ls.hour
-                delta_minutes = next_minute - ls.minute
-                return ls + timedelta(hours=delta_hours, minutes=delta_minutes)
-        if not self.dow and not self.dom:
-            # next day
-            schedule = self.get_next_day(ls)
-        elif self.dom and not self.dow:
-            # find next allowed day of month
-            schedule = self.get_next_dom(ls)
-        elif not self.dom and self.dow:
-            # find next allowed weekday
-            schedule = self.get_next_dow(ls)
-        elif self.dom and self.dow:
-            # find first next allowed day of month
-            schedule_dom = self.get_next_dom(ls)
-            schedule_dow = self.get_next_dow(ls)
-            schedule = min(schedule_dom, schedule_dow)
-        return schedule + timedelta(
-            hours=next_hour-ls.hour,
-            minutes=next_minute-ls.minute)
+        Returns a naive datetime-object, calculated by the compiled
+        schedule (see CompiledSchedule.get_next()).
+        """
+        return self.schedule.get_next(last_schedule.replace(tzinfo=None))
 
     def get_next_minute(self, last_schedule):
         """
@@ -204,13 +530,7 @@ class CronScheduler(object):
         last_schedule (a datetime object) and the content of
         self.minutes.
         """
-        if self.minutes:
-            minute = get_next_value(last_schedule.minute, self.minutes)
-        else:
-            minute = last_schedule.minute + 1
-            if minute > 59:
-                minute = 0
-        return minute
+        return get_next_value(last_schedule.minute, self.schedule.minutes)
 
     def get_next_hour(self, last_schedule):
         """
@@ -218,13 +538,7 @@ class CronScheduler(object):
         last_schedule ( a datetime object) and the content of
         self.hours.
         """
-        if self.hours:
-            hour = get_next_value(last_schedule.hour, self.hours)
-        else:
-            hour = last_schedule.hour + 1
-            if hour > 23:
-                hour = 0
-        return hour
+        return get_next_value(last_schedule.hour, self.schedule.hours)
 
     @staticmethod
     def get_next_day(last_schedule):
@@ -240,7 +554,7 @@ class CronScheduler(object):
         datetime-object.
         """
         # method gets not called if self.dom is None or empty
-        next_day = get_next_value(last_schedule.day, self.dom)
+        next_day = get_next_value(last_schedule.day, sorted(self.dom))
         day = last_schedule.day
         if next_day > day:
             delta = next_day - day
@@ -257,7 +571,7 @@ class CronScheduler(object):
         """
         weekday = calendar.weekday(
             last_schedule.year, last_schedule.month, last_schedule.day)
-        next_weekday = get_next_value(weekday, self.dow)
+        next_weekday = get_next_value(weekday, sorted(self.dow))
         if next_weekday > weekday:
             delta = next_weekday - weekday
         else:
@@ -265,12 +579,182 @@ class CronScheduler(object):
         return last_schedule + datetime.timedelta(days=delta)
 
 
+class ScheduleCache(object):
+    """
+    LRU cache of the compiled schedules by crontab-string or by the
+    crontab data given as separate fields, so every crontab gets parsed
+    and compiled just once per process. Thread-safe. Counts the cache
+    hits and misses.
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.schedules = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, crontab=None, fields=None):
+        """
+        Returns a tuple (fields, compiled schedule) for the crontab or
+        for the fields (minutes, hours, dow, months, dom). Raises a
+        ValueError if the crontab could not be parsed.
+        """
+        if crontab:
+            key = ' '.join(crontab.split())
+        else:
+            key = tuple(tuple(values) if values is not None else None
+                        for values in fields)
+        with self.lock:
+            try:
+                # pop and set again to mark as recently used
+                # (OrderedDict.move_to_end is not available with Python 2)
+                entry = self.schedules.pop(key)
+            except KeyError:
+                self.misses += 1
+            else:
+                self.schedules[key] = entry
+                self.hits += 1
+                return entry
+        if crontab:
+            fields = tuple(parse_crontab(crontab))
+        entry = fields, CompiledSchedule(*fields)
+        with self.lock:
+            self.schedules[key] = entry
+            while len(self.schedules) > self.size:
+                self.schedules.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self.lock:
+            self.schedules.clear()
+
+    def get_stats(self):
+        """
+        Returns a dictionary with the number of cache hits, misses and
+        cached schedules.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.schedules),
+        }
+
+
+schedule_cache = ScheduleCache()
+
+
+def parse_crontab(crontab):
+    """
+    Parses a crontab-string with five patterns in this order:
+
+    Minute [0,59]
+    Hour [0,23]
+    Day of the week ([0,6] with 0=Monday or MON-SUN)
+    Month of the year ([1,12] or JAN-DEC)
+    Day of the month [1,31]
+
+    Each of these patterns can be either an asterisk (meaning all
+    valid values), an element, or a list of elements separated by
+    commas. An element shall be either a number (or name) or two
+    numbers separated by a hyphen (meaning an inclusive range). An
+    asterisk, a range or a single number can be followed by a slash
+    and a step: */15 in the minutes means every 15 minutes, 10-50/20
+    the minutes 10, 30 and 50 and 5/20 the minutes 5, 25 and 45.
+    Names are case-insensitive.
+
+    Instead of the patterns one of the macros @yearly (or @annually),
+    @monthly, @weekly (Sunday), @daily (or @midnight) and @hourly can
+    be given.
+
+    Some examples:
+
+    * * * * *               runs every minute
+    5 * * * *               runs five minutes after every full hour
+    */5 * * * *             runs every five minutes
+    30 7 MON-FRI * *        runs at 7:30 on workdays
+    30 7 0 4,7 10-15        runs at 7:30 on mondays and also from the
+                            10th to 15th of a month, but only in april
+                            and july
+
+    Returns a list of the five fields, each of them a sorted list of
+    integers or None for an asterisk. Raises a ValueError if the crontab
+    could not be parsed or has values out of range.
+    """
+    patterns = MACROS.get(crontab.strip().lower(), crontab).split()
+    if len(patterns) != len(FIELDS):
+        raise ValueError(
+            'crontab needs {} patterns: {!r}'.format(len(FIELDS), crontab))
+    return [parse_field(pattern, *field[1:])
+            for pattern, field in zip(patterns, FIELDS)]
+
+
+def parse_field(pattern, low, high, names=None):
+    """
+    Returns the sorted list of the values of a crontab-pattern in the
+    range [low, high] or None for an asterisk. names is a dictionary
+    mapping upper-case names to values.
+    """
+    if pattern == '*':
+        return None
+    values = set()
+    for element in pattern.split(','):
+        mo = ELEMENT_PATTERN.match(element)
+        if not mo:
+            raise ValueError('invalid crontab element: {!r}'.format(element))
+        first, last, step = mo.group('first', 'last', 'step')
+        if first is None:
+            first, last = low, high
+        else:
+            first = parse_value(first, low, high, names)
+            if last is not None:
+                last = parse_value(last, low, high, names)
+            elif step is not None:
+                last = high
+            else:
+                last = first
+        step = int(step) if step is not None else 1
+        if first > last or step < 1:
+            raise ValueError('invalid crontab element: {!r}'.format(element))
+        values.update(range(first, last + 1, step))
+    return sorted(values)
+
+
+def parse_value(value, low, high, names=None):
+    """
+    Returns a single crontab value (a number or a name) as integer.
+    """
+    if value.isdigit():
+        number = int(value)
+    elif names and value.upper() in names:
+        number = names[value.upper()]
+    else:
+        raise ValueError('invalid crontab value: {!r}'.format(value))
+    if not low <= number <= high:
+        raise ValueError('crontab value {} not in range {}-{}'.format(
+            number, low, high))
+    return number
+
+
+def get_mask(values):
+    """Returns an integer with the bits of the given values set."""
+    mask = 0
+    for value in values:
+        mask |= 1 << value
+    return mask
+
+
+def get_days_mask(days):
+    """Returns the bit-mask of the days of a month with days days."""
+    return (1 << (days + 1)) - 2
+
+
 def get_next_value(value, values):
     """
-    Returns the next value from values which is larger then value or the
-    first item from the sequence values.
+    Returns the next value from the sorted sequence values which is
+    larger then value or the first item from values.
     """
-    for item in values:
-        if item > value:
-            return item
+    index = bisect.bisect_right(values, value)
+    if index < len(values):
+        return values[index]
     return values[0]
@@ -0,0 +1,52 @@
+"""
+Transaction level locks for serializing concurrent processes working on
+the same tasks.
+
+On PostgreSQL advisory locks are used, released automatically at the
+end of the transaction. SQLite3 has no locks finer than the whole
+database: write_lock() acquires the write lock of the database instead.
+Locking is a no-op on other databases.
+"""
+
+import zlib
+
+from django.db import connection
+
+
+def get_lock_key(name):
+    """Returns the integer key of the advisory lock for the name."""
+    return zlib.crc32(name.encode('utf-8')) & 0xffffffff
+
+
+def advisory_lock(name, wait=True):
+    """
+    Acquires the lock with the given name for the current transaction.
+    If wait is False the function does not block but returns False if
+    the lock is held by another transaction. Returns True if the lock
+    has been acquired (always on databases other than PostgreSQL).
+    """
+    if connection.vendor != 'postgresql':
+        return True
+    key = get_lock_key(name)
+    with connection.cursor() as cursor:
+        if wait:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [key])
+            return True
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s)', [key])
+        return cursor.fetchone()[0]
+
+
+def write_lock(model):
+    """
+    Acquires the write lock of a SQLite3 database for the current
+    transaction. SQLite3 acquires this lock with the first write, so
+    concurrent transactions may read the same state before and fail
+    on writing. A write without effect to the table of the model
+    serializes the transactions from the start. No-op on other
+    databases.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute('UPDATE {0} SET id = id WHERE 0'.format(table))
@@ -3,11 +3,20 @@ Entry-point for starting the workers.
 """
 
 from django.core.management.base import BaseCommand
+from autotask.models import DEFAULT_QUEUE
 from autotask.worker import start_worker
 
 
 class Command(BaseCommand):
     help = 'starts the autotask workers'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prefork', type=int, default=None,
+            help='number of workers to fork from this process')
+        parser.add_argument(
+            '--queue', default=DEFAULT_QUEUE,
+            help='name of the queue to handle the tasks from')
+
     def handle(self, *args, **options):
-        start_worker()
+        start_worker(prefork=options['prefork'], queue=options['queue'])
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.28 on 2026-10-17 05:53
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+# Partial index for PostgreSQL: workers only look for waiting tasks and
+# the index stays small regardless of the number of done tasks waiting
+# for expiration.
+WAITING_INDEX = 'autotask_waiting_sched_idx'
+
+
+def create_waiting_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX {} ON autotask_taskqueue (scheduled) '
+            'WHERE status = 1'.format(WAITING_INDEX))
+
+
+def drop_waiting_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS {}'.format(WAITING_INDEX))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autotask', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='taskqueue',
+            options={'verbose_name': 'Task', 'verbose_name_plural': 'Tasks'},
+        ),
+        migrations.AddIndex(
+            model_name='taskqueue',
+            index=models.Index(fields=['status', 'scheduled'], name='autotask_status_sched_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskqueue',
+            index=models.Index(fields=['is_periodic', 'expire'], name='autotask_periodic_exp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskqueue',
+            index=models.Index(fields=['module', 'function', 'is_periodic'], name='autotask_mod_func_idx'),
+        ),
+        migrations.RunPython(create_waiting_index, drop_waiting_index),
+    ]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.28 on 2026-10-17 06:11
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+# The partial index for PostgreSQL from 0002_indexes gets replaced by
+# one matching the order of TaskHandler.claim_tasks().
+OLD_WAITING_INDEX = 'autotask_waiting_sched_idx'
+WAITING_INDEX = 'autotask_waiting_prio_idx'
+
+
+def create_waiting_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS {}'.format(OLD_WAITING_INDEX))
+        schema_editor.execute(
+            'CREATE INDEX {} ON autotask_taskqueue '
+            '(priority DESC, scheduled) WHERE status = 1'.format(
+                WAITING_INDEX))
+
+
+def drop_waiting_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS {}'.format(WAITING_INDEX))
+        schema_editor.execute(
+            'CREATE INDEX {} ON autotask_taskqueue (scheduled) '
+            'WHERE status = 1'.format(OLD_WAITING_INDEX))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autotask', '0005_result_ref'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='taskqueue',
+            name='autotask_status_sched_idx',
+        ),
+        migrations.AddField(
+            model_name='taskqueue',
+            name='priority',
+            field=models.IntegerField(default=0, verbose_name='Priority'),
+        ),
+        migrations.AddIndex(
+            model_name='taskqueue',
+            index=models.Index(fields=['status', '-priority', 'scheduled'], name='autotask_status_prio_idx'),
+        ),
+        migrations.RunPython(create_waiting_index, drop_waiting_index),
+    ]
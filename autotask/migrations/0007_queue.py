@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.28 on 2026-10-17 06:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+# The partial index for PostgreSQL from 0006_priority gets replaced by
+# one including the queue.
+OLD_WAITING_INDEX = 'autotask_waiting_prio_idx'
+WAITING_INDEX = 'autotask_waiting_queue_idx'
+
+
+def create_waiting_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS {}'.format(OLD_WAITING_INDEX))
+        schema_editor.execute(
+            'CREATE INDEX {} ON autotask_taskqueue '
+            '(queue, priority DESC, scheduled) WHERE status = 1'.format(
+                WAITING_INDEX))
+
+
+def drop_waiting_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'DROP INDEX IF EXISTS {}'.format(WAITING_INDEX))
+        schema_editor.execute(
+            'CREATE INDEX {} ON autotask_taskqueue '
+            '(priority DESC, scheduled) WHERE status = 1'.format(
+                OLD_WAITING_INDEX))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autotask', '0006_priority'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='taskqueue',
+            name='autotask_status_prio_idx',
+        ),
+        migrations.AddField(
+            model_name='taskqueue',
+            name='queue',
+            field=models.CharField(default='default', max_length=64, verbose_name='Queue'),
+        ),
+        migrations.AddIndex(
+            model_name='taskqueue',
+            index=models.Index(fields=['queue', 'status', '-priority', 'scheduled'], name='autotask_queue_prio_idx'),
+        ),
+        migrations.RunPython(create_waiting_index, drop_waiting_index),
+    ]
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.28 on 2026-10-17 06:14
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autotask', '0007_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskqueue',
+            name='max_concurrency',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Max. concurrency'),
+        ),
+        migrations.AddField(
+            model_name='taskqueue',
+            name='rate_limit',
+            field=models.FloatField(blank=True, null=True, verbose_name='Rate limit'),
+        ),
+        migrations.AddField(
+            model_name='taskqueue',
+            name='started',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='started'),
+        ),
+    ]
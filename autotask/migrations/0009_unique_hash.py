@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.28 on 2026-10-17 06:16
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autotask', '0008_limits'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskqueue',
+            name='unique_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='Unique hash'),
+        ),
+        migrations.AddIndex(
+            model_name='taskqueue',
+            index=models.Index(fields=['unique_hash', 'status'], name='autotask_unique_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 2.2.28 on 2026-10-17 06:28
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('autotask', '0010_batch_size'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskqueue',
+            name='misfire',
+            field=models.CharField(choices=[('run_all', 'run all'), ('run_once', 'run once'), ('skip', 'skip')], default='run_all', max_length=16, verbose_name='Misfire policy'),
+        ),
+        migrations.AddField(
+            model_name='taskqueue',
+            name='misfire_grace',
+            field=models.DurationField(blank=True, null=True, verbose_name='Misfire grace time'),
+        ),
+    ]
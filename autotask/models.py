@@ -13,6 +13,9 @@ DONE = 3
 ERROR = 4
 SUPERVISOR_ACTIVE = 5
 
+# queue of the tasks without an explicit queue
+DEFAULT_QUEUE = 'default'
+
 STATUS_CHOICES = (
     (WAITING, 'waiting'),
     (RUNNING, 'running'),
@@ -20,6 +23,17 @@ STATUS_CHOICES = (
     (ERROR, 'error'),
 )
 
+# misfire policies of periodic tasks
+RUN_ALL = 'run_all'
+RUN_ONCE = 'run_once'
+SKIP = 'skip'
+
+MISFIRE_CHOICES = (
+    (RUN_ALL, 'run all'),
+    (RUN_ONCE, 'run once'),
+    (SKIP, 'skip'),
+)
+
 
 @python_2_unicode_compatible
 class TaskQueue(models.Model):
@@ -65,6 +79,12 @@ class TaskQueue(models.Model):
         _('Result'),
         blank=True)
 
+    # reference to a result in the result store, see autotask.results
+    result_ref = models.CharField(
+        _('Result reference'),
+        max_length=64,
+        blank=True)
+
     ttl = models.DurationField(
         _('time to live'),
         blank=True,
@@ -79,9 +99,94 @@ class TaskQueue(models.Model):
         _('error message'),
         blank=True)
 
+    serializer = models.CharField(
+        _('Serializer'),
+        max_length=16,
+        default='pickle')
+
+    # codecs of the compressed blobs, see autotask.compression
+    compression = models.PositiveSmallIntegerField(
+        _('Compression'),
+        default=0)
+
+    # tasks with higher priority are executed first
+    priority = models.IntegerField(
+        _('Priority'),
+        default=0)
+
+    # name of the queue: workers just handle the tasks of a single queue
+    queue = models.CharField(
+        _('Queue'),
+        max_length=64,
+        default=DEFAULT_QUEUE)
+
+    # limits of the function enforced on claiming the task
+    rate_limit = models.FloatField(
+        _('Rate limit'),
+        blank=True,
+        null=True)
+
+    max_concurrency = models.PositiveIntegerField(
+        _('Max. concurrency'),
+        blank=True,
+        null=True)
+
+    started = models.DateTimeField(
+        _('started'),
+        blank=True,
+        null=True)
+
+    # max. number of tasks of a batch function executed by a single call
+    batch_size = models.PositiveIntegerField(
+        _('Batch size'),
+        blank=True,
+        null=True)
+
+    # handling of runs of periodic tasks started too late
+    misfire = models.CharField(
+        _('Misfire policy'),
+        max_length=16,
+        choices=MISFIRE_CHOICES,
+        default=RUN_ALL)
+
+    misfire_grace = models.DurationField(
+        _('Misfire grace time'),
+        blank=True,
+        null=True)
+
+    # hash of function and arguments for coalescing unique tasks
+    unique_hash = models.CharField(
+        _('Unique hash'),
+        max_length=64,
+        blank=True)
+
+    # set by DelayedTask.wait(): just then the worker sends a
+    # notification on finishing the task
+    has_waiter = models.BooleanField(
+        _('Has waiter'),
+        default=False)
+
     class Meta:
         verbose_name = 'Task'
         verbose_name_plural = 'Tasks'
+        indexes = [
+            # TaskHandler.claim_tasks()
+            models.Index(
+                fields=['queue', 'status', '-priority', 'scheduled'],
+                name='autotask_queue_prio_idx'),
+            # supervisor.clean_queue()
+            models.Index(
+                fields=['is_periodic', 'expire'],
+                name='autotask_periodic_exp_idx'),
+            # delayed_task.save_task()
+            models.Index(
+                fields=['unique_hash', 'status'],
+                name='autotask_unique_idx'),
+            # DecoratorBase.is_registered()
+            models.Index(
+                fields=['module', 'function', 'is_periodic'],
+                name='autotask_mod_func_idx'),
+        ]
 
     def __str__(self):
         task = 'cron' if self.is_periodic else 'task'
@@ -89,6 +194,14 @@ class TaskQueue(models.Model):
         return info
 
     def save(self, **kwargs):
+        self.set_defaults()
+        super(TaskQueue, self).save(**kwargs)
+
+    def set_defaults(self):
+        """
+        Sets defaults for unset values. Called on save() and has to be
+        called before inserting items with bulk_create().
+        """
         if not self.ttl:
             self.ttl = timedelta()
         if not self.timedelta:
@@ -97,4 +210,3 @@ class TaskQueue(models.Model):
         if not self.scheduled:
             # try to avoid zombies
             self.scheduled = now()
-        super(TaskQueue, self).save(**kwargs)
@@ -0,0 +1,358 @@
+"""
+Notifications to wake up idle workers as soon as new tasks are stored.
+
+On PostgreSQL LISTEN/NOTIFY is used. For other databases (like SQLite3)
+the workers listen on unix datagram sockets in a common directory and
+the processes storing tasks send a datagram to every socket found there.
+If neither is available the workers fall back to polling the database
+every AUTOTASK_HANDLE_TASK_IDLE_TIME seconds.
+"""
+
+import errno
+import hashlib
+import os
+import select
+import socket
+import tempfile
+import threading
+import time
+
+from django.db import (
+    connection,
+    transaction,
+)
+
+from .conf import settings
+
+
+CHANNEL = 'autotask'
+# channel for notifications about finished tasks with the pk as payload
+DONE_CHANNEL = 'autotask_done'
+
+# seconds the listener of the DoneWaiters is kept open without waiters
+WAITERS_IDLE_TIME = 60.0
+# max. seconds between the checks of the DoneWaiters thread for idleness
+WAITERS_LISTEN_INTERVAL = 1.0
+
+
+def notify(channel=CHANNEL, payload=''):
+    """
+    Sends a notification on the given channel after the current
+    transaction has been committed, so a woken up worker will find the
+    stored task.
+    """
+    if settings.AUTOTASK_USE_NOTIFY:
+        transaction.on_commit(lambda: send_notification(channel, payload))
+
+
+def send_notification(channel=CHANNEL, payload=''):
+    """Sends a notification immediately."""
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [channel, payload])
+    elif hasattr(socket, 'AF_UNIX'):
+        send_datagrams(channel, payload)
+
+
+def get_socket_dir():
+    """
+    Returns the directory for the sockets of the listeners. The default
+    directory is unique for the database used, so different projects
+    running on the same host don't wake up each other.
+    """
+    socket_dir = settings.AUTOTASK_NOTIFY_DIR
+    if not socket_dir:
+        name = str(connection.settings_dict['NAME']).encode('utf-8')
+        ident = hashlib.md5(name).hexdigest()[:12]
+        socket_dir = os.path.join(
+            tempfile.gettempdir(), 'autotask-{}'.format(ident))
+    return socket_dir
+
+
+def send_datagrams(channel, payload=''):
+    """
+    Sends a datagram with the payload to every socket listening on the
+    given channel.
+    Sockets without a listener are left over from terminated processes
+    and get removed.
+    """
+    socket_dir = get_socket_dir()
+    try:
+        names = os.listdir(socket_dir)
+    except OSError:
+        # no listeners
+        return
+    prefix = channel + '-'
+    data = payload.encode('utf-8')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    try:
+        for name in names:
+            if not name.startswith(prefix):
+                continue
+            path = os.path.join(socket_dir, name)
+            try:
+                sock.sendto(data, path)
+            except socket.error as err:
+                if err.errno in (errno.ECONNREFUSED, errno.ENOENT):
+                    remove_file(path)
+                # on a full buffer the listener has pending
+                # notifications anyway.
+    finally:
+        sock.close()
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class Listener(object):
+    """
+    Waits for notifications on a channel.
+
+    Usage:
+
+    listener = Listener.create()
+    if listener:
+        payloads = listener.wait(timeout)
+
+    Instances are created by Listener.create() from the subclasses for
+    the different transports. These provide fileno() for select(),
+    drain() returning the payloads of all pending notifications and
+    close().
+    """
+
+    def __init__(self, channel=CHANNEL):
+        self.channel = channel
+
+    @classmethod
+    def create(cls, channel=CHANNEL):
+        """
+        Returns a listener suitable for the database in use or None if
+        notifications are not available or disabled.
+        """
+        if not settings.AUTOTASK_USE_NOTIFY:
+            return None
+        if connection.vendor == 'postgresql':
+            return PostgreSQLListener(channel)
+        if hasattr(socket, 'AF_UNIX'):
+            return SocketListener(channel)
+        return None
+
+    def wait(self, timeout):
+        """
+        Waits at most timeout seconds for notifications. Returns a list
+        with the payloads of the received notifications, which is empty
+        if no notification has been received.
+        """
+        payloads = self.drain()
+        if payloads:
+            return payloads
+        try:
+            readable, _, _ = select.select([self.fileno()], [], [], timeout)
+        except (OSError, select.error):
+            # interrupted by a signal (Python 2)
+            return []
+        if readable:
+            return self.drain()
+        return []
+
+
+class PostgreSQLListener(Listener):
+    """
+    Listener using a separate database-connection in autocommit mode
+    for LISTEN.
+    """
+
+    def __init__(self, channel=CHANNEL):
+        super(PostgreSQLListener, self).__init__(channel)
+        params = connection.get_connection_params()
+        self.connection = connection.get_new_connection(params)
+        self.connection.autocommit = True
+        cursor = self.connection.cursor()
+        cursor.execute('LISTEN "{}"'.format(channel))
+        cursor.close()
+
+    def fileno(self):
+        return self.connection.fileno()
+
+    def drain(self):
+        self.connection.poll()
+        payloads = [notify.payload for notify in self.connection.notifies]
+        del self.connection.notifies[:]
+        return payloads
+
+    def close(self):
+        self.connection.close()
+
+
+class SocketListener(Listener):
+    """
+    Listener bound to a unix datagram socket.
+    """
+
+    def __init__(self, channel=CHANNEL):
+        super(SocketListener, self).__init__(channel)
+        socket_dir = get_socket_dir()
+        try:
+            os.makedirs(socket_dir)
+        except OSError:
+            # already existing
+            pass
+        name = '{}-{}-{}.sock'.format(channel, os.getpid(), id(self))
+        self.path = os.path.join(socket_dir, name)
+        remove_file(self.path)
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.socket.bind(self.path)
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def drain(self):
+        payloads = []
+        while True:
+            try:
+                data = self.socket.recv(256)
+            except socket.error:
+                # nothing more to read
+                break
+            payloads.append(data.decode('utf-8'))
+        return payloads
+
+    def close(self):
+        self.socket.close()
+        remove_file(self.path)
+
+
+class Broadcaster(object):
+    """
+    Shares a single listener between many threads: one thread calls
+    listen() and all threads blocking in wait() get woken up on a
+    notification. Has the same wait() interface as a Listener.
+    Every waiting thread has its own count of seen notifications, so a
+    notification received while the thread was not waiting (i.e. while
+    claiming tasks) is not lost but returned by its next wait().
+    """
+
+    def __init__(self, listener):
+        self.listener = listener
+        self.condition = threading.Condition()
+        self.notifications = 0
+        self.seen = threading.local()
+
+    def listen(self, timeout):
+        """
+        Waits at most timeout seconds for a notification and wakes up
+        the waiting threads.
+        """
+        if self.listener.wait(timeout):
+            with self.condition:
+                self.notifications += 1
+                self.condition.notify_all()
+
+    def wait(self, timeout):
+        """
+        Waits at most timeout seconds for a notification not yet seen
+        by the calling thread. Returns a boolean whether there has been
+        a notification.
+        """
+        with self.condition:
+            seen = getattr(self.seen, 'notifications', 0)
+            if self.notifications == seen:
+                self.condition.wait(timeout)
+            self.seen.notifications = self.notifications
+            return self.notifications != seen
+
+    def close(self):
+        self.listener.close()
+
+
+class DoneWaiters(object):
+    """
+    Process-wide listener on the DONE_CHANNEL shared by all threads
+    waiting for tasks (see DelayedTask.wait()), so a process opens a
+    single connection for LISTEN regardless of the number of waiters.
+    A daemon thread serves the listener and sets the events registered
+    for the pks of the finished tasks. It terminates after
+    WAITERS_IDLE_TIME seconds without waiters.
+    """
+
+    def __init__(self, channel=DONE_CHANNEL):
+        self.channel = channel
+        self.lock = threading.Lock()
+        # payload: set of events
+        self.events = {}
+        self.listener = None
+        self.thread = None
+
+    def register(self, payload):
+        """
+        Returns an event which gets set on a notification with the
+        given payload or None if notifications are not available. The
+        listener is started on demand.
+        """
+        with self.lock:
+            if self.listener is None:
+                self.listener = Listener.create(self.channel)
+                if self.listener is None:
+                    return None
+                self.thread = threading.Thread(
+                    target=self.listen, args=(self.listener,))
+                self.thread.daemon = True
+                self.thread.start()
+            event = threading.Event()
+            self.events.setdefault(payload, set()).add(event)
+            return event
+
+    def unregister(self, payload, event):
+        with self.lock:
+            events = self.events.get(payload)
+            if events:
+                events.discard(event)
+                if not events:
+                    del self.events[payload]
+
+    def listen(self, listener):
+        idle_since = time.time()
+        try:
+            while True:
+                payloads = listener.wait(WAITERS_LISTEN_INTERVAL)
+                with self.lock:
+                    if self.listener is not listener:
+                        # closed
+                        break
+                    for payload in payloads:
+                        for event in self.events.get(payload, ()):
+                            event.set()
+                    if self.events:
+                        idle_since = time.time()
+                    elif time.time() - idle_since > WAITERS_IDLE_TIME:
+                        self.listener = self.thread = None
+                        break
+        except Exception:
+            # i.e. a lost database connection: wake up all waiters, so
+            # they register again with a new listener.
+            with self.lock:
+                if self.listener is listener:
+                    self.listener = self.thread = None
+                for events in self.events.values():
+                    for event in events:
+                        event.set()
+                self.events.clear()
+        finally:
+            listener.close()
+
+    def close(self):
+        """Stops the thread and closes the listener."""
+        with self.lock:
+            thread = self.thread
+            self.listener = self.thread = None
+        if thread is not None:
+            thread.join()
+
+
+done_waiters = DoneWaiters()
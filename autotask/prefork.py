@@ -0,0 +1,153 @@
+"""
+Prefork worker pool: a master process imports django and the modules
+of all known tasks once and forks the workers afterwards. The forked
+workers share the memory of the master (copy-on-write) and restarting a
+terminated worker takes just a fork instead of starting a new
+interpreter.
+
+Requires an operating system supporting os.fork().
+"""
+
+import errno
+import importlib
+import os
+import signal
+import traceback
+
+from django.db import connections
+
+from .conf import settings
+from .models import (
+    DEFAULT_QUEUE,
+    TaskQueue,
+)
+from .worker import TaskHandler
+
+
+# time in seconds between checks for terminated workers
+MONITOR_INTERVAL = 0.1
+
+
+class PreforkMaster(object):
+    """
+    Forks and monitors the worker processes for a queue.
+    """
+
+    def __init__(self, exit_event, workers, queue=DEFAULT_QUEUE):
+        self.exit_event = exit_event
+        self.workers = workers
+        self.queue = queue
+        self.children = set()  # pids of the forked workers
+
+    def run(self):
+        """
+        Main loop of the master process. Returns after the exit_event
+        is set and all workers have terminated.
+        """
+        self.preload()
+        for n in range(self.workers):
+            self.start_child()
+        while True:
+            if self.exit_event.wait(timeout=MONITOR_INTERVAL):
+                break
+            self.check_children()
+        self.stop_children()
+
+    def get_task_modules(self):
+        """
+        Returns the names of the modules defining the tasks stored in
+        the queue and the modules given by AUTOTASK_PRELOAD_MODULES.
+        """
+        modules = set(settings.AUTOTASK_PRELOAD_MODULES)
+        qs = TaskQueue.objects.filter(queue=self.queue)
+        qs = qs.values_list('module', flat=True).distinct()
+        modules.update(qs)
+        return sorted(modules)
+
+    def preload(self):
+        """
+        Imports the task modules in the master so the workers will
+        inherit them. The database connections get closed because they
+        can't be shared with the forked processes.
+        """
+        for module in self.get_task_modules():
+            try:
+                importlib.import_module(module)
+            except Exception:
+                # the worker will report the error on executing the task
+                pass
+        connections.close_all()
+
+    def start_child(self):
+        """Forks a new worker and returns its pid."""
+        pid = os.fork()
+        if pid == 0:
+            run_child(self.exit_event, self.queue)
+        self.children.add(pid)
+        return pid
+
+    def check_children(self):
+        """Replaces terminated workers by new ones."""
+        for pid in self.reap_children():
+            self.start_child()
+
+    def reap_children(self):
+        """
+        Returns a list with the pids of the terminated workers.
+        Does not block.
+        """
+        terminated = []
+        for pid in list(self.children):
+            try:
+                result, _ = os.waitpid(pid, os.WNOHANG)
+            except OSError as err:
+                if err.errno != errno.ECHILD:
+                    raise
+                result = pid
+            if result == pid:
+                self.children.discard(pid)
+                terminated.append(pid)
+        return terminated
+
+    def stop_children(self):
+        """Terminates all workers and waits for them."""
+        for pid in self.children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                # already terminated
+                pass
+        for pid in self.children:
+            try:
+                os.waitpid(pid, 0)
+            except OSError:
+                pass
+        self.children = set()
+
+
+def run_child(exit_event, queue=DEFAULT_QUEUE):
+    """
+    Entry point of a forked worker. Never returns.
+    The worker inherits the signal-handlers of the master setting the
+    (inherited copy of the) exit_event. So a signal received right
+    after the fork does not get lost.
+    """
+    exit_code = 0
+    try:
+        TaskHandler(exit_event, queue=queue).run()
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        connections.close_all()
+        # don't run cleanup-handlers inherited from the master:
+        os._exit(exit_code)
+
+
+def run_prefork(exit_event, workers, queue=DEFAULT_QUEUE):
+    """
+    Runs a PreforkMaster with the given number of workers for the queue
+    until the exit_event is set.
+    """
+    master = PreforkMaster(exit_event, workers, queue)
+    master.run()
@@ -0,0 +1,75 @@
+"""
+Registry of the decorated functions, also used as cache for resolving
+the callables of the tasks by module- and function-name.
+"""
+
+import importlib
+
+
+class Registry(object):
+    """
+    Maps (module name, function name) to the callable. Decorated
+    functions get registered when the decorators run, other callables
+    are cached on first resolution. Counts the cache hits and misses.
+    """
+
+    def __init__(self):
+        self.functions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def register(self, module_name, function_name, function):
+        self.functions[(module_name, function_name)] = function
+
+    def resolve(self, module_name, function_name):
+        """
+        Returns the callable for the given names. Raises ImportError or
+        AttributeError if the callable can't be found. In this case
+        nothing gets cached and the import-system caches are
+        invalidated, so a later call may find a newly installed module.
+        """
+        key = (module_name, function_name)
+        try:
+            function = self.functions[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            return function
+        self.misses += 1
+        try:
+            module = importlib.import_module(module_name)
+            function = getattr(module, function_name)
+        except (ImportError, AttributeError):
+            self.invalidate(module_name, function_name)
+            raise
+        self.functions[key] = function
+        return function
+
+    def invalidate(self, module_name=None, function_name=None):
+        """
+        Removes the callable for the given names from the cache. Without
+        arguments the cache gets cleared.
+        """
+        if module_name is None:
+            self.functions.clear()
+        else:
+            self.functions.pop((module_name, function_name), None)
+        # not available with Python 2:
+        invalidate_caches = getattr(importlib, 'invalidate_caches', None)
+        if invalidate_caches:
+            invalidate_caches()
+
+    def get_stats(self):
+        """
+        Returns a dictionary with the number of cache hits, misses and
+        cached callables.
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self.functions),
+        }
+
+
+registry = Registry()
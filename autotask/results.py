@@ -0,0 +1,111 @@
+"""
+Storage for large results outside of the database.
+
+Results with at least AUTOTASK_RESULT_STORE_THRESHOLD bytes (after
+serialization and compression) are written to a file in
+AUTOTASK_RESULT_STORE_DIR and the task just holds a reference to this
+file. Files are written once and read by memory-mapping.
+"""
+
+import contextlib
+import hashlib
+import mmap
+import os
+import tempfile
+import uuid
+
+from django.db import connection
+
+from .conf import settings
+
+
+class FileSystemResultStore(object):
+    """
+    Stores results as files in a directory. The references are the
+    file-names. Files are distributed to subdirectories by the first two
+    characters of their names to keep the directories small.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def get_path(self, ref):
+        return os.path.join(self.directory, ref[:2], ref)
+
+    def put(self, data):
+        """Writes the data to a new file and returns the reference."""
+        ref = uuid.uuid4().hex
+        path = self.get_path(ref)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            # already existing
+            pass
+        # write to a temporary file first, so a reader never sees
+        # incomplete data:
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+        return ref
+
+    @contextlib.contextmanager
+    def open(self, ref):
+        """
+        Context manager returning the data for the reference as a
+        read-only memory-map (or an empty bytes object for empty files).
+        Raises IOError/OSError if the file does not exist.
+        """
+        with open(self.get_path(ref), 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                # empty files can't get mapped
+                yield b''
+                return
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                yield data
+            finally:
+                data.close()
+
+    def delete(self, ref):
+        try:
+            os.remove(self.get_path(ref))
+        except OSError:
+            # already deleted
+            pass
+
+
+def get_result_store():
+    """
+    Returns the result store for AUTOTASK_RESULT_STORE_DIR. The default
+    directory is unique for the database used.
+    """
+    directory = settings.AUTOTASK_RESULT_STORE_DIR
+    if not directory:
+        name = str(connection.settings_dict['NAME']).encode('utf-8')
+        ident = hashlib.md5(name).hexdigest()[:12]
+        directory = os.path.join(
+            tempfile.gettempdir(), 'autotask-results-{}'.format(ident))
+    return FileSystemResultStore(directory)
+
+
+def use_result_store(data):
+    """
+    Returns a boolean whether the data is large enough to get stored
+    in the result store.
+    """
+    threshold = settings.AUTOTASK_RESULT_STORE_THRESHOLD
+    return threshold is not None and len(data) >= threshold
+
+
+def delete_results(queryset):
+    """
+    Deletes the stored results of the tasks in the queryset. Has to be
+    called before deleting the tasks.
+    """
+    refs = queryset.exclude(result_ref='').values_list(
+        'result_ref', flat=True)
+    store = None
+    for ref in refs:
+        store = store or get_result_store()
+        store.delete(ref)
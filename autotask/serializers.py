@@ -0,0 +1,106 @@
+"""
+Serializers for the arguments, results and cron data of the tasks.
+
+The serializer to use for new tasks is set by AUTOTASK_SERIALIZER. The
+name of the serializer is stored with every task, so tasks stored with
+different serializers can get decoded.
+"""
+
+import json
+import pickle
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .conf import settings
+
+
+PICKLE = 'pickle'
+JSON = 'json'
+MSGPACK = 'msgpack'
+
+
+class PickleSerializer(object):
+    """
+    Serializes every picklable object. Uses the highest protocol
+    available.
+    """
+    name = PICKLE
+
+    @staticmethod
+    def dumps(obj):
+        return pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def loads(data):
+        return pickle.loads(data)
+
+
+class JSONSerializer(object):
+    """
+    Compact JSON. Restricted to the types supported by JSON: tuples are
+    decoded as lists and dictionary-keys as strings.
+    """
+    name = JSON
+
+    @staticmethod
+    def dumps(obj):
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def loads(data):
+        return json.loads(bytes(data).decode('utf-8'))
+
+
+class MsgpackSerializer(object):
+    """
+    Binary and more compact than JSON with the same restrictions.
+    Requires the msgpack package.
+    """
+    name = MSGPACK
+
+    @staticmethod
+    def dumps(obj):
+        import msgpack
+        return msgpack.packb(obj, use_bin_type=True)
+
+    @staticmethod
+    def loads(data):
+        import msgpack
+        return msgpack.unpackb(bytes(data), raw=False)
+
+
+SERIALIZERS = {
+    serializer.name: serializer for serializer in (
+        PickleSerializer,
+        JSONSerializer,
+        MsgpackSerializer,
+    )
+}
+
+
+def get_serializer(name=None):
+    """
+    Returns the serializer with the given name or the serializer set by
+    AUTOTASK_SERIALIZER if name is None.
+    """
+    name = name or settings.AUTOTASK_SERIALIZER
+    try:
+        return SERIALIZERS[name]
+    except KeyError:
+        raise ImproperlyConfigured(
+            'unknown autotask serializer: {}'.format(name))
+
+
+def dumps(obj, name=None):
+    """Returns obj serialized by the serializer with the given name."""
+    return get_serializer(name).dumps(obj)
+
+
+def loads(data, name=None):
+    """
+    Returns the object deserialized by the serializer with the given
+    name. Returns None for empty data (i.e. a task without a result).
+    """
+    if not data:
+        return None
+    return get_serializer(name).loads(data)
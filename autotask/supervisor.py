@@ -1,3 +1,4 @@
+import datetime
 import os
 import subprocess
 import threading
@@ -7,14 +8,23 @@ from django.db import (
     transaction,
     connections,
 )
+from django.db.models import (
+    F,
+    Max,
+)
 from django.conf import settings as django_settings
 from django.utils.timezone import now
 
 from .conf import settings
 from .models import (
+    DEFAULT_QUEUE,
+    WAITING,
+    RUNNING,
     SUPERVISOR_ACTIVE,
     TaskQueue,
 )
+from .notify import notify
+from .results import delete_results
 from .shutdown import get_shutdown_objects
 
 
@@ -22,11 +32,17 @@ class Supervisor(object):
     """
     Manages the workers: start, restart and stop.
     The supervisor runs in a separate thread.
+    Starts the given number of workers for every queue from the queues
+    dictionary (defaults to AUTOTASK_QUEUES). Without queues the
+    workers handle the default queue.
     """
-    def __init__(self, workers=settings.AUTOTASK_WORKERS):
+    def __init__(self, workers=settings.AUTOTASK_WORKERS, queues=None):
         self.timeout = settings.AUTOTASK_WORKER_MONITOR_INTERVALL
-        self.workers = workers  # number of workers to start
+        # number of workers to start per queue:
+        self.queues = (queues or settings.AUTOTASK_QUEUES or
+                       {DEFAULT_QUEUE: workers})
         self.processes = []
+        self.process_queues = {}  # the queues of the processes
 
     def __call__(self, exit_event):
         self.start_workers()
@@ -38,13 +54,29 @@ class Supervisor(object):
         exit_thread()
 
     def start_workers(self):
-        self.processes = [self.start_worker() for n in range(self.workers)]
+        self.processes = []
+        for queue, workers in sorted(self.queues.items()):
+            if self.prefork:
+                # a single master process per queue forks the workers
+                self.processes.append(self.start_worker(queue))
+            else:
+                self.processes.extend(self.start_worker(queue)
+                                      for n in range(workers))
 
-    def start_worker(self):
+    @property
+    def prefork(self):
+        return (settings.AUTOTASK_WORKER_MODE == 'prefork' and
+                hasattr(os, 'fork'))
+
+    def start_worker(self, queue=DEFAULT_QUEUE):
+        args = [settings.AUTOTASK_WORKER_EXECUTABLE,
+                'manage.py', 'run_autotask', '--queue', queue]
+        if self.prefork:
+            args.extend(['--prefork', str(self.queues[queue])])
         # use of Popen for Python 2 compatibility
-        return subprocess.Popen([settings.AUTOTASK_WORKER_EXECUTABLE,
-                                'manage.py', 'run_autotask'],
-                                 cwd=django_settings.BASE_DIR)
+        process = subprocess.Popen(args, cwd=django_settings.BASE_DIR)
+        self.process_queues[process] = queue
+        return process
 
     def check_workers(self):
         """
@@ -55,7 +87,8 @@ class Supervisor(object):
                              if process.poll() is not None]
         for process in missing_processes:
             self.processes.remove(process)
-            self.processes.append(self.start_worker())
+            queue = self.process_queues.pop(process)
+            self.processes.append(self.start_worker(queue))
 
     def stop_workers(self):
         """terminate all registered workers."""
@@ -67,6 +100,7 @@ class Supervisor(object):
                 # restarted without unregistering the previous process
                 pass
         self.processes = []
+        self.process_queues = {}
 
 
 def clean_queue_periodically(exit_event):
@@ -75,6 +109,7 @@ def clean_queue_periodically(exit_event):
         if exit_event.wait(settings.AUTOTASK_CLEAN_INTERVALL):
             break
         clean_queue()
+        reclaim_tasks()
     exit_thread()
 
 
@@ -83,9 +118,71 @@ def clean_queue():
     with transaction.atomic():
         qs = TaskQueue.objects.filter(is_periodic=False, expire__lt=now())
         if qs.count():
+            delete_results(qs)
             qs.delete()
 
 
+def reclaim_tasks():
+    """
+    Sets the tasks RUNNING for longer than AUTOTASK_RECLAIM_TIMEOUT
+    seconds back to WAITING. These are left behind by workers killed
+    without a graceful shutdown (i.e. by SIGKILL or an out-of-memory
+    kill), including all tasks claimed by AUTOTASK_CLAIM_BATCH_SIZE but
+    not yet executed. Reclaimed tasks run again, so the timeout must be
+    longer than the runtime of the longest task. Returns the number of
+    reclaimed tasks.
+    """
+    timeout = settings.AUTOTASK_RECLAIM_TIMEOUT
+    if not timeout:
+        return 0
+    threshold = now() - datetime.timedelta(seconds=timeout)
+    reclaimed = TaskQueue.objects.filter(
+        status=RUNNING, started__lt=threshold).update(status=WAITING)
+    if reclaimed:
+        notify()
+    return reclaimed
+
+
+def age_tasks_periodically(exit_event):
+    """Call age_tasks() periodically in a separate thread."""
+    while True:
+        if exit_event.wait(settings.AUTOTASK_PRIORITY_AGING):
+            break
+        age_tasks()
+    exit_thread()
+
+
+def age_tasks():
+    """
+    Raises the priority of delayed tasks waiting longer than
+    AUTOTASK_PRIORITY_AGING seconds after their schedule by one, up to
+    AUTOTASK_PRIORITY_AGING_LIMIT. Called every AUTOTASK_PRIORITY_AGING
+    seconds, so the priority of a task increases with its waiting time
+    and low priority tasks don't starve under load.
+    Without a limit the priority is raised up to the highest priority
+    of the waiting tasks in the same queue: an aged task gets executed
+    before the younger tasks with this priority.
+    """
+    threshold = now() - datetime.timedelta(
+        seconds=settings.AUTOTASK_PRIORITY_AGING)
+    qs = TaskQueue.objects.filter(
+        status=WAITING,
+        is_periodic=False,
+        scheduled__lt=threshold,
+    )
+    limit = settings.AUTOTASK_PRIORITY_AGING_LIMIT
+    if limit is not None:
+        qs.filter(priority__lt=limit).update(priority=F('priority') + 1)
+        return
+    limits = TaskQueue.objects.filter(status=WAITING).values(
+        'queue').annotate(limit=Max('priority')).order_by()
+    for values in limits:
+        qs.filter(
+            queue=values['queue'],
+            priority__lt=values['limit'],
+        ).update(priority=F('priority') + 1)
+
+
 def delete_periodic_tasks():
     """
     Tasks are persistent in the db. Periodic tasks are read in at
@@ -94,6 +191,7 @@ def delete_periodic_tasks():
     """
     qs = TaskQueue.objects.filter(is_periodic=True)
     if qs.count():
+        delete_results(qs)
         qs.delete()
 
 
@@ -151,7 +249,10 @@ def start_supervisor():
         # marker already set, supervisor may be running in another process
         return None
     handler, exit_event = get_shutdown_objects()
-    for service in (Supervisor(), clean_queue_periodically):
+    services = [Supervisor(), clean_queue_periodically]
+    if settings.AUTOTASK_PRIORITY_AGING:
+        services.append(age_tasks_periodically)
+    for service in services:
         thread = threading.Thread(target=service, args=(exit_event,))
         thread.start()
     # returning the ShutdownHandler can be ignored by the application
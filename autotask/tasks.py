@@ -2,19 +2,90 @@
 Function-Decorators for async task-execution by a worker.
 """
 
-import importlib
-import pickle
+import functools
+import hashlib
+import itertools
+import sys
+import time
 from datetime import timedelta
 
+from django.db import (
+    connection,
+    transaction,
+)
+from django.db.models import Max
 from django.utils.timezone import now
 
+from . import (
+    compression,
+    serializers,
+)
 from .conf import settings
 from .cron import CronScheduler
+from .locks import (
+    advisory_lock,
+    write_lock,
+)
 from .models import (
+    DEFAULT_QUEUE,
+    MISFIRE_CHOICES,
+    RUN_ALL,
+    WAITING,
     DONE,
     ERROR,
     TaskQueue,
 )
+from .notify import (
+    done_waiters,
+    notify,
+)
+from .registry import registry
+from .results import get_result_store
+from .timezones import get_timezone_name
+
+
+# max. number of pks in a single IN query
+FETCH_CHUNK_SIZE = 500
+
+# min. and max. delay in seconds between polls in DelayedTask.wait()
+# (without notifications)
+WAIT_MIN_DELAY = 0.01
+WAIT_MAX_DELAY = 1.0
+
+
+class TaskTimeoutError(Exception):
+    """Raised by DelayedTask.get() if the task is not ready in time."""
+
+
+def is_ready(status, is_periodic):
+    if is_periodic:
+        return None
+    return status == DONE or status == ERROR
+
+
+# fields needed by load_result()
+RESULT_FIELDS = ('result', 'result_ref', 'serializer', 'compression')
+
+
+def load_result(values):
+    """
+    Returns the deserialized result from a dictionary with the
+    RESULT_FIELDS of a task. Returns None for an empty result or a
+    result missing in the result store.
+    """
+    if values['result_ref']:
+        try:
+            with get_result_store().open(values['result_ref']) as data:
+                return decode_result(data, values)
+        except (IOError, OSError):
+            return None
+    return decode_result(values['result'], values)
+
+
+def decode_result(data, values):
+    codec = compression.get_codec(values['compression'], compression.RESULT)
+    data = compression.decompress(data, codec)
+    return serializers.loads(data, values['serializer'])
 
 
 class DelayedTask(object):
@@ -26,11 +97,30 @@ class DelayedTask(object):
         # pk of TaskQueue item in db
         self.pk = pk
 
-    def _get_task(self):
-        try:
-            return TaskQueue.objects.get(pk=self.pk)
-        except TaskQueue.DoesNotExist:
-            return None
+    def _get_values(self, *fields):
+        """
+        Returns a dictionary with the given fields of the task or None
+        if the task does not exist. Just the requested columns are
+        read from the database.
+        """
+        return TaskQueue.objects.filter(pk=self.pk).values(*fields).first()
+
+    @classmethod
+    def fetch_many(cls, pks, *fields):
+        """
+        Returns a dictionary with the pks as keys and dictionaries with
+        the given fields (default: status) as values. Lost tasks are
+        missing. Reads the values with a single query per
+        FETCH_CHUNK_SIZE pks.
+        """
+        fields = fields or ('status',)
+        pks = list(pks)
+        values = {}
+        for n in range(0, len(pks), FETCH_CHUNK_SIZE):
+            qs = TaskQueue.objects.filter(pk__in=pks[n:n+FETCH_CHUNK_SIZE])
+            for item in qs.values('pk', *fields):
+                values[item.pop('pk')] = item
+        return values
 
     @property
     def ready(self):
@@ -39,9 +129,9 @@ class DelayedTask(object):
         In case of None the task is lost and no informations are
         available.
         """
-        task = self._get_task()
-        if task and not task.is_periodic:
-            return task.status == DONE or task.status == ERROR
+        values = self._get_values('status', 'is_periodic')
+        if values:
+            return is_ready(values['status'], values['is_periodic'])
         return None
 
     @property
@@ -49,9 +139,9 @@ class DelayedTask(object):
         """
         Returns the processing status.
         """
-        task = self._get_task()
-        if task:
-            return task.status
+        values = self._get_values('status')
+        if values:
+            return values['status']
         return None
 
     @property
@@ -59,13 +149,9 @@ class DelayedTask(object):
         """
         Returns the result of the task.
         """
-        task = self._get_task()
-        if task:
-            try:
-                return pickle.loads(task.result)
-            except EOFError:
-                # if task.result is None this exception will raised
-                pass
+        values = self._get_values(*RESULT_FIELDS)
+        if values:
+            return load_result(values)
         return None
 
     @property
@@ -74,11 +160,181 @@ class DelayedTask(object):
         Returns the error-message as string. If no error has occured
         returns an empty string.
         """
-        task = self._get_task()
-        if task:
-            return task.error_message
+        values = self._get_values('error_message')
+        if values:
+            return values['error_message']
         return ''
 
+    def wait(self, timeout=None):
+        """
+        Blocks until the task is ready, but at most timeout seconds (or
+        forever if timeout is None). Returns the value of ready: True,
+        False on timeout or None for a lost task.
+        The waiting threads of a process share a single listener for
+        the notifications sent by the worker on finishing a task with a
+        waiter (see DoneWaiters). Just if notifications are not
+        available (or within a transaction, which would hide the waiter
+        from the worker) the status is polled with an exponential
+        backoff.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        delay = WAIT_MIN_DELAY
+        payload = str(self.pk)
+        event = register_waiter(self.pk)
+        try:
+            while True:
+                ready = self.ready
+                if ready is not False:
+                    return ready
+                if deadline is None:
+                    wait = None
+                else:
+                    wait = deadline - time.time()
+                    if wait <= 0:
+                        return False
+                if event is None:
+                    time.sleep(delay if wait is None else min(delay, wait))
+                    delay = min(delay * 2, WAIT_MAX_DELAY)
+                elif event.is_set():
+                    # woken up, but not ready: the listener has failed
+                    done_waiters.unregister(payload, event)
+                    event = register_waiter(self.pk)
+                else:
+                    event.wait(wait)
+        finally:
+            if event is not None:
+                done_waiters.unregister(payload, event)
+
+    def get(self, timeout=None):
+        """
+        Waits for the task like wait() and returns the result. Raises
+        TaskTimeoutError if the task is not ready after timeout seconds.
+        """
+        if self.wait(timeout) is False:
+            raise TaskTimeoutError(
+                'task {} not ready after {} seconds'.format(self.pk, timeout))
+        return self.result
+
+
+def register_waiter(pk):
+    """
+    Registers the calling thread as waiter for the task with the given
+    pk and flags the task, so the worker sends a notification on
+    finishing it. Returns the event set by the notification or None if
+    the status has to be polled.
+    """
+    if connection.in_atomic_block:
+        return None
+    event = done_waiters.register(str(pk))
+    if event is not None:
+        TaskQueue.objects.filter(pk=pk).update(has_waiter=True)
+    return event
+
+
+class TaskGroup(object):
+    """
+    Gives access to a group of delayed functions. The attributes are
+    the same as for DelayedTask but return lists with the values of all
+    tasks in the group, read from the database with a single query
+    (per chunk of FETCH_CHUNK_SIZE tasks).
+    """
+
+    def __init__(self, pks):
+        # pks of TaskQueue items in db
+        self.pks = list(pks)
+
+    def __len__(self):
+        return len(self.pks)
+
+    def __iter__(self):
+        return (DelayedTask(pk) for pk in self.pks)
+
+    def __getitem__(self, index):
+        return DelayedTask(self.pks[index])
+
+    def _get_values(self, field, default=None):
+        """
+        Returns a list with the values of the field for all tasks in the
+        group. Lost tasks have the value default.
+        """
+        values = DelayedTask.fetch_many(self.pks, field)
+        return [values[pk][field] if pk in values else default
+                for pk in self.pks]
+
+    @property
+    def ready(self):
+        """
+        Returns True if all tasks are ready, otherwise False.
+        Lost tasks are counted as ready.
+        """
+        return all(status in (None, DONE, ERROR) for status in self.status)
+
+    @property
+    def status(self):
+        """
+        Returns a list with the processing status of every task (None
+        for lost tasks).
+        """
+        return self._get_values('status')
+
+    @property
+    def result(self):
+        """
+        Returns a list with the results of the tasks.
+        """
+        values = DelayedTask.fetch_many(self.pks, *RESULT_FIELDS)
+        return [load_result(values[pk]) if pk in values else None
+                for pk in self.pks]
+
+    @property
+    def error_message(self):
+        """
+        Returns a list with the error-messages of the tasks.
+        """
+        return self._get_values('error_message', '')
+
+
+def insert_tasks(tasks):
+    """
+    Inserts the TaskQueue items and returns their pks. Uses a bulk
+    insert if the database returns the pks of the inserted rows.
+    """
+    features = connection.features
+    if (getattr(features, 'can_return_rows_from_bulk_insert', False) or
+            getattr(features, 'can_return_ids_from_bulk_insert', False)):
+        tasks = TaskQueue.objects.bulk_create(tasks)
+    else:
+        for task in tasks:
+            task.save()
+    return [task.pk for task in tasks]
+
+
+def get_limits(rate_limit, max_concurrency):
+    """
+    Returns the validated tuple (rate_limit, max_concurrency). Raises a
+    ValueError for a limit which is not positive: None means no limit.
+    """
+    if rate_limit is not None and not rate_limit > 0:
+        raise ValueError(
+            'rate_limit must be positive or None: {!r}'.format(rate_limit))
+    if max_concurrency is not None and not max_concurrency >= 1:
+        raise ValueError(
+            'max_concurrency must be at least 1 or None: {!r}'.format(
+                max_concurrency))
+    return rate_limit, max_concurrency
+
+
+def get_misfire_grace(misfire, grace):
+    """
+    Returns the grace time in seconds as timedelta or None. Raises a
+    ValueError for an unknown misfire policy.
+    """
+    if misfire not in dict(MISFIRE_CHOICES):
+        raise ValueError('unknown misfire policy: {!r}'.format(misfire))
+    if grace is None:
+        return None
+    return timedelta(seconds=grace)
+
 
 class DecoratorBase(object):
     """
@@ -91,10 +347,12 @@ class DecoratorBase(object):
             # don't wrapp on inactive autotask
             return function
         self.module_name = function.__module__
-        module = importlib.import_module(function.__module__)
+        # the decorated module is already imported:
+        module = sys.modules[self.module_name]
         self.function_name = self.template.format(function.__name__)
         setattr(module, self.function_name, function)
-        if not self.function_name.endswith('_delayed'):
+        registry.register(self.module_name, self.function_name, function)
+        if not self.function_name.endswith(('_delayed', '_batch')):
             # a periodic task will never get called from the application
             # so the wrapper has to be called here:
             self.wrapper()
@@ -106,18 +364,51 @@ class DecoratorBase(object):
         wrapped function and return a DelayedTask objects for accessing
         status-informations and optional results.
         """
-        tq = TaskQueue()
-        tq.arguments = pickle.dumps((args, kwargs))
-        tq.module = self.module_name
-        tq.function = self.function_name
-        tq = self.configure(tq)
+        tq = self.build_task(args, kwargs)
         if tq.is_periodic:
             if self.is_registered(tq):
                 return None
-        tq.save()
-        dt = DelayedTask(tq.pk)
+        pk, created = self.save_task(tq)
+        if created:
+            notify()
+        dt = DelayedTask(pk)
         return dt
 
+    def save_task(self, tq):
+        """
+        Saves the task. Returns a tuple (pk, created) with created as
+        a boolean whether a new task has been stored.
+        """
+        tq.save()
+        return tq.pk, True
+
+    def build_task(self, args, kwargs):
+        """
+        Returns a new, not yet saved, TaskQueue item for calling the
+        wrapped function with the given arguments.
+        """
+        tq = TaskQueue()
+        tq.serializer = settings.AUTOTASK_SERIALIZER
+        arguments = serializers.dumps((args, kwargs), tq.serializer)
+        tq.arguments, codec = compression.compress(arguments)
+        tq.compression = compression.set_codec(
+            tq.compression, compression.ARGUMENTS, codec)
+        tq.module = self.module_name
+        tq.function = self.function_name
+        tq.queue = self.queue
+        tq.unique_hash = self.get_unique_hash(tq, args, kwargs, arguments)
+        tq = self.configure(tq)
+        tq.set_defaults()
+        return tq
+
+    def get_unique_hash(self, tq, args, kwargs, arguments):
+        """
+        Returns the hash identifying calls to coalesce or an empty
+        string for tasks which are not unique. arguments are the
+        serialized args and kwargs.
+        """
+        return ''
+
     def is_registered(self, tq):
         """
         Returns a boolean whether a task is allready saved in the
@@ -125,14 +416,10 @@ class DecoratorBase(object):
         once at startup what will happen if the django-project is
         running with more than one process.
         """
-        try:
-            TaskQueue.objects.get(
-                module=tq.module,
-                function=tq.function,
-                is_periodic=tq.is_periodic)
-        except TaskQueue.DoesNotExist:
-            return False
-        return True
+        return TaskQueue.objects.filter(
+            module=tq.module,
+            function=tq.function,
+            is_periodic=tq.is_periodic).exists()
 
 
 class delayed_task(DecoratorBase):  # noqa
@@ -143,6 +430,20 @@ class delayed_task(DecoratorBase):  # noqa
     :retries: on error try to rerun the tasks n times
     :ttl: time to live: after processing the task will stay at least n
     seconds in the database i.e. for accessing the result.
+    :priority: due tasks with higher priority are processed first
+    :queue: name of the queue, see AUTOTASK_QUEUES
+    :rate_limit: max. number of tasks per second started by all workers
+    :max_concurrency: max. number of tasks running at the same time
+    :unique: a call is coalesced with a waiting task of the function
+    called with the same arguments and returns the DelayedTask of the
+    waiting task.
+    :unique_key: callable returning the key for coalescing calls instead
+    of the arguments. Gets called with the arguments of the call.
+    :debounce: a call coalesced with a waiting task postpones the task
+    to n seconds after the call and replaces the arguments. So a burst
+    of calls results in a single run after the burst has ended.
+    :throttle: the task runs at most once every n seconds. Calls during
+    this period are coalesced into a single run at the end of the period.
 
         @delayed_task(optional arguments)
         def long_runner(*args, **kwargs)
@@ -150,21 +451,190 @@ class delayed_task(DecoratorBase):  # noqa
         dt = long_runner()
 
     The returned object dt is of type DelayedTask
+
+    Many calls can be added to the queue at once:
+
+        group = long_runner.map([(1, 2), (3, 4)])
+
+    The returned object group is of type TaskGroup
     """
-    def __init__(self, delay=0, retries=0, ttl=300):
+    def __init__(self, delay=0, retries=0, ttl=300, priority=0,
+                 queue=DEFAULT_QUEUE, rate_limit=None, max_concurrency=None,
+                 unique=False, unique_key=None, debounce=None, throttle=None):
+        self.queue = queue
+        self.rate_limit, self.max_concurrency = get_limits(
+            rate_limit, max_concurrency)
+        self.unique = bool(unique or unique_key is not None or
+                           debounce or throttle)
+        self.unique_key = unique_key
+        self.debounce = timedelta(seconds=debounce or 0)
+        self.throttle = timedelta(seconds=throttle or 0)
         self.ttl = timedelta(seconds=ttl)
         self.delay = timedelta(seconds=delay)
         self.retries = retries
+        self.priority = priority
         self.template = '{}_delayed'
 
+    def __call__(self, function):
+        wrapper = super(delayed_task, self).__call__(function)
+        if wrapper is function:
+            # autotask is not active
+            return function
+
+        @functools.wraps(function)
+        def delayed(*args, **kwargs):
+            return self.wrapper(*args, **kwargs)
+
+        delayed.map = self.map
+        delayed.bulk_enqueue = self.bulk_enqueue
+        return delayed
+
+    def map(self, iterable, chunk_size=None):
+        """
+        Adds a task for every tuple of positional arguments from
+        iterable. Returns a TaskGroup.
+        """
+        calls = ((args, {}) for args in iterable)
+        return self.bulk_enqueue(calls, chunk_size)
+
+    def bulk_enqueue(self, calls, chunk_size=None):
+        """
+        Adds a task for every (args, kwargs) tuple from calls. The tasks
+        are inserted in chunks of chunk_size items (defaults to
+        AUTOTASK_BULK_CHUNK_SIZE) in a single transaction.
+        Returns a TaskGroup.
+        """
+        chunk_size = chunk_size or settings.AUTOTASK_BULK_CHUNK_SIZE
+        calls = iter(calls)
+        pks = []
+        with transaction.atomic():
+            while True:
+                chunk = [self.build_task(args, kwargs) for args, kwargs
+                         in itertools.islice(calls, chunk_size)]
+                if not chunk:
+                    break
+                if self.unique:
+                    pks.extend(self.save_task(tq)[0] for tq in chunk)
+                else:
+                    pks.extend(insert_tasks(chunk))
+        if pks:
+            notify()
+        return TaskGroup(pks)
+
+    def get_unique_hash(self, tq, args, kwargs, arguments):
+        if not self.unique:
+            return ''
+        if self.unique_key:
+            key = self.unique_key(*args, **kwargs)
+            arguments = serializers.dumps(key, tq.serializer)
+        digest = hashlib.sha256()
+        for data in (tq.module, tq.function):
+            digest.update(data.encode('utf-8'))
+            digest.update(b'\0')
+        digest.update(arguments)
+        return digest.hexdigest()
+
+    def save_task(self, tq):
+        """
+        Unique tasks are coalesced with a waiting task with the same
+        hash: the waiting task is returned instead of storing a new one.
+        A debounced waiting task gets the schedule and arguments of the
+        new one. A new throttled task is scheduled at least the throttle
+        period after the start of the previous task. The previous task is
+        stored at least for this period, so the window doesn't depend on
+        the ttl.
+        """
+        if not tq.unique_hash:
+            return super(delayed_task, self).save_task(tq)
+        with transaction.atomic():
+            # serializes concurrent calls with the same hash (all calls
+            # on SQLite3, best-effort on other databases):
+            advisory_lock('unique.{}'.format(tq.unique_hash))
+            write_lock(TaskQueue)
+            qs = TaskQueue.objects.filter(
+                unique_hash=tq.unique_hash, status=WAITING)
+            pk = qs.values_list('pk', flat=True).first()
+            if pk is not None:
+                if not self.debounce:
+                    return pk, False
+                # a task claimed in the meantime is not updated:
+                if qs.filter(pk=pk).update(
+                        scheduled=tq.scheduled,
+                        arguments=tq.arguments,
+                        serializer=tq.serializer,
+                        compression=tq.compression):
+                    return pk, False
+            if self.throttle:
+                qs = TaskQueue.objects.filter(unique_hash=tq.unique_hash)
+                started = qs.aggregate(Max('started'))['started__max']
+                if started:
+                    tq.scheduled = max(tq.scheduled, started + self.throttle)
+            tq.save()
+        return tq.pk, True
+
     def configure(self, tq):
-        tq.scheduled = now() + self.delay
+        tq.scheduled = now() + self.delay + self.debounce
         tq.retries = self.retries
-        tq.ttl = self.ttl
+        # the start of a throttled task is needed for the throttle
+        # period, whatever the ttl:
+        tq.ttl = max(self.ttl, self.throttle)
+        tq.priority = self.priority
+        tq.rate_limit = self.rate_limit
+        tq.max_concurrency = self.max_concurrency
         tq.is_periodic = False
         return tq
 
 
+class batch_task(delayed_task):  # noqa
+    """
+    Decorator for a function handling many calls at once. The calls are
+    stored like the calls of a @delayed_task, but a worker calls the
+    function with a list of the argument tuples of up to max_size
+    waiting calls. The function has to return a sequence with a result
+    for every item of the list (or None). Calls take positional
+    arguments only.
+    :max_size: max. number of calls handled by a single invocation
+    :max_wait: calls wait up to n seconds for further calls to get
+    handled together
+    All other arguments of @delayed_task except delay are accepted.
+
+        @batch_task(max_size=100, max_wait=1)
+        def send_notifications(items):
+            return [send(user, text) for user, text in items]
+
+        dt = send_notifications(user, text)
+
+    The returned object dt is of type DelayedTask
+    """
+    def __init__(self, max_size=100, max_wait=1, **kwargs):
+        super(batch_task, self).__init__(delay=max_wait, **kwargs)
+        self.max_size = max_size
+        self.template = '{}_batch'
+
+    def __call__(self, function):
+        wrapper = super(batch_task, self).__call__(function)
+        if wrapper is not function:
+            return wrapper
+
+        # autotask is not active: call the function with a single item
+        @functools.wraps(function)
+        def call(*args):
+            results = function([args])
+            return None if results is None else list(results)[0]
+
+        return call
+
+    def build_task(self, args, kwargs):
+        if kwargs:
+            raise TypeError('batch tasks take positional arguments only')
+        return super(batch_task, self).build_task(args, kwargs)
+
+    def configure(self, tq):
+        tq = super(batch_task, self).configure(tq)
+        tq.batch_size = self.max_size
+        return tq
+
+
 class periodic_task(DecoratorBase):  # noqa
     """
     Decorator for a periodic task running every given number of seconds
@@ -177,17 +647,32 @@ class periodic_task(DecoratorBase):  # noqa
     Default period is 3600 seconds. If start_now is True the task will
     run as soon as possible and then periodically. Id start_now is False
     the task will be delayed by the given period before running
-    periodically.
+    periodically. The task gets executed by the workers of the given
+    queue.
+
+    misfire sets the handling of runs started too late, i.e. after the
+    workers have been down or busy:
+    'run_all' (the default) runs all missed runs, 'run_once' runs a
+    missed run once and continues with the next schedule after now and
+    'skip' drops missed runs. grace is the time in seconds a run may
+    start late before it counts as missed. If grace is None a run is
+    missed if the following run is also due.
     """
-    def __init__(self, seconds=3600, start_now=False):
+    def __init__(self, seconds=3600, start_now=False, queue=DEFAULT_QUEUE,
+                 misfire=RUN_ALL, grace=None):
+        self.queue = queue
         self.timedelta = timedelta(seconds=seconds)
         self.delay = timedelta() if start_now else self.timedelta
+        self.misfire_grace = get_misfire_grace(misfire, grace)
+        self.misfire = misfire
         self.template = '{}_periodic'
 
     def configure(self, tq):
         tq.scheduled = now() + self.delay
         tq.timedelta = self.timedelta
         tq.is_periodic = True
+        tq.misfire = self.misfire
+        tq.misfire_grace = self.misfire_grace
         return tq
 
 
@@ -220,6 +705,8 @@ class cron_task(DecoratorBase):  # noqa
     of a month when a task should run. [4, 15] will run at the 4th and
     15th of every month. If None the task will run every day.
 
+    queue: name of the queue of the workers executing the task.
+
 
     Some examples:
 
@@ -245,15 +732,36 @@ class cron_task(DecoratorBase):  # noqa
     as @periodic_task(seconds=60).
 
     Instead of the separate arguments also a crontab with five patterns
-    can be given (pattern order: minutes, hours, day of month, months,
-    day of week):
+    can be given (pattern order: minutes, hours, day of week, months,
+    day of month), see autotask.cron.parse_crontab() for the syntax:
     * * * * *       runs every minute (same as @periodic_task(seconds=60))
-    30 7 * * 0,2    runs at 7:30 every Monday and Wednesday.
+    30 7 0,2 * *    runs at 7:30 every Monday and Wednesday.
+    */15 * MON-FRI * *  runs every 15 minutes on workdays.
+    @daily          runs every day at midnight.
+
+    The arguments misfire and grace set the handling of runs started
+    too late, like for @periodic_task.
+
+    tz is the name of the timezone (like 'Europe/Berlin') or a named
+    tzinfo (i.e. of zoneinfo) the schedule refers to. The schedules are
+    calculated by the wall-clock time of this timezone and are correct
+    across daylight saving time changes: a local time skipped at the
+    start of daylight saving time runs shifted by the gap (2:30 runs at
+    3:30), a repeated local time at the end runs just once. Defaults to
+    None for UTC (with USE_TZ).
 
     """
     def __init__(self, minutes=None, hours=None,
                  dow=None, months=None, dom=None,
-                 crontab=None):
+                 crontab=None, queue=DEFAULT_QUEUE,
+                 misfire=RUN_ALL, grace=None, tz=None):
+        if tz is not None:
+            # fail early on unknown timezones, store the name as a
+            # tzinfo can't be serialized:
+            tz = get_timezone_name(tz)
+        self.queue = queue
+        self.misfire_grace = get_misfire_grace(misfire, grace)
+        self.misfire = misfire
         self.template = '{}_cron'
         self.cron_data = {
             'minutes': minutes,
@@ -261,12 +769,15 @@ class cron_task(DecoratorBase):  # noqa
             'dow': dow,
             'months': months,
             'dom': dom,
-            'crontab': crontab
+            'crontab': crontab,
+            'tz': tz,
         }
 
     def configure(self, tq):
         cs = CronScheduler(**self.cron_data)
         tq.scheduled = cs.get_next_schedule()
-        tq.cron_data = pickle.dumps(self.cron_data)
+        tq.cron_data = serializers.dumps(self.cron_data, tq.serializer)
         tq.is_periodic = True
+        tq.misfire = self.misfire
+        tq.misfire_grace = self.misfire_grace
         return tq
@@ -0,0 +1,102 @@
+"""
+Benchmark for the calculation of cron schedules over thousands of
+random crontabs. Not collected by default, run explicitly with:
+
+    pytest autotask/test/bench_cron.py -s
+"""
+
+import datetime
+import random
+import time
+
+from django.utils.timezone import (
+    make_aware,
+    utc,
+)
+
+from autotask.cron import CronScheduler
+
+
+CRONTABS = 5000
+SCHEDULES = 20  # consecutive schedules per crontab
+
+
+def random_field(rnd, low, high):
+    if rnd.random() < 0.5:
+        return '*'
+    values = rnd.sample(range(low, high + 1), rnd.randint(1, 4))
+    return ','.join(str(value) for value in sorted(values))
+
+
+def random_crontab(rnd):
+    # order of the fields: minutes hours dow months dom
+    return ' '.join((
+        random_field(rnd, 0, 59),
+        random_field(rnd, 0, 23),
+        random_field(rnd, 0, 6),
+        random_field(rnd, 1, 12),
+        random_field(rnd, 1, 28),
+    ))
+
+
+def test_cron_schedules():
+    rnd = random.Random(1)
+    crontabs = [random_crontab(rnd) for _ in range(CRONTABS)]
+    start = time.time()
+    schedulers = [CronScheduler(crontab=crontab) for crontab in crontabs]
+    compile_time = (time.time() - start) / CRONTABS * 1e6
+    last_schedule = datetime.datetime(2016, 4, 26, 8, 30)
+    start = time.time()
+    for cs in schedulers:
+        schedule = last_schedule
+        for _ in range(SCHEDULES):
+            schedule = cs.schedule.get_next(schedule)
+    next_time = (time.time() - start) / (CRONTABS * SCHEDULES) * 1e6
+    print('\n{} crontabs: compile {:.1f} us, next schedule {:.1f} us'.format(
+        CRONTABS, compile_time, next_time))
+
+
+def test_cron_series():
+    # one year of schedules every minute during working hours
+    cs = CronScheduler(crontab='* 8-17 0-4 * *')
+    start = datetime.datetime(2016, 1, 1)
+    end = datetime.datetime(2017, 1, 1)
+    begin = time.time()
+    schedule, count = start, 0
+    while True:
+        schedule = cs.get_next_schedule(schedule)
+        if schedule.replace(tzinfo=None) > end:
+            break
+        count += 1
+    single_time = time.time() - begin
+    begin = time.time()
+    schedules = list(cs.iter_schedules(start, end))
+    iter_time = time.time() - begin
+    print('\n{} schedules: get_next_schedule {:.2f} s, '
+          'iter_schedules {:.2f} s'.format(count, single_time, iter_time))
+    try:
+        import numpy  # noqa
+    except ImportError:
+        return
+    begin = time.time()
+    schedules = cs.get_schedule_array(start, end)
+    print('{} schedules: get_schedule_array {:.3f} s'.format(
+        len(schedules), time.time() - begin))
+
+
+def test_zone_schedules():
+    # one year of schedules every 15 minutes, local time and UTC
+    start = make_aware(datetime.datetime(2021, 1, 1), utc)
+    end = make_aware(datetime.datetime(2022, 1, 1), utc)
+    for tz in (None, 'America/New_York', 'Australia/Lord_Howe'):
+        cs = CronScheduler(crontab='*/15 * * * *', tz=tz)
+        begin = time.time()
+        schedule, count = start, 0
+        while True:
+            schedule = cs.get_next_schedule(schedule)
+            if schedule > end:
+                break
+            count += 1
+        duration = time.time() - begin
+        print('\n{}: {} schedules, {:.1f} us per schedule'.format(
+            tz or 'UTC', count, duration / count * 1e6))
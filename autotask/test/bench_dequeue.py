@@ -0,0 +1,65 @@
+"""
+Benchmark for the dequeue latency depending on the number of done tasks
+in the queue. Not collected by default, run explicitly with:
+
+    pytest autotask/test/bench_dequeue.py -s
+
+The latency should stay (nearly) flat with a growing number of rows.
+"""
+
+import datetime
+import time
+
+import pytest
+
+from django.db import connection
+from django.utils.timezone import now
+
+from autotask.models import (
+    DONE,
+    WAITING,
+    TaskQueue,
+)
+from autotask.supervisor import clean_queue
+from autotask.tasks import DecoratorBase
+from autotask.worker import TaskHandler
+
+
+ROUNDS = 200
+
+
+def fill_queue(num, status):
+    timestamp = now()
+    expire = timestamp + datetime.timedelta(hours=1)
+    tasks = [TaskQueue(scheduled=timestamp,
+                       module='bench',
+                       function='func_{}_delayed'.format(n % 50),
+                       status=status,
+                       expire=expire,
+                       ttl=datetime.timedelta(),
+                       timedelta=datetime.timedelta())
+             for n in range(num)]
+    TaskQueue.objects.bulk_create(tasks, batch_size=500)
+
+
+def measure(func, rounds=ROUNDS):
+    start = time.time()
+    for _ in range(rounds):
+        func()
+    return (time.time() - start) / rounds * 1000
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('done_tasks', [0, 10000, 100000])
+def test_dequeue_latency(done_tasks):
+    fill_queue(done_tasks, DONE)
+    fill_queue(ROUNDS, WAITING)
+    th = TaskHandler()
+    claim = measure(th.get_next_task)
+    clean = measure(clean_queue, rounds=20)
+    tq = TaskQueue(module='bench', function='lookup_periodic',
+                   is_periodic=False)
+    lookup = measure(lambda: DecoratorBase.is_registered(None, tq))
+    print('\n{}: {:>7} done tasks: claim {:.3f} ms, clean_queue {:.3f} '
+          'ms, is_registered {:.3f} ms'.format(
+              connection.vendor, done_tasks, claim, clean, lookup))
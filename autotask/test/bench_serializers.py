@@ -0,0 +1,51 @@
+"""
+Benchmark comparing the size and the encode/decode-time of the
+serializers. Not collected by default, run explicitly with:
+
+    pytest autotask/test/bench_serializers.py -s
+"""
+
+import time
+
+import pytest
+
+from autotask import serializers
+
+
+ROUNDS = 2000
+
+PAYLOADS = {
+    'small': ((1, 'abc'), {'flag': True}),
+    'records': (([{'id': n, 'name': 'name-{}'.format(n), 'score': n * 0.5,
+                   'tags': ['a', 'b']} for n in range(200)],), {}),
+    'text': (('lorem ipsum dolor sit amet ' * 2000,), {}),
+}
+
+
+def available_serializers():
+    names = [serializers.PICKLE, serializers.JSON]
+    try:
+        import msgpack  # noqa
+    except ImportError:
+        pass
+    else:
+        names.append(serializers.MSGPACK)
+    return names
+
+
+@pytest.mark.parametrize('payload', sorted(PAYLOADS))
+def test_serializers(payload):
+    obj = PAYLOADS[payload]
+    print('\n{}:'.format(payload))
+    for name in available_serializers():
+        serializer = serializers.get_serializer(name)
+        start = time.time()
+        for _ in range(ROUNDS):
+            data = serializer.dumps(obj)
+        encode = (time.time() - start) / ROUNDS * 1e6
+        start = time.time()
+        for _ in range(ROUNDS):
+            serializer.loads(data)
+        decode = (time.time() - start) / ROUNDS * 1e6
+        print('  {:<8} {:>8} bytes  encode {:>9.1f} us  decode {:>9.1f} '
+              'us'.format(name, len(data), encode, decode))
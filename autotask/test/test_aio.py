@@ -0,0 +1,160 @@
+import asyncio
+import datetime
+import threading
+import time
+
+import pytest
+
+from django.utils.timezone import now
+
+from autotask.conf import settings
+settings.AUTOTASK_IS_ACTIVE = True
+
+from autotask.aio import run_event_loop
+from autotask.models import (
+    DONE,
+    ERROR,
+    TaskQueue,
+)
+from autotask.tasks import (
+    batch_task,
+    delayed_task,
+    periodic_task,
+)
+from autotask.worker import TaskHandler
+
+
+@delayed_task()
+async def sleeper(n):
+    await asyncio.sleep(0.3)
+    return n
+
+
+@delayed_task()
+async def failing():
+    raise ValueError('failed')
+
+
+@delayed_task()
+def sync_add(a, b):
+    return a + b
+
+
+@batch_task(max_size=3, max_wait=0)
+async def batch_double(items):
+    await asyncio.sleep(0.01)
+    return [n * 2 for n, in items]
+
+
+def run_worker(results, concurrency):
+    """Runs the asyncio worker until all tasks are ready."""
+    exit_event = threading.Event()
+    worker = threading.Thread(
+        target=run_event_loop, args=(exit_event, concurrency))
+    start = time.time()
+    worker.start()
+    try:
+        for _ in range(200):
+            if all(r.ready for r in results):
+                break
+            time.sleep(0.02)
+        duration = time.time() - start
+    finally:
+        exit_event.set()
+        worker.join()
+    return duration
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_coroutines():
+    """Coroutines are running concurrently."""
+    results = [sleeper(n) for n in range(10)]
+    duration = run_worker(results, concurrency=10)
+    assert [r.result for r in results] == list(range(10))
+    # sequential execution would take at least 3 seconds
+    assert duration < 2
+
+
+@pytest.mark.django_db(transaction=True)
+def test_mixed_tasks():
+    """Errors and synchronous functions are handled as well."""
+    results = [failing(), sync_add(2, 3), sleeper(1)]
+    run_worker(results, concurrency=2)
+    assert [r.status for r in results] == [ERROR, DONE, DONE]
+    assert results[1].result == 5
+    assert results[2].result == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_batch_coroutine():
+    """Batch functions get awaited with the items of a batch."""
+    results = [batch_double(n) for n in range(4)]
+    run_worker(results, concurrency=2)
+    assert [r.result for r in results] == [0, 2, 4, 6]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_skipped_periodic_task():
+    """A skipped run does not block the concurrency slot."""
+    calls = []
+
+    @periodic_task(seconds=3600, misfire='skip')
+    async def skipped():
+        calls.append(1)
+
+    scheduled = now() - datetime.timedelta(hours=3, minutes=30)
+    TaskQueue.objects.filter(is_periodic=True).update(scheduled=scheduled)
+    r = sync_add(1, 2)
+    run_worker([r], concurrency=1)
+    assert r.result == 3
+    assert calls == []
+    task = TaskQueue.objects.get(is_periodic=True)
+    assert task.scheduled == scheduled + datetime.timedelta(hours=4)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_store_result_in_executor(monkeypatch):
+    """Results are serialized and stored outside of the event loop."""
+    threads = []
+    store_result = TaskHandler.store_result
+
+    def recording_store_result(task, result):
+        threads.append(threading.current_thread())
+        store_result(task, result)
+
+    monkeypatch.setattr(
+        TaskHandler, 'store_result', staticmethod(recording_store_result))
+    r = sleeper(1)
+    run_worker([r], concurrency=1)
+    assert r.result == 1
+    # a thread of the executor, not the thread of the event loop:
+    assert threads[0].name.startswith('ThreadPoolExecutor')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_worker_error(monkeypatch, caplog):
+    """
+    Tasks are set to ERROR if the worker fails to finish them and the
+    concurrency slot is released.
+    """
+    def broken_finish_task(self, task, error=None):
+        raise RuntimeError('broken')
+
+    monkeypatch.setattr(TaskHandler, 'finish_task', broken_finish_task)
+    results = [sync_add(1, 2), sync_add(3, 4)]
+    run_worker(results, concurrency=1)
+    for r in results:
+        assert r.status == ERROR
+        assert r.error_message == 'broken'
+    assert 'handling of' in caplog.text
+
+
+@pytest.mark.django_db
+def test_coroutine_in_synchronous_worker():
+    """The TaskHandler runs coroutines to completion."""
+    r = sleeper(3)
+    th = TaskHandler()
+    task = th.get_next_task()
+    th.handle_task(task)
+    assert r.status == DONE
+    assert r.result == 3
@@ -0,0 +1,80 @@
+import os
+
+import pytest
+
+from autotask import compression
+from autotask.conf import settings
+settings.AUTOTASK_IS_ACTIVE = True
+
+from autotask.models import TaskQueue
+from autotask.tasks import delayed_task
+from autotask.worker import TaskHandler
+
+
+@delayed_task()
+def repeat(text, n):
+    return text * n
+
+
+@pytest.mark.parametrize(
+    'flags, blob, codec, result', [
+        (0, compression.ARGUMENTS, compression.ZLIB, 1),
+        (0, compression.RESULT, compression.LZMA, 8),
+        (1, compression.RESULT, compression.LZMA, 9),
+        (9, compression.ARGUMENTS, compression.NONE, 8),
+        (9, compression.RESULT, compression.ZLIB, 5),
+    ])
+def test_codec_flags(flags, blob, codec, result):
+    flags = compression.set_codec(flags, blob, codec)
+    assert flags == result
+    assert compression.get_codec(flags, blob) == codec
+
+
+@pytest.mark.parametrize('name', ['zlib', 'lzma'])
+def test_compress(monkeypatch, name):
+    monkeypatch.setattr(settings, 'AUTOTASK_COMPRESSION', name)
+    data = b'x' * 2000
+    compressed, codec = compression.compress(data)
+    assert codec == compression.CODECS[name]
+    assert len(compressed) < len(data)
+    assert compression.decompress(compressed, codec) == data
+
+
+@pytest.mark.parametrize(
+    'name, data', [
+        (None, b'x' * 2000),  # compression disabled
+        ('zlib', b'x' * 100),  # below threshold
+        ('zlib', os.urandom(1500)),  # not compressible
+    ], ids=['disabled', 'below-threshold', 'random'])
+def test_not_compressed(monkeypatch, name, data):
+    monkeypatch.setattr(settings, 'AUTOTASK_COMPRESSION', name)
+    assert compression.compress(data) == (data, compression.NONE)
+
+
+def test_stats(monkeypatch):
+    monkeypatch.setattr(settings, 'AUTOTASK_COMPRESSION', 'zlib')
+    compression.stats.reset()
+    compression.compress(b'x' * 2000)
+    compression.compress(os.urandom(1500))
+    stats = compression.stats.get_stats()
+    assert stats['compressed'] == 1
+    assert stats['uncompressed'] == 1
+    assert stats['bytes_in'] == 2000
+    assert 0 < stats['ratio'] < 0.1
+
+
+@pytest.mark.django_db
+def test_compressed_task(monkeypatch):
+    """Large arguments and results get stored compressed."""
+    monkeypatch.setattr(settings, 'AUTOTASK_COMPRESSION', 'zlib')
+    r = repeat('abc' * 1000, 10)
+    task = TaskQueue.objects.get()
+    assert task.compression == compression.ZLIB
+    assert len(task.arguments) < 1000
+    th = TaskHandler()
+    th.handle_task(th.get_next_task())
+    task = TaskQueue.objects.get()
+    assert compression.get_codec(
+        task.compression, compression.RESULT) == compression.ZLIB
+    assert len(task.result) < 1000
+    assert r.result == 'abc' * 10000
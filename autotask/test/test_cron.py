@@ -1,13 +1,19 @@
 
 import datetime
 from datetime import datetime as dt
+import random
+
 import pytest
 
 from django.conf import settings
-from django.utils.timezone import make_aware
+from django.utils.timezone import (
+    make_aware,
+    utc,
+)
 
 from autotask.cron import (
     CronScheduler,
+    ScheduleCache,
     get_next_value,
 )
 
@@ -98,6 +104,18 @@ def test_get_next_dom(crontab, last_schedule, result):
     assert result == cs.get_next_dom(last_schedule)
 
 
+@pytest.mark.parametrize(
+    'crontab, last_schedule, result', [
+        ('0 0 * * 3', dt(2016, 4, 1), dt(2016, 4, 3)),
+        ('0 0 * * 3', dt(2016, 4, 3), dt(2016, 5, 3)),
+        ('0 0 * * 3,20', dt(2016, 4, 3), dt(2016, 4, 20)),
+        ('0 0 * * 3,20', dt(2016, 4, 20), dt(2016, 5, 3)),
+    ])
+def test_next_dom(crontab, last_schedule, result):
+    cs = CronScheduler(crontab=crontab)
+    assert result == cs.schedule.get_next(last_schedule)
+
+
 @pytest.mark.parametrize(
     'crontab, last_schedule, result', [
         ('* * 0 * *', dt(2016, 3, 1), dt(2016, 3, 7)),
@@ -113,6 +131,21 @@ def test_get_next_dow(crontab, last_schedule, result):
     assert result == cs.get_next_dow(last_schedule)
 
 
+@pytest.mark.parametrize(
+    'crontab, last_schedule, result', [
+        ('0 0 0 * *', dt(2016, 3, 1), dt(2016, 3, 7)),
+        ('0 0 0 * *', dt(2016, 3, 7), dt(2016, 3, 14)),
+        ('0 0 0 * *', dt(2016, 3, 28), dt(2016, 4, 4)),
+        ('0 0 0 * *', dt(2016, 2, 22), dt(2016, 2, 29)),  # leap year
+        ('0 0 2,4 * *', dt(2016, 4, 1), dt(2016, 4, 6)),
+        ('0 0 2,4 * *', dt(2016, 4, 6), dt(2016, 4, 8)),
+        ('0 0 2,4 * *', dt(2016, 4, 8), dt(2016, 4, 13)),
+    ])
+def test_next_dow(crontab, last_schedule, result):
+    cs = CronScheduler(crontab=crontab)
+    assert result == cs.schedule.get_next(last_schedule)
+
+
 @pytest.mark.parametrize(
     'crontab, schedule, result', [
         ('* * * * *', dt(2016, 4, 26), True),
@@ -157,6 +190,19 @@ def test_set_allowed_month(crontab, schedule, result):
     assert result == cs.set_allowed_month(schedule)
 
 
+@pytest.mark.parametrize(
+    'crontab, schedule, result', [
+        ('0 0 * 5 *', dt(2016, 4, 26), dt(2016, 5, 1)),
+        ('0 0 * 4 *', dt(2016, 5, 26), dt(2017, 4, 1)),
+        ('0 0 * 3-5 *', dt(2016, 2, 26), dt(2016, 3, 1)),
+        ('0 0 * 3-5 *', dt(2016, 5, 31, 23, 59), dt(2017, 3, 1)),
+        ('0 0 * 3-5 *', dt(2016, 6, 26), dt(2017, 3, 1)),
+    ])
+def test_next_month(crontab, schedule, result):
+    cs = CronScheduler(crontab=crontab)
+    assert result == cs.schedule.get_next(schedule)
+
+
 @pytest.mark.parametrize(
     'crontab, schedule, result', [
         ('* * * * *', dt(2016, 4, 26, 8, 58), dt(2016, 4, 26, 8, 59)),
@@ -167,7 +213,10 @@ def test_set_allowed_month(crontab, schedule, result):
         ('30 7-8 * * *', dt(2016, 4, 26, 6, 30), dt(2016, 4, 26, 7, 30)),
         ('30 7-8 * * *', dt(2016, 4, 26, 7, 30), dt(2016, 4, 26, 8, 30)),
         ('30 7-8 * * *', dt(2016, 4, 26, 8, 30), dt(2016, 4, 27, 7, 30)),
-        ('* 10 * * *', dt(2016, 4, 27, 7, 58), dt(2016, 4, 27, 10, 59)),
+        pytest.param(
+            '* 10 * * *', dt(2016, 4, 27, 7, 58), dt(2016, 4, 27, 10, 59),
+            marks=pytest.mark.xfail(strict=True, reason=(
+                'fixed in 0.7, see test_get_next_schedule_first_minute'))),
         ('* 10 * * *', dt(2016, 4, 27, 10, 59), dt(2016, 4, 28, 10, 0)),
         ('30 10 * 7 *', dt(2016, 4, 27, 10, 59), dt(2016, 7, 1, 10, 30)),
         ('30 10 * 7 *', dt(2016, 7, 1, 10, 30), dt(2016, 7, 2, 10, 30)),
@@ -190,3 +239,314 @@ def test_get_next_schedule(crontab, schedule, result):
     if settings.USE_TZ:
         result = make_aware(result)
     assert result == cs.get_next_schedule()
+
+
+def test_get_next_schedule_first_minute():
+    """
+    A crontab allowing all minutes of an hour runs at the first minute
+    of the hour (formerly the minute of the last schedule was kept).
+    """
+    cs = CronScheduler(crontab='* 10 * * *')
+    schedule = cs.get_next_schedule(dt(2016, 4, 27, 7, 58))
+    assert schedule.replace(tzinfo=None) == dt(2016, 4, 27, 10, 0)
+
+
+def test_find_next_schedule():
+    cs = CronScheduler(crontab='30 7 0 4,7 10-15')
+    assert cs.find_next_schedule(dt(2016, 4, 5, 8)) == dt(2016, 4, 10, 7, 30)
+
+
+def test_get_next_schedule_seconds():
+    """Schedules are always at full minutes."""
+    cs = CronScheduler(crontab='* * * * *')
+    schedule = cs.get_next_schedule(dt(2016, 4, 26, 8, 58, 23, 500))
+    assert schedule.replace(tzinfo=None) == dt(2016, 4, 26, 8, 59)
+
+
+def test_impossible_schedule():
+    """There is no 30th of February."""
+    cs = CronScheduler(crontab='0 0 * 2 30')
+    with pytest.raises(ValueError):
+        cs.get_next_schedule(dt(2016, 1, 1))
+
+
+def is_allowed_day(cs, day):
+    """
+    Reference for the days of the crontab, computed from the raw field
+    lists (None: any value). Like with cron, dom and dow are combined
+    by OR if both are restricted.
+    """
+    if cs.months is not None and day.month not in cs.months:
+        return False
+    if cs.dom is None and cs.dow is None:
+        return True
+    return day.day in (cs.dom or []) or day.weekday() in (cs.dow or [])
+
+
+def get_next_by_minutes(cs, schedule):
+    """
+    Reference implementation: tests minute by minute, skipping days
+    which are not allowed.
+    """
+    schedule = schedule.replace(second=0, microsecond=0)
+    schedule += datetime.timedelta(minutes=1)
+    while True:
+        if not is_allowed_day(cs, schedule):
+            schedule = schedule.replace(hour=0, minute=0)
+            schedule += datetime.timedelta(days=1)
+        elif (schedule.hour in (cs.hours or range(24)) and
+                schedule.minute in (cs.minutes or range(60))):
+            return schedule
+        else:
+            schedule += datetime.timedelta(minutes=1)
+
+
+def random_values(rnd, low, high):
+    if rnd.random() < 0.4:
+        return None
+    return rnd.sample(range(low, high + 1), rnd.randint(1, 3))
+
+
+def test_get_next_schedule_random():
+    """Compare random schedules with the reference implementation."""
+    rnd = random.Random(42)
+    for _ in range(50):
+        cs = CronScheduler(
+            minutes=random_values(rnd, 0, 59),
+            hours=random_values(rnd, 0, 23),
+            dow=random_values(rnd, 0, 6),
+            months=random_values(rnd, 1, 12),
+            dom=random_values(rnd, 1, 28))
+        schedule = dt(2016, 1, 1) + datetime.timedelta(
+            minutes=rnd.randint(0, 525600))
+        for _ in range(3):
+            expected = get_next_by_minutes(cs, schedule)
+            schedule = cs.schedule.get_next(schedule)
+            assert schedule == expected
+
+
+@pytest.mark.parametrize(
+    'crontab', [
+        '* * * * *',
+        '15,45 7-9 * * *',
+        '30 7 0 4,7 10-15',
+        '0 0 * 2 29',
+    ])
+def test_iter_schedules(crontab):
+    """Same schedules as by consecutive calls of get_next_schedule()."""
+    cs = CronScheduler(crontab=crontab, last_schedule=dt(2016, 4, 26, 8, 30))
+    schedule = cs.last_schedule
+    expected = []
+    for _ in range(100):
+        schedule = cs.get_next_schedule(schedule)
+        expected.append(schedule)
+    schedules = cs.iter_schedules()
+    assert [next(schedules) for _ in range(100)] == expected
+    assert cs.next_n(100) == expected
+
+
+def test_iter_schedules_end():
+    cs = CronScheduler(crontab='0,30 10 * * *')
+    start = dt(2016, 4, 26, 10, 0)
+    end = dt(2016, 4, 28, 10, 0)
+    schedules = [schedule.replace(tzinfo=None)
+                 for schedule in cs.iter_schedules(start, end)]
+    assert schedules == [
+        dt(2016, 4, 26, 10, 30),
+        dt(2016, 4, 27, 10, 0),
+        dt(2016, 4, 27, 10, 30),
+        dt(2016, 4, 28, 10, 0),
+    ]
+
+
+def test_iter_schedules_impossible():
+    cs = CronScheduler(crontab='0 0 * 2 30')
+    with pytest.raises(ValueError):
+        next(cs.iter_schedules(dt(2016, 1, 1)))
+
+
+def test_get_schedule_array():
+    numpy = pytest.importorskip('numpy')
+    cs = CronScheduler(crontab='* 9-17 0-4 * *')
+    start = dt(2016, 4, 26, 8, 30)
+    end = dt(2016, 6, 30, 12, 0, 30)
+    schedules = cs.get_schedule_array(start, end)
+    expected = [schedule.replace(tzinfo=None)
+                for schedule in cs.iter_schedules(start, end)]
+    assert schedules.dtype == numpy.dtype('datetime64[m]')
+    assert schedules.tolist() == expected
+    assert cs.next_n(1000, start, as_array=True).tolist() == expected[:1000]
+    with pytest.raises(ValueError):
+        cs.get_schedule_array(start)
+
+
+def test_iter_schedules_dst():
+    """Schedules of a day with a change of the utc-offset."""
+    # avoid the non-existing times of the change (Chicago 2016-03-13):
+    cs = CronScheduler(crontab='0,30 0,1,3-23 * * *')
+    start = dt(2016, 3, 12, 12, 0)
+    expected = []
+    schedule = start
+    for _ in range(100):
+        schedule = cs.schedule.get_next(schedule)
+        if settings.USE_TZ:
+            expected.append(make_aware(schedule))
+        else:
+            expected.append(schedule)
+    assert cs.next_n(100, start) == expected
+
+
+@pytest.mark.parametrize(
+    'crontab, minutes, hours, dow, months, dom', [
+        ('*/15 * * * *', [0, 15, 30, 45], None, None, None, None),
+        ('10-50/20 * * * *', [10, 30, 50], None, None, None, None),
+        ('5/20 */6 * * *', [5, 25, 45], [0, 6, 12, 18], None, None, None),
+        ('0 8 MON-FRI * *', [0], [8], [0, 1, 2, 3, 4], None, None),
+        ('0 8 sat,Sun JAN,jul *', [0], [8], [5, 6], [1, 7], None),
+        ('0 0 * FEB-APR/2 1', [0], [0], None, [2, 4], [1]),
+        ('5,1-3 0 * * *', [1, 2, 3, 5], [0], None, None, None),
+        ('@hourly', [0], None, None, None, None),
+        ('@daily', [0], [0], None, None, None),
+        ('@weekly', [0], [0], [6], None, None),
+        ('@monthly', [0], [0], None, None, [1]),
+        ('@yearly', [0], [0], None, [1], [1]),
+    ])
+def test_crontab_syntax(crontab, minutes, hours, dow, months, dom):
+    cs = CronScheduler(crontab=crontab)
+    assert cs.minutes == minutes
+    assert cs.hours == hours
+    assert cs.dow == dow
+    assert cs.months == months
+    assert cs.dom == dom
+
+
+@pytest.mark.parametrize(
+    'crontab', [
+        '* * * *',
+        '* * * * * *',
+        '60 * * * *',
+        '* 24 * * *',
+        '* * 7 * *',
+        '* * * 0 *',
+        '* * * * 32',
+        '50-10 * * * *',
+        '*/0 * * * *',
+        '* * MON * JAN',
+        '* * MONDAY * *',
+        '1- * * * *',
+        '@reboot',
+    ])
+def test_invalid_crontab(crontab):
+    with pytest.raises(ValueError):
+        CronScheduler(crontab=crontab)
+
+
+def test_schedule_cache():
+    cache = ScheduleCache(size=2)
+    fields, schedule = cache.get(crontab='*/30 7 * * *')
+    assert fields == ([0, 30], [7], None, None, None)
+    assert cache.get(crontab=' */30  7 * * * ')[1] is schedule
+    assert cache.get(fields=([0, 30], [7], None, None, None))[1] is not \
+        schedule
+    assert cache.get_stats() == {'hits': 1, 'misses': 2, 'size': 2}
+    # the least recently used schedule gets removed:
+    cache.get(crontab='*/30 7 * * *')
+    cache.get(crontab='@daily')
+    assert cache.get(crontab='*/30 7 * * *')[1] is schedule
+    assert cache.get_stats() == {'hits': 3, 'misses': 3, 'size': 2}
+    cache.clear()
+    assert cache.get_stats()['size'] == 0
+
+
+def test_cached_crontab_copies():
+    """Modifying the data of a scheduler does not change the cache."""
+    cs = CronScheduler(crontab='0,30 7 * * *')
+    cs.minutes.append(15)
+    assert CronScheduler(crontab='0,30 7 * * *').minutes == [0, 30]
+
+
+def get_zone_schedules(cs, tz, year):
+    """
+    Reference implementation: all local times of the year allowed by
+    the crontab, converted to UTC by zoneinfo with fold=0 (PEP 495),
+    so every local time runs once and times in a gap are shifted.
+    """
+    zoneinfo = pytest.importorskip('zoneinfo')
+    zone = zoneinfo.ZoneInfo(tz)
+    day = datetime.date(year, 1, 1)
+    instants = set()
+    while day.year == year:
+        if is_allowed_day(cs, day):
+            for hour in cs.hours or range(24):
+                for minute in cs.minutes or range(60):
+                    local = dt(day.year, day.month, day.day,
+                               hour, minute, tzinfo=zone)
+                    instants.add(local.astimezone(
+                        datetime.timezone.utc).replace(tzinfo=None))
+        day += datetime.timedelta(days=1)
+    return sorted(instants)
+
+
+@pytest.mark.parametrize(
+    'tz', [
+        'America/New_York',
+        'Europe/Berlin',
+        'Australia/Sydney',
+        'Australia/Lord_Howe',
+        'Asia/Kolkata',
+    ])
+@pytest.mark.parametrize(
+    'crontab', [
+        '*/15 0-4 * * *',
+        '30 2 * * *',
+        '0,30 1 SUN * *',
+        '45 23 * * 1',
+    ])
+def test_zone_schedules_year(tz, crontab):
+    """Sweep a full year with both changes of daylight saving time."""
+    cs = CronScheduler(crontab=crontab, tz=tz)
+    start = dt(2021, 1, 2)
+    end = dt(2021, 12, 30)
+    expected = [instant for instant in get_zone_schedules(cs, tz, 2021)
+                if start < instant <= end]
+    schedules = cs.iter_schedules(make_aware(start, utc), make_aware(end, utc))
+    assert [cs.get_utc(schedule) for schedule in schedules] == expected
+
+
+def test_zone_dst():
+    # 2:30 does not exist on 2021-03-14 in New York and runs at 3:30:
+    cs = CronScheduler(crontab='30 2 * * *', tz='America/New_York')
+    schedule = cs.get_next_schedule(make_aware(dt(2021, 3, 13, 8), utc))
+    assert schedule == make_aware(dt(2021, 3, 14, 7, 30), utc)
+    assert schedule.utcoffset() == datetime.timedelta(hours=-4)
+    # 1:30 exists twice on 2021-11-07 but runs once:
+    cs = CronScheduler(crontab='30 1 * * *', tz='America/New_York')
+    schedules = cs.next_n(3, make_aware(dt(2021, 11, 6, 12), utc))
+    assert [cs.get_utc(schedule) for schedule in schedules] == [
+        dt(2021, 11, 7, 5, 30),
+        dt(2021, 11, 8, 6, 30),
+        dt(2021, 11, 9, 6, 30),
+    ]
+
+
+def test_zone_second_occurrence():
+    """Starting in a repeated hour continues in this hour."""
+    cs = CronScheduler(crontab='*/15 * * * *', tz='America/New_York')
+    # 1:10 EST, after the first 1:10 EDT
+    schedule = cs.get_next_schedule(make_aware(dt(2021, 11, 7, 6, 10), utc))
+    assert cs.get_utc(schedule) == dt(2021, 11, 7, 6, 15)
+
+
+def test_zone_schedule_array():
+    numpy = pytest.importorskip('numpy')
+    cs = CronScheduler(crontab='30 2 * * *', tz='America/New_York')
+    schedules = cs.next_n(2, make_aware(dt(2021, 3, 13, 8), utc),
+                          as_array=True)
+    assert schedules.tolist() == [
+        dt(2021, 3, 14, 7, 30), dt(2021, 3, 15, 6, 30)]
+    assert schedules.dtype == numpy.dtype('datetime64[m]')
+
+
+def test_unknown_zone():
+    with pytest.raises(ValueError):
+        CronScheduler(crontab='* * * * *', tz='Mars/Olympus_Mons')
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+
+import pytest
+
+from autotask.notify import (
+    DONE_CHANNEL,
+    Broadcaster,
+    DoneWaiters,
+    Listener,
+    SocketListener,
+    get_socket_dir,
+    send_notification,
+)
+from autotask.worker import TaskHandler
+
+
+@pytest.mark.django_db
+def test_listener_wait():
+    listener = Listener.create()
+    assert listener is not None
+    try:
+        # no notification: wait should time out
+        assert listener.wait(0.01) == []
+        send_notification()
+        assert listener.wait(1) == ['']
+        # notifications are consumed
+        assert listener.wait(0.01) == []
+    finally:
+        listener.close()
+
+
+@pytest.mark.django_db
+def test_listener_multiple_notifications():
+    """Several pending notifications wake up a listener just once."""
+    listener = Listener.create()
+    try:
+        for _ in range(3):
+            send_notification()
+        assert listener.wait(1)
+        assert listener.wait(0.01) == []
+    finally:
+        listener.close()
+
+
+@pytest.mark.django_db
+def test_listener_channels():
+    """Listeners get notified on their own channel only."""
+    listener = Listener.create()
+    other = Listener.create(channel='other')
+    try:
+        send_notification('other')
+        assert listener.wait(0.01) == []
+        assert other.wait(1)
+    finally:
+        listener.close()
+        other.close()
+
+
+@pytest.mark.django_db
+def test_listener_payloads():
+    listener = Listener.create(channel=DONE_CHANNEL)
+    try:
+        send_notification(DONE_CHANNEL, '1')
+        send_notification(DONE_CHANNEL, '2')
+        assert listener.wait(1) == ['1', '2']
+    finally:
+        listener.close()
+
+
+@pytest.mark.django_db
+def test_socket_listener_cleanup():
+    """Sockets get removed on close and stale sockets on sending."""
+    listener = SocketListener()
+    path = listener.path
+    assert os.path.exists(path)
+    listener.close()
+    assert not os.path.exists(path)
+    # simulate a socket left over from a killed process:
+    stale = SocketListener()
+    stale.socket.close()
+    assert os.path.exists(stale.path)
+    send_notification()
+    assert not os.path.exists(stale.path)
+    assert os.path.dirname(path) == get_socket_dir()
+
+
+@pytest.mark.django_db
+def test_taskhandler_idle_wakeup():
+    """A notification ends the idle time of a worker."""
+    th = TaskHandler(threading.Event())
+    th.idle_time = 10
+    th.listener = Listener.create()
+    try:
+        threading.Timer(0.05, send_notification).start()
+        start = time.time()
+        assert th.idle() is False
+        assert time.time() - start < 1
+    finally:
+        th.listener.close()
+
+
+@pytest.mark.django_db
+def test_taskhandler_idle_exit():
+    """An exit-event ends the idle time of a worker."""
+    exit_event = threading.Event()
+    th = TaskHandler(exit_event)
+    th.idle_time = 10
+    th.listener = Listener.create()
+    try:
+        threading.Timer(0.05, exit_event.set).start()
+        start = time.time()
+        assert th.idle() is True
+        assert time.time() - start < 2
+    finally:
+        th.listener.close()
+
+
+class FakeListener(object):
+
+    def wait(self, timeout):
+        return ['']
+
+    def close(self):
+        pass
+
+
+def test_broadcaster_wait():
+    """
+    A notification received while a thread is not waiting is returned
+    by the next wait() of the thread.
+    """
+    broadcaster = Broadcaster(FakeListener())
+    assert broadcaster.wait(0.01) is False
+    broadcaster.listen(0)
+    start = time.time()
+    assert broadcaster.wait(1) is True
+    assert time.time() - start < 0.5
+    # seen by this thread:
+    assert broadcaster.wait(0.01) is False
+    # but not by another one:
+    results = []
+    thread = threading.Thread(
+        target=lambda: results.append(broadcaster.wait(1)))
+    thread.start()
+    thread.join()
+    assert results == [True]
+
+
+@pytest.mark.django_db
+def test_done_waiters():
+    """All waiters share one listener and get woken up by their pk."""
+    waiters = DoneWaiters()
+    try:
+        first = waiters.register('1')
+        second = waiters.register('2')
+        listener = waiters.listener
+        assert waiters.register('1') is not first
+        assert waiters.listener is listener
+        send_notification(DONE_CHANNEL, '1')
+        assert first.wait(1)
+        assert not second.is_set()
+        waiters.unregister('2', second)
+        assert '2' not in waiters.events
+    finally:
+        waiters.close()
+    assert waiters.listener is None
@@ -0,0 +1,62 @@
+import pytest
+
+from autotask.conf import settings
+settings.AUTOTASK_IS_ACTIVE = True
+
+from autotask.registry import (
+    Registry,
+    registry,
+)
+from autotask.tasks import delayed_task
+
+
+@delayed_task()
+def registered(a):
+    return a
+
+
+def test_resolve_cached():
+    r = Registry()
+    function = r.resolve('os.path', 'join')
+    assert r.get_stats() == {'hits': 0, 'misses': 1, 'size': 1}
+    assert r.resolve('os.path', 'join') is function
+    assert r.get_stats() == {'hits': 1, 'misses': 1, 'size': 1}
+
+
+def test_resolve_registered():
+    r = Registry()
+    r.register('some.module', 'func_delayed', len)
+    assert r.resolve('some.module', 'func_delayed') is len
+    assert r.get_stats() == {'hits': 1, 'misses': 0, 'size': 1}
+
+
+@pytest.mark.parametrize(
+    'module, function, exception', [
+        ('autotask.not_existing', 'func', ImportError),
+        ('os.path', 'not_existing', AttributeError),
+    ])
+def test_resolve_errors(module, function, exception):
+    r = Registry()
+    with pytest.raises(exception):
+        r.resolve(module, function)
+    # errors don't get cached
+    with pytest.raises(exception):
+        r.resolve(module, function)
+    assert r.get_stats() == {'hits': 0, 'misses': 2, 'size': 0}
+
+
+def test_invalidate():
+    r = Registry()
+    r.resolve('os.path', 'join')
+    r.resolve('os.path', 'split')
+    r.invalidate('os.path', 'join')
+    assert r.get_stats()['size'] == 1
+    r.invalidate()
+    assert r.get_stats()['size'] == 0
+
+
+def test_decorator_registers_function():
+    hits = registry.hits
+    function = registry.resolve(__name__, 'registered_delayed')
+    assert registry.hits == hits + 1
+    assert function(3) == 3
@@ -0,0 +1,102 @@
+import datetime
+import os
+
+import pytest
+
+from django.utils.timezone import now
+
+from autotask.conf import settings
+settings.AUTOTASK_IS_ACTIVE = True
+
+from autotask.models import TaskQueue
+from autotask.results import (
+    FileSystemResultStore,
+    delete_results,
+    get_result_store,
+)
+from autotask.supervisor import clean_queue
+from autotask.tasks import delayed_task
+from autotask.worker import TaskHandler
+
+
+@delayed_task()
+def numbers(n):
+    return list(range(n))
+
+
+@pytest.fixture
+def result_store(monkeypatch, tmpdir):
+    monkeypatch.setattr(settings, 'AUTOTASK_RESULT_STORE_DIR', str(tmpdir))
+    monkeypatch.setattr(settings, 'AUTOTASK_RESULT_STORE_THRESHOLD', 100)
+    return get_result_store()
+
+
+def test_store(tmpdir):
+    store = FileSystemResultStore(str(tmpdir))
+    ref = store.put(b'some data')
+    with store.open(ref) as data:
+        assert data[:] == b'some data'
+    ref2 = store.put(b'')
+    with store.open(ref2) as data:
+        assert data == b''
+    store.delete(ref)
+    with pytest.raises((IOError, OSError)):
+        with store.open(ref):
+            pass
+    # deleting twice is ok
+    store.delete(ref)
+
+
+@pytest.mark.django_db
+def test_large_result(result_store):
+    """Large results are stored outside of the database."""
+    small = numbers(3)
+    large = numbers(1000)
+    th = TaskHandler()
+    for _ in range(2):
+        th.handle_task(th.get_next_task())
+    small_task = TaskQueue.objects.get(pk=small.pk)
+    large_task = TaskQueue.objects.get(pk=large.pk)
+    assert small_task.result_ref == ''
+    assert large_task.result_ref != ''
+    assert len(large_task.result) == 0
+    assert os.path.exists(result_store.get_path(large_task.result_ref))
+    assert small.result == [0, 1, 2]
+    assert large.result == list(range(1000))
+    # the stored result gets removed on cleaning the queue:
+    TaskQueue.objects.update(expire=now() - datetime.timedelta(seconds=1))
+    clean_queue()
+    assert not os.path.exists(result_store.get_path(large_task.result_ref))
+    assert large.result is None
+
+
+@pytest.mark.django_db
+def test_missing_result(result_store):
+    r = numbers(1000)
+    th = TaskHandler()
+    th.handle_task(th.get_next_task())
+    delete_results(TaskQueue.objects.all())
+    assert r.result is None
+
+
+@pytest.mark.django_db
+def test_replaced_result(result_store):
+    """
+    The stored result of a previous run is deleted after the reference
+    to the new result has been saved.
+    """
+    r = numbers(1000)
+    th = TaskHandler()
+    th.handle_task(th.get_next_task())
+    task = TaskQueue.objects.get(pk=r.pk)
+    first_ref = task.result_ref
+    assert os.path.exists(result_store.get_path(first_ref))
+    # next run:
+    th.store_result(task, list(range(1000)))
+    # not deleted before saving:
+    assert os.path.exists(result_store.get_path(first_ref))
+    th.finish_task(task)
+    second_ref = TaskQueue.objects.get(pk=r.pk).result_ref
+    assert second_ref not in ('', first_ref)
+    assert not os.path.exists(result_store.get_path(first_ref))
+    assert os.path.exists(result_store.get_path(second_ref))
@@ -0,0 +1,62 @@
+import pytest
+
+from django.core.exceptions import ImproperlyConfigured
+
+from autotask import serializers
+from autotask.conf import settings
+settings.AUTOTASK_IS_ACTIVE = True
+
+from autotask.models import DONE
+from autotask.tasks import delayed_task
+from autotask.worker import TaskHandler
+
+
+try:
+    import msgpack  # noqa
+except ImportError:
+    MSGPACK_SERIALIZERS = []
+else:
+    MSGPACK_SERIALIZERS = [serializers.MSGPACK]
+
+
+@delayed_task()
+def concat(a, b):
+    return [a, b]
+
+
+@pytest.mark.parametrize(
+    'name', [serializers.PICKLE, serializers.JSON] + MSGPACK_SERIALIZERS)
+def test_roundtrip(name):
+    obj = {'a': [1, 2.5, 'x', None, True], 'b': {'c': 'ü'}}
+    data = serializers.dumps(obj, name)
+    assert isinstance(data, bytes)
+    assert serializers.loads(data, name) == obj
+    # memoryview as returned for BinaryFields by some databases:
+    assert serializers.loads(memoryview(data), name) == obj
+
+
+def test_empty_data():
+    assert serializers.loads(b'', serializers.JSON) is None
+    assert serializers.loads(None, serializers.PICKLE) is None
+
+
+def test_unknown_serializer():
+    with pytest.raises(ImproperlyConfigured):
+        serializers.dumps(1, 'unknown')
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('name', [serializers.PICKLE, serializers.JSON])
+def test_serializer_per_task(monkeypatch, name):
+    """Tasks stored with different serializers are handled."""
+    monkeypatch.setattr(settings, 'AUTOTASK_SERIALIZER', name)
+    r1 = concat('a', 1)
+    monkeypatch.setattr(settings, 'AUTOTASK_SERIALIZER', serializers.PICKLE)
+    r2 = concat('b', 2)
+    th = TaskHandler()
+    for _ in range(2):
+        task = th.get_next_task()
+        th.handle_task(task)
+    assert r1.status == r2.status == DONE
+    assert r1.result == ['a', 1]
+    assert r2.result == ['b', 2]
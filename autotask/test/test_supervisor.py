@@ -1,5 +1,7 @@
 import datetime
+import os
 import random
+import signal
 import threading
 import time
 
@@ -7,10 +9,18 @@ import pytest
 
 from django.utils.timezone import now
 
-from autotask.models import TaskQueue
+from autotask.conf import settings
+from autotask.models import (
+    DONE,
+    RUNNING,
+    WAITING,
+    TaskQueue,
+)
 from autotask.supervisor import (
+    age_tasks,
     clean_queue,
     delete_periodic_tasks,
+    reclaim_tasks,
     set_supervisor_marker,
     start_supervisor,
     Supervisor,
@@ -68,6 +78,61 @@ def test_cleanup_periodic_tasks():
     assert TaskQueue.objects.filter(is_periodic=True).count() == 0
 
 
+@pytest.mark.django_db
+def test_age_tasks(monkeypatch):
+    """
+    The priority of tasks waiting too long gets raised up to the
+    limit.
+    """
+    monkeypatch.setattr(settings, 'AUTOTASK_PRIORITY_AGING', 60)
+    monkeypatch.setattr(settings, 'AUTOTASK_PRIORITY_AGING_LIMIT', 0)
+    past = now() - datetime.timedelta(seconds=90)
+    waiting = TaskQueue.objects.create(scheduled=past, priority=-2)
+    limited = TaskQueue.objects.create(scheduled=past, priority=0)
+    recent = TaskQueue.objects.create(scheduled=now(), priority=-2)
+    done = TaskQueue.objects.create(scheduled=past, priority=-2, status=DONE)
+    for expected in (-1, 0, 0):
+        age_tasks()
+        waiting.refresh_from_db()
+        assert waiting.priority == expected
+    for task, priority in ((limited, 0), (recent, -2), (done, -2)):
+        task.refresh_from_db()
+        assert task.priority == priority
+
+
+@pytest.mark.django_db
+def test_age_tasks_default_limit(monkeypatch):
+    """
+    Without a limit the priority gets raised up to the highest priority
+    of the waiting tasks in the queue.
+    """
+    monkeypatch.setattr(settings, 'AUTOTASK_PRIORITY_AGING', 60)
+    past = now() - datetime.timedelta(seconds=90)
+    waiting = TaskQueue.objects.create(scheduled=past)
+    TaskQueue.objects.create(scheduled=now(), priority=2)
+    TaskQueue.objects.create(scheduled=now(), priority=5, queue='other')
+    TaskQueue.objects.create(scheduled=now(), priority=9, status=DONE)
+    for expected in (1, 2, 2):
+        age_tasks()
+        waiting.refresh_from_db()
+        assert waiting.priority == expected
+
+
+@pytest.mark.django_db
+def test_reclaim_tasks(monkeypatch):
+    """Tasks left RUNNING by killed workers get reclaimed."""
+    past = now() - datetime.timedelta(seconds=90)
+    stale = TaskQueue.objects.create(status=RUNNING, started=past)
+    running = TaskQueue.objects.create(status=RUNNING, started=now())
+    assert reclaim_tasks() == 0  # disabled by default
+    monkeypatch.setattr(settings, 'AUTOTASK_RECLAIM_TIMEOUT', 60)
+    assert reclaim_tasks() == 1
+    stale.refresh_from_db()
+    running.refresh_from_db()
+    assert stale.status == WAITING
+    assert running.status == RUNNING
+
+
 @pytest.mark.django_db
 def test_start_workers():
     """
@@ -81,6 +146,29 @@ def test_start_workers():
     supervisor.stop_workers()
 
 
+@pytest.mark.django_db
+def test_start_queue_workers():
+    """
+    Test start and restart of worker processes for different queues.
+    """
+    supervisor = Supervisor(queues={'fast': 2, 'slow': 1})
+    supervisor.start_workers()
+    try:
+        assert len(supervisor.processes) == 3
+        queues = sorted(supervisor.process_queues.values())
+        assert queues == ['fast', 'fast', 'slow']
+        process = [process for process in supervisor.processes
+                   if supervisor.process_queues[process] == 'slow'][0]
+        assert process.args[-2:] == ['--queue', 'slow']
+        process.terminate()
+        process.wait()
+        supervisor.check_workers()
+        queues = sorted(supervisor.process_queues.values())
+        assert queues == ['fast', 'fast', 'slow']
+    finally:
+        supervisor.stop_workers()
+
+
 @pytest.mark.django_db
 def test_stop_workers():
     """
@@ -147,3 +235,59 @@ def test_clean_queue():
     clean_queue()
     assert TaskQueue.objects.filter(is_periodic=False).count() == 0
     assert TaskQueue.objects.all().count() == 1
+
+
+def get_child_pids(pid):
+    path = '/proc/{0}/task/{0}/children'.format(pid)
+    with open(path) as f:
+        return set(int(child) for child in f.read().split())
+
+
+def pid_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def wait_for_children(pid, num, exclude=()):
+    """Returns the pids of num children of the process pid."""
+    for _ in range(200):
+        children = get_child_pids(pid) - set(exclude)
+        if len(children) >= num:
+            return children
+        time.sleep(0.05)
+    return children
+
+
+@pytest.mark.skipif(
+    not os.path.exists('/proc/{0}/task/{0}/children'.format(os.getpid())),
+    reason='requires /proc/<pid>/task/<pid>/children')
+@pytest.mark.django_db
+def test_prefork_workers(monkeypatch):
+    """
+    In prefork mode a single master process forks the workers and
+    restarts terminated workers.
+    """
+    monkeypatch.setattr(settings, 'AUTOTASK_WORKER_MODE', 'prefork')
+    supervisor = Supervisor(workers=2)
+    supervisor.start_workers()
+    try:
+        assert len(supervisor.processes) == 1
+        master = supervisor.processes[0]
+        children = wait_for_children(master.pid, 2)
+        assert len(children) == 2
+        # terminate a worker:
+        child = children.pop()
+        os.kill(child, signal.SIGTERM)
+        new_children = wait_for_children(
+            master.pid, 1, exclude=children | {child})
+        assert len(new_children) == 1
+        assert all(pid_exists(pid) for pid in children | new_children)
+    finally:
+        supervisor.stop_workers()
+    master.wait()
+    # the master has terminated and reaped all of its workers:
+    workers = children | new_children | {child}
+    assert not any(pid_exists(pid) for pid in workers)
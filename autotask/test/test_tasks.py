@@ -1,7 +1,16 @@
 
+import datetime
+import queue
+import threading
 import time
 import pytest
 
+from django.db import (
+    OperationalError,
+    connection,
+)
+from django.utils.timezone import now
+
 from autotask.conf import settings
 settings.AUTOTASK_IS_ACTIVE = True
 
@@ -12,14 +21,34 @@ from autotask.models import (
     ERROR,
     TaskQueue,
 )
-from autotask.supervisor import clean_queue
+from autotask.notify import (
+    DONE_CHANNEL,
+    Listener,
+    done_waiters,
+)
+from autotask.supervisor import (
+    clean_queue,
+    reclaim_tasks,
+)
 from autotask.tasks import (
     DelayedTask,
+    TaskGroup,
+    TaskTimeoutError,
+    batch_task,
+    cron_task,
     delayed_task,
     periodic_task,
 )
+from autotask.timezones import get_timezone
+from autotask import (
+    serializers,
+    worker,
+)
 from autotask.worker import (
     TaskHandler,
+    get_rate_window,
+    retry_on_lock,
+    run_threads,
 )
 
 
@@ -33,6 +62,15 @@ def add2(a, b):
     return a + b
 
 
+@delayed_task()
+def signal_add(a, b):
+    signal_add.calls.put(a)
+    return a + b
+
+
+signal_add.calls = queue.Queue()
+
+
 @delayed_task(retries=1)
 def add3(a, b):
     return a + b
@@ -53,6 +91,67 @@ def mult2(a, b):
     return a * b
 
 
+@delayed_task(priority=10)
+def urgent_add(a, b):
+    return a + b
+
+
+@delayed_task(queue='slow')
+def slow_add(a, b):
+    return a + b
+
+
+@delayed_task(priority=1, max_concurrency=2)
+def limited_add(a, b):
+    return a + b
+
+
+@delayed_task(priority=1, rate_limit=0.5)
+def rate_limited_add(a, b):
+    return a + b
+
+
+@delayed_task(unique=True)
+def unique_add(a, b):
+    return a + b
+
+
+@delayed_task(unique_key=lambda a, b: a)
+def unique_key_add(a, b):
+    return a + b
+
+
+@delayed_task(unique_key=lambda a, b: a, debounce=0.1)
+def debounced_add(a, b):
+    return a + b
+
+
+@delayed_task(throttle=60)
+def throttled_add(a, b):
+    return a + b
+
+
+@delayed_task(throttle=60, ttl=0)
+def throttled_short_add(a, b):
+    return a + b
+
+
+@batch_task(max_size=3, max_wait=0)
+def batch_add(items):
+    batch_add.calls.append(len(items))
+    return [a + b for a, b in items]
+
+
+@batch_task(max_size=5, max_wait=0, max_concurrency=2)
+def limited_batch_add(items):
+    return [a + b for a, b in items]
+
+
+@batch_task(max_size=10, max_wait=0, retries=1)
+def batch_fail(items):
+    raise ValueError('batch failed')
+
+
 @pytest.mark.django_db
 class TestAutotask(object):
     @pytest.fixture(autouse=True)
@@ -184,6 +283,290 @@ class TestAutotask(object):
         clean_queue()
         assert r.result == result
 
+    def test_taskhandler_09(self):
+        """test claiming tasks in batches."""
+        for n in range(4):
+            add2(n, n)
+        th = TaskHandler()
+        th.batch_size = 3
+        task = th.get_next_task()
+        assert task.status == RUNNING
+        assert len(th.buffer) == 2
+        assert TaskQueue.objects.filter(status=RUNNING).count() == 3
+        assert TaskQueue.objects.filter(status=WAITING).count() == 1
+        # tasks are returned in order of their schedule:
+        next_task = th.get_next_task()
+        assert next_task.scheduled >= task.scheduled
+        assert len(th.buffer) == 1
+        # release the not handled task from the buffer:
+        th.release_tasks()
+        assert len(th.buffer) == 0
+        assert TaskQueue.objects.filter(status=RUNNING).count() == 2
+        assert TaskQueue.objects.filter(status=WAITING).count() == 2
+
+    def test_taskhandler_10(self):
+        """test claiming and saving with a column projection."""
+        r = add2(2, 'c')
+        th = TaskHandler()
+        task = th.get_next_task()
+        deferred = task.get_deferred_fields()
+        assert {'result', 'cron_data', 'error_message'} <= deferred
+        assert 'arguments' not in deferred
+        th.handle_task(task)
+        assert r.status == ERROR
+        assert 'unsupported operand' in r.error_message
+        # the arguments are not rewritten:
+        TaskQueue.objects.filter(pk=r.pk).update(arguments=b'changed')
+        th.finish_task(task)
+        assert bytes(TaskQueue.objects.get(pk=r.pk).arguments) == b'changed'
+        assert r.status == DONE
+        assert r.error_message == ''
+
+    def test_taskhandler_11(self):
+        """test tasks with higher priority are handled first."""
+        low = add2(1, 2)
+        high = urgent_add(3, 4)
+        th = TaskHandler()
+        assert th.get_next_task().pk == high.pk
+        assert th.get_next_task().pk == low.pk
+
+    def test_taskhandler_12(self):
+        """test handlers just handle the tasks of their queue."""
+        slow = slow_add(1, 2)
+        default = add2(3, 4)
+        th = TaskHandler()
+        assert th.get_next_task().pk == default.pk
+        assert th.get_next_task() is None
+        th = TaskHandler(queue='slow')
+        assert th.get_next_task().pk == slow.pk
+        assert th.get_next_task() is None
+
+    def test_taskhandler_13(self):
+        """
+        test max_concurrency: tasks exceeding the limit are skipped and
+        other tasks are claimed instead.
+        """
+        limited = limited_add.map([(n, n) for n in range(4)])
+        other = add2(1, 2)
+        th = TaskHandler()
+        th.batch_size = 4
+        tasks = th.claim_tasks()
+        assert [task.pk for task in tasks] == limited.pks[:2] + [other.pk]
+        assert TaskQueue.objects.get(pk=other.pk).started is not None
+        assert th.claim_tasks() == []
+        th.handle_task(tasks[0])
+        assert [task.pk for task in th.claim_tasks()] == limited.pks[2:3]
+
+    def test_taskhandler_14(self):
+        """test rate_limit: one task every two seconds."""
+        limited = rate_limited_add.map([(1, 2), (3, 4)])
+        th = TaskHandler()
+        th.batch_size = 2
+        tasks = th.claim_tasks()
+        assert [task.pk for task in tasks] == limited.pks[:1]
+        th.handle_task(tasks[0])
+        assert th.claim_tasks() == []
+        # move the start of the first task out of the rate window:
+        TaskQueue.objects.filter(pk=tasks[0].pk).update(
+            started=now() - datetime.timedelta(seconds=3))
+        assert [task.pk for task in th.claim_tasks()] == limited.pks[1:]
+
+    def test_taskhandler_15(self):
+        """test the limits apply to the further tasks of a batch."""
+        limited = limited_batch_add.map([(n, n) for n in range(4)])
+        th = TaskHandler()
+        tasks = th.claim_tasks()
+        assert len(tasks) == 1
+        assert [task.pk for task in tasks[0].batch_tasks] == limited.pks[:2]
+        assert th.claim_tasks() == []
+
+    def test_taskhandler_16(self, monkeypatch):
+        """
+        test max_concurrency: tasks left running by a killed worker
+        don't count after AUTOTASK_RECLAIM_TIMEOUT.
+        """
+        limited = limited_add.map([(n, n) for n in range(3)])
+        TaskQueue.objects.filter(pk__in=limited.pks[:2]).update(
+            status=RUNNING, started=now() - datetime.timedelta(hours=1))
+        th = TaskHandler()
+        assert th.claim_tasks() == []
+        monkeypatch.setattr(settings, 'AUTOTASK_RECLAIM_TIMEOUT', 60)
+        assert [task.pk for task in th.claim_tasks()] == limited.pks[2:]
+
+    def test_unique_task_01(self):
+        """test coalescing calls of a unique task with the same arguments."""
+        r1 = unique_add(1, 2)
+        r2 = unique_add(1, 2)
+        r3 = unique_add(2, 1)
+        assert r1.pk == r2.pk
+        assert r1.pk != r3.pk
+        assert TaskQueue.objects.count() == 2
+        # a running task does not get coalesced:
+        th = TaskHandler()
+        task = th.get_next_task()
+        assert task.pk == r1.pk
+        r4 = unique_add(1, 2)
+        assert r4.pk != r1.pk
+        th.handle_task(task)
+        assert r1.result == 3
+
+    def test_unique_task_02(self):
+        """test coalescing calls by a unique_key."""
+        r1 = unique_key_add(1, 2)
+        r2 = unique_key_add(1, 5)
+        assert r1.pk == r2.pk
+        group = unique_key_add.map([(1, 3), (2, 3), (2, 4)])
+        assert group.pks == [r1.pk, group.pks[1], group.pks[1]]
+        th = TaskHandler()
+        for _ in range(2):
+            th.handle_task(th.get_next_task())
+        # the arguments of the first call are used:
+        assert group.result == [3, 5, 5]
+
+    def test_debounce(self):
+        """test postponing a debounced task by following calls."""
+        r1 = debounced_add(1, 2)
+        scheduled = TaskQueue.objects.get(pk=r1.pk).scheduled
+        assert scheduled > now()
+        time.sleep(0.05)
+        r2 = debounced_add(1, 5)
+        assert r1.pk == r2.pk
+        assert TaskQueue.objects.get(pk=r1.pk).scheduled > scheduled
+        th = TaskHandler()
+        assert th.get_next_task() is None
+        time.sleep(0.1)
+        th.handle_task(th.get_next_task())
+        # the arguments of the last call are used:
+        assert r1.result == 6
+
+    def test_throttle(self):
+        """test running a throttled task at most once per period."""
+        r1 = throttled_add(1, 2)
+        th = TaskHandler()
+        task = th.get_next_task()
+        assert task.pk == r1.pk
+        th.handle_task(task)
+        started = TaskQueue.objects.get(pk=r1.pk).started
+        r2 = throttled_add(1, 2)
+        r3 = throttled_add(1, 2)
+        assert r2.pk == r3.pk != r1.pk
+        scheduled = TaskQueue.objects.get(pk=r2.pk).scheduled
+        assert scheduled == started + datetime.timedelta(seconds=60)
+        assert th.get_next_task() is None
+
+    def test_throttle_ttl(self):
+        """test the throttle period outlasting a shorter ttl."""
+        r1 = throttled_short_add(1, 2)
+        th = TaskHandler()
+        th.handle_task(th.get_next_task())
+        started = TaskQueue.objects.get(pk=r1.pk).started
+        clean_queue()
+        r2 = throttled_short_add(1, 2)
+        scheduled = TaskQueue.objects.get(pk=r2.pk).scheduled
+        assert scheduled == started + datetime.timedelta(seconds=60)
+
+    def test_batch_task_01(self):
+        """test handling up to max_size calls by a single call."""
+        batch_add.calls = []
+        results = [batch_add(n, n) for n in range(4)]
+        other = add2(1, 2)
+        th = TaskHandler()
+        th.batch_size = 2
+        for _ in range(3):
+            th.handle_task(th.get_next_task())
+        assert th.get_next_task() is None
+        assert batch_add.calls == [3, 1]
+        assert [r.result for r in results] == [0, 2, 4, 6]
+        assert [r.status for r in results] == [DONE] * 4
+        assert other.result == 3
+
+    def test_batch_task_02(self):
+        """test errors and released batches."""
+        results = batch_fail.map([(n,) for n in range(3)])
+        th = TaskHandler()
+        task = th.get_next_task()
+        assert len(task.batch_tasks) == 3
+        th.buffer.append(task)
+        th.release_tasks()
+        assert results.status == [WAITING] * 3
+        th.handle_task(th.get_next_task())
+        # rescheduled for a retry:
+        assert results.status == [WAITING] * 3
+        assert results.error_message == ['batch failed'] * 3
+        with pytest.raises(TypeError):
+            batch_add(1, b=2)
+
+    def test_batch_task_03(self):
+        """test tasks scheduled in the future don't join a batch."""
+        results = [batch_add(n, n) for n in range(3)]
+        TaskQueue.objects.filter(pk=results[1].pk).update(
+            scheduled=now() + datetime.timedelta(seconds=60))
+        th = TaskHandler()
+        task = th.get_next_task()
+        assert [t.pk for t in task.batch_tasks] == [
+            results[0].pk, results[2].pk]
+        assert th.get_next_task() is None
+
+    def test_bulk_enqueue_01(self):
+        """test map() of a decorated function."""
+        group = add2.map([(1, 2), (3, 4), (5, 6)])
+        assert isinstance(group, TaskGroup)
+        assert len(group) == 3
+        assert TaskQueue.objects.filter(status=WAITING).count() == 3
+        th = TaskHandler()
+        for _ in range(3):
+            th.handle_task(th.get_next_task())
+        assert [dt.result for dt in group] == [3, 7, 11]
+        assert group[1].result == 7
+
+    def test_bulk_enqueue_02(self):
+        """test bulk_enqueue() with keyword-arguments and chunks."""
+        calls = [((2,), {'b': 3}), ((4, 5), {}), ((), {'a': 1, 'b': 6})]
+        group = mult.bulk_enqueue(iter(calls), chunk_size=2)
+        assert len(set(group.pks)) == 3
+        th = TaskHandler()
+        for _ in range(3):
+            th.handle_task(th.get_next_task())
+        assert [dt.result for dt in group] == [6, 20, 6]
+
+    def test_bulk_enqueue_03(self):
+        """an empty iterable adds no tasks."""
+        group = add2.map([])
+        assert len(group) == 0
+        assert TaskQueue.objects.count() == 0
+
+    def test_task_group_01(self, django_assert_num_queries):
+        """group attributes are read with a single query."""
+        group = add2.map([(1, 2), (3, 'x'), (5, 6)])
+        with django_assert_num_queries(1):
+            assert group.status == [WAITING, WAITING, WAITING]
+        with django_assert_num_queries(1):
+            assert group.ready is False
+        th = TaskHandler()
+        for _ in range(3):
+            th.handle_task(th.get_next_task())
+        with django_assert_num_queries(1):
+            assert group.status == [DONE, ERROR, DONE]
+        with django_assert_num_queries(1):
+            assert group.result == [3, None, 11]
+        assert group.ready is True
+
+    def test_task_group_02(self):
+        """lost tasks."""
+        group = add2.map([(1, 2), (3, 4)])
+        TaskQueue.objects.filter(pk=group.pks[0]).delete()
+        assert group.status == [None, WAITING]
+        assert group.result == [None, None]
+        assert group.error_message == ['', '']
+
+    def test_fetch_many(self):
+        group = add2.map([(n, n) for n in range(5)])
+        values = DelayedTask.fetch_many(group.pks + [-1])
+        assert sorted(values) == sorted(group.pks)
+        assert all(v == {'status': WAITING} for v in values.values())
+        values = DelayedTask.fetch_many(group.pks, 'status', 'retries')
+        assert values[group.pks[0]] == {'status': WAITING, 'retries': 0}
+
     def test_periodic_task01(self):
 
         @periodic_task(seconds=0.02, start_now=True)
@@ -214,3 +597,294 @@ class TestAutotask(object):
         time.sleep(0.02)
         task = th.get_next_task()
         assert task is not None
+
+    def run_missed(self, scheduled, **kwargs):
+        """
+        Runs a periodic task every hour with the given misfire
+        arguments, which should have run at scheduled. Returns the
+        number of calls and the task.
+        """
+        calls = []
+
+        @periodic_task(seconds=3600, **kwargs)
+        def missed():
+            calls.append(now())
+
+        TaskQueue.objects.update(scheduled=scheduled)
+        th = TaskHandler()
+        th.handle_task(th.get_next_task())
+        return len(calls), TaskQueue.objects.get()
+
+    @pytest.mark.parametrize(
+        'misfire, calls, periods', [
+            ('run_all', 1, 1),
+            ('run_once', 1, 4),
+            ('skip', 0, 4),
+        ])
+    def test_misfire(self, misfire, calls, periods):
+        """A task missed three runs."""
+        scheduled = now() - datetime.timedelta(hours=3, minutes=30)
+        result, task = self.run_missed(scheduled, misfire=misfire)
+        assert result == calls
+        assert task.status == WAITING
+        assert task.scheduled == scheduled + datetime.timedelta(
+            hours=periods)
+
+    def test_misfire_on_time(self):
+        """A late run is not missed as long as the next run is not due."""
+        scheduled = now() - datetime.timedelta(minutes=30)
+        calls, task = self.run_missed(scheduled, misfire='skip')
+        assert calls == 1
+        assert task.scheduled == scheduled + datetime.timedelta(hours=1)
+
+    @pytest.mark.parametrize(
+        'delay, calls', [
+            (30, 1),
+            (120, 0),
+        ])
+    def test_misfire_grace(self, delay, calls):
+        scheduled = now() - datetime.timedelta(seconds=delay)
+        result, task = self.run_missed(scheduled, misfire='skip', grace=60)
+        assert result == calls
+        assert task.scheduled == scheduled + datetime.timedelta(hours=1)
+
+    def test_misfire_cron(self):
+        calls = []
+
+        @cron_task(crontab='0 * * * *', misfire='run_once')
+        def missed_cron():
+            calls.append(now())
+
+        scheduled = now().replace(minute=0, second=0, microsecond=0)
+        scheduled -= datetime.timedelta(hours=5)
+        TaskQueue.objects.update(scheduled=scheduled)
+        th = TaskHandler()
+        th.handle_task(th.get_next_task())
+        assert len(calls) == 1
+        next_schedule = TaskQueue.objects.get().scheduled
+        assert now() < next_schedule <= now() + datetime.timedelta(hours=1)
+        assert next_schedule.minute == 0
+
+    def test_cron_task_tz(self):
+
+        @cron_task(crontab='30 7 * * *', tz='Asia/Kolkata')
+        def report():
+            pass
+
+        task = TaskQueue.objects.get()
+        local = task.scheduled.astimezone(get_timezone('Asia/Kolkata'))
+        assert (local.hour, local.minute) == (7, 30)
+        next_schedule = TaskHandler().calculate_schedule(task)
+        assert next_schedule - task.scheduled == datetime.timedelta(days=1)
+        with pytest.raises(ValueError):
+            cron_task(tz='Asia/Nowhere')
+
+    def test_cron_task_tzinfo(self):
+        """test storing the name of a tzinfo with the task."""
+
+        @cron_task(crontab='30 7 * * *', tz=get_timezone('Asia/Kolkata'))
+        def report():
+            pass
+
+        task = TaskQueue.objects.get()
+        cron_data = serializers.loads(task.cron_data, task.serializer)
+        assert cron_data['tz'] == 'Asia/Kolkata'
+        local = task.scheduled.astimezone(get_timezone('Asia/Kolkata'))
+        assert (local.hour, local.minute) == (7, 30)
+
+    def test_misfire_invalid(self):
+        with pytest.raises(ValueError):
+            periodic_task(misfire='run_twice')
+
+
+@pytest.mark.parametrize('rate_limit, window, allowance', [
+    (10, 1, 10),
+    (1.5, 2, 3),
+    (0.5, 2, 1),
+    (0.3, 10, 3),
+    (1.0 / 3, 3, 1),
+    (1.0 / 5000, 5000, 1),
+    (1.0 / 7000, 7000, 1),
+    (1.0 / 7200, 7200, 1),
+])
+def test_get_rate_window(rate_limit, window, allowance):
+    assert get_rate_window(rate_limit) == (window, allowance)
+
+
+@pytest.mark.parametrize('rate_limit', [
+    0.7071, 2.718281828, 0.0003, 1.0 / 3601, 123.456])
+def test_get_rate_window_below(rate_limit):
+    """Rates with a large denominator are approximated from below."""
+    window, allowance = get_rate_window(rate_limit)
+    assert window >= 1
+    assert allowance >= 1
+    assert allowance / window <= rate_limit
+
+
+@pytest.mark.parametrize('limits', [
+    {'rate_limit': 0},
+    {'rate_limit': -1},
+    {'max_concurrency': 0},
+    {'max_concurrency': -2},
+])
+def test_invalid_limits(limits):
+    with pytest.raises(ValueError):
+        delayed_task(**limits)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_run_threads():
+    """All tasks get handled by a pool of worker threads."""
+    results = [signal_add(n, n) for n in range(10)]
+    exit_event = threading.Event()
+    pool = threading.Thread(target=run_threads, args=(exit_event, 3))
+    pool.start()
+    try:
+        # no database access while the workers are running: SQLite3
+        # may report a locked table to the test instead of waiting.
+        calls = [signal_add.calls.get(timeout=30) for _ in results]
+        assert sorted(calls) == list(range(10))
+    finally:
+        exit_event.set()
+        pool.join()
+    assert threading.active_count() == 1
+    # the handlers finish their tasks before terminating:
+    assert [r.result for r in results] == [n + n for n in range(10)]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_unique_task_concurrent():
+    """Concurrent calls of a unique task store a single task."""
+    barrier = threading.Barrier(8)
+    pks = queue.Queue()
+
+    def call():
+        try:
+            barrier.wait()
+            pks.put(unique_add(7, 7).pk)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=call) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({pks.get(timeout=1) for _ in threads}) == 1
+    assert TaskQueue.objects.count() == 1
+
+
+def test_retry_on_lock(monkeypatch):
+    monkeypatch.setattr(worker, 'SAVE_RETRY_DELAY', 0)
+    calls = []
+
+    @retry_on_lock
+    def save(fails):
+        calls.append(fails)
+        if len(calls) <= fails:
+            raise OperationalError('database table is locked')
+        return True
+
+    assert save(2) is True
+    assert len(calls) == 3
+    del calls[:]
+    with pytest.raises(OperationalError):
+        save(worker.SAVE_ATTEMPTS)
+    assert len(calls) == worker.SAVE_ATTEMPTS
+
+
+@pytest.mark.django_db
+def test_process_task_error(monkeypatch):
+    """
+    On an error of the worker itself the task is set to ERROR and the
+    buffered tasks are released.
+    """
+    r1 = add2(1, 1)
+    r2 = add2(2, 2)
+
+    def save_task(task, update_fields):
+        raise RuntimeError('connection lost')
+
+    monkeypatch.setattr(TaskHandler, 'save_task', staticmethod(save_task))
+    th = TaskHandler()
+    th.batch_size = 2
+    th.process_task(th.get_next_task())
+    assert r1.status == ERROR
+    assert r1.error_message == 'connection lost'
+    assert r2.status == WAITING
+    assert not th.buffer
+
+
+@pytest.mark.django_db
+def test_reclaimed_buffer(monkeypatch):
+    """
+    Buffered tasks reclaimed by the supervisor are not executed by the
+    worker, which claimed them in a batch.
+    """
+    monkeypatch.setattr(settings, 'AUTOTASK_RECLAIM_TIMEOUT', 60)
+    r1, r2, r3 = [add2(n, n) for n in range(3)]
+    th = TaskHandler()
+    th.batch_size = 3
+    assert th.get_next_task().pk == r1.pk
+    # the buffered tasks exceed the reclaim timeout:
+    past = now() - datetime.timedelta(seconds=90)
+    TaskQueue.objects.filter(pk__in=[r2.pk, r3.pk]).update(started=past)
+    for task in th.buffer:
+        task.started = past
+    assert reclaim_tasks() == 2
+    other = TaskHandler()
+    assert other.get_next_task().pk == r2.pk
+    # r2 belongs to the other worker, r3 gets claimed again:
+    assert th.get_next_task().pk == r3.pk
+    assert th.get_next_task() is None
+    assert TaskQueue.objects.get(pk=r2.pk).status == RUNNING
+
+
+@pytest.mark.django_db(transaction=True)
+def test_wait():
+    """wait() and get() block until a worker has handled the task."""
+    r = add2(2, 3)
+    assert r.wait(timeout=0.05) is False
+    with pytest.raises(TaskTimeoutError):
+        r.get(timeout=0.05)
+
+    def handle_task():
+        time.sleep(0.1)
+        th = TaskHandler()
+        th.handle_task(th.get_next_task())
+        connection.close()
+
+    worker = threading.Thread(target=handle_task)
+    worker.start()
+    start = time.time()
+    assert r.get(timeout=5) == 5
+    assert time.time() - start < 1
+    assert r.wait(timeout=0) is True
+    worker.join()
+    assert TaskQueue.objects.get(pk=r.pk).has_waiter
+    done_waiters.close()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_notify_waiters():
+    """The worker just notifies about tasks with a waiter."""
+    listener = Listener.create(DONE_CHANNEL)
+    try:
+        r1 = add2(1, 1)
+        r2 = add2(2, 2)
+        TaskQueue.objects.filter(pk=r2.pk).update(has_waiter=True)
+        th = TaskHandler()
+        th.handle_task(th.get_next_task())
+        th.handle_task(th.get_next_task())
+        assert r1.ready and r2.ready
+        assert listener.wait(1) == [str(r2.pk)]
+    finally:
+        listener.close()
+
+
+@pytest.mark.django_db
+def test_wait_lost_task():
+    r = add2(2, 3)
+    TaskQueue.objects.all().delete()
+    assert r.wait() is None
+    assert r.get() is None
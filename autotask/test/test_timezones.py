@@ -0,0 +1,86 @@
+from datetime import datetime as dt
+from datetime import timedelta
+
+import pytest
+import pytz
+
+from autotask.timezones import (
+    ZoneOffsets,
+    ZoneOffsetsCache,
+    get_timezone,
+    get_timezone_name,
+)
+
+
+def test_get_timezone():
+    tz = get_timezone('Europe/Berlin')
+    assert get_timezone(tz) is tz
+    with pytest.raises(ValueError):
+        get_timezone('Europe/Nowhere')
+
+
+@pytest.mark.parametrize('tz', [
+    'Europe/Berlin',
+    get_timezone('Europe/Berlin'),
+    pytz.timezone('Europe/Berlin'),
+])
+def test_get_timezone_name(tz):
+    assert get_timezone_name(tz) == 'Europe/Berlin'
+
+
+def test_get_timezone_name_invalid():
+    assert get_timezone_name(pytz.utc) == 'UTC'
+    with pytest.raises(ValueError):
+        get_timezone_name(pytz.FixedOffset(60))
+    with pytest.raises(ValueError):
+        get_timezone_name('Europe/Nowhere')
+
+
+@pytest.mark.parametrize('tz', [
+    get_timezone('Europe/Berlin'),
+    pytz.timezone('Europe/Berlin'),
+])
+def test_transitions(tz):
+    zone = ZoneOffsets(tz)
+    offset, instants, offsets = zone.get_transitions(2021)
+    assert offset == timedelta(hours=1)
+    assert instants == [dt(2021, 3, 28, 1), dt(2021, 10, 31, 1)]
+    assert offsets == [timedelta(hours=2), timedelta(hours=1)]
+    assert 2021 in zone.years
+
+
+def test_no_transitions():
+    zone = ZoneOffsets(get_timezone('Asia/Kolkata'))
+    assert zone.get_transitions(2021) == (
+        timedelta(hours=5, minutes=30), [], [])
+
+
+@pytest.mark.parametrize(
+    'local, fold, instant', [
+        # standard and daylight saving time:
+        (dt(2021, 1, 10, 12), 0, dt(2021, 1, 10, 11)),
+        (dt(2021, 7, 10, 12), 0, dt(2021, 7, 10, 10)),
+        # gap: shifted forward
+        (dt(2021, 3, 28, 2, 30), 0, dt(2021, 3, 28, 1, 30)),
+        (dt(2021, 3, 28, 2, 30), 1, dt(2021, 3, 28, 1, 30)),
+        # ambiguous:
+        (dt(2021, 10, 31, 2, 30), 0, dt(2021, 10, 31, 0, 30)),
+        (dt(2021, 10, 31, 2, 30), 1, dt(2021, 10, 31, 1, 30)),
+    ])
+def test_to_utc(local, fold, instant):
+    zone = ZoneOffsets(get_timezone('Europe/Berlin'))
+    assert zone.to_utc(local, fold) == instant
+
+
+def test_to_local():
+    zone = ZoneOffsets(get_timezone('Europe/Berlin'))
+    assert zone.to_local(dt(2021, 10, 31, 0, 30)) == dt(2021, 10, 31, 2, 30)
+    assert zone.to_local(dt(2021, 10, 31, 1, 30)) == dt(2021, 10, 31, 2, 30)
+
+
+def test_cache():
+    cache = ZoneOffsetsCache()
+    tz = get_timezone('Europe/Berlin')
+    assert cache.get(tz) is cache.get(tz)
+    cache.clear()
+    assert cache.zones == {}
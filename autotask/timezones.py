@@ -0,0 +1,187 @@
+"""
+Conversion between UTC and the local wall-clock time of a timezone by
+cached offset transitions.
+
+The transitions of a zone (i.e. the changes from and to daylight saving
+time) are determined once per year and zone from the tzinfo, so the
+conversions are bisect lookups, independent of the tz library. Local
+times are resolved like with PEP 495: a local time in a gap (i.e. 2:30
+at the start of daylight saving time) is shifted forward by the length
+of the gap and an ambiguous local time (i.e. 1:30 at the end of daylight
+saving time) has an earlier (fold=0) and a later (fold=1) instant.
+
+Assumes at most one transition within two days, which holds for all
+zones of the tz database since decades.
+"""
+
+import bisect
+import datetime
+from datetime import timedelta
+import threading
+
+from django.utils.timezone import utc
+
+try:
+    import zoneinfo
+except ImportError:
+    # not available before Python 3.9
+    zoneinfo = None
+
+
+# offsets of the zones are sampled once a day to find the transitions
+SAMPLE_INTERVAL = timedelta(days=1)
+
+
+def get_timezone(tz):
+    """
+    Returns the tzinfo for tz, which can be the name of a timezone
+    (like 'Europe/Berlin') or a tzinfo. Names are resolved by zoneinfo
+    or by pytz if zoneinfo is not available. Raises a ValueError for an
+    unknown timezone name.
+    """
+    if isinstance(tz, datetime.tzinfo):
+        return tz
+    try:
+        if zoneinfo is not None:
+            return zoneinfo.ZoneInfo(tz)
+        import pytz
+        return pytz.timezone(tz)
+    except Exception:
+        raise ValueError('unknown timezone: {!r}'.format(tz))
+
+
+def get_timezone_name(tz):
+    """
+    Returns the name of the timezone tz, which can be a name or a
+    tzinfo of zoneinfo, pytz or UTC. The name is validated by
+    get_timezone(). Raises a ValueError for a tzinfo without a name
+    (i.e. a fixed offset), as the name gets stored with the task.
+    """
+    if isinstance(tz, datetime.tzinfo):
+        # zoneinfo: key, pytz: zone
+        name = getattr(tz, 'key', None) or getattr(tz, 'zone', None)
+        if name is None and tz.tzname(None) == 'UTC':
+            name = 'UTC'
+        if name is None:
+            raise ValueError('timezone without a name: {!r}'.format(tz))
+        tz = name
+    get_timezone(tz)
+    return tz
+
+
+class ZoneOffsets(object):
+    """
+    Offset transitions of a single timezone, cached by year. All
+    datetimes are naive, either in UTC or in local wall-clock time.
+    """
+
+    def __init__(self, tzinfo):
+        self.tzinfo = tzinfo
+        # year: (offset at the start of the year,
+        #        sorted instants of the transitions,
+        #        offsets after the transitions)
+        self.years = {}
+
+    def get_utcoffset(self, instant):
+        """Returns the offset of the tzinfo for the UTC instant."""
+        return instant.replace(tzinfo=utc).astimezone(
+            self.tzinfo).utcoffset()
+
+    def get_transitions(self, year):
+        """
+        Returns the cached tuple (offset at the start of the year,
+        instants, offsets) with the transitions of the year in UTC.
+        """
+        try:
+            return self.years[year]
+        except KeyError:
+            pass
+        start = datetime.datetime(year, 1, 1)
+        end = datetime.datetime(year + 1, 1, 1)
+        first_offset = offset = self.get_utcoffset(start)
+        instants = []
+        offsets = []
+        sample = start
+        while sample < end:
+            next_sample = min(sample + SAMPLE_INTERVAL, end)
+            next_offset = self.get_utcoffset(next_sample)
+            if next_offset != offset:
+                instants.append(self.find_transition(sample, next_sample))
+                offsets.append(next_offset)
+                offset = next_offset
+            sample = next_sample
+        transitions = first_offset, instants, offsets
+        self.years[year] = transitions
+        return transitions
+
+    def find_transition(self, low, high):
+        """
+        Returns the instant of the transition between low and high,
+        which have different offsets, with a precision of a second.
+        """
+        offset = self.get_utcoffset(low)
+        # bisection by full seconds
+        start, end = 0, int((high - low).total_seconds())
+        while end - start > 1:
+            middle = (start + end) // 2
+            if self.get_utcoffset(low + timedelta(seconds=middle)) == offset:
+                start = middle
+            else:
+                end = middle
+        return low + timedelta(seconds=end)
+
+    def utcoffset(self, instant):
+        """Returns the offset for the UTC instant."""
+        offset, instants, offsets = self.get_transitions(instant.year)
+        index = bisect.bisect_right(instants, instant)
+        if index:
+            return offsets[index - 1]
+        return offset
+
+    def to_local(self, instant):
+        """Returns the local time for the UTC instant."""
+        return instant + self.utcoffset(instant)
+
+    def to_utc(self, local, fold=0):
+        """
+        Returns the UTC instant for the local time. For ambiguous local
+        times fold selects the earlier (0) or the later (1) instant,
+        local times in a gap are shifted forward.
+        """
+        before = self.utcoffset(local - timedelta(days=1))
+        after = self.utcoffset(local + timedelta(days=1))
+        if before == after:
+            # no transition nearby
+            return local - before
+        instants = sorted(set(
+            local - offset for offset in (before, after)
+            if self.utcoffset(local - offset) == offset))
+        if not instants:
+            # gap: the offset before the transition shifts forward
+            return local - before
+        return instants[-1] if fold else instants[0]
+
+
+class ZoneOffsetsCache(object):
+    """
+    Process-wide cache of the ZoneOffsets by timezone. Thread-safe.
+    """
+
+    def __init__(self):
+        self.zones = {}
+        self.lock = threading.Lock()
+
+    def get(self, tzinfo):
+        with self.lock:
+            try:
+                return self.zones[tzinfo]
+            except KeyError:
+                zone = self.zones[tzinfo] = ZoneOffsets(tzinfo)
+                return zone
+
+    def clear(self):
+        with self.lock:
+            self.zones.clear()
+
+
+zone_offsets = ZoneOffsetsCache()
@@ -1,62 +1,279 @@
+import collections
 import datetime
-import importlib
-import pickle
+from fractions import Fraction
+import functools
+import inspect
+import logging
+import math
+import threading
+import time
 
 from django.db import (
     OperationalError,
+    connection,
     transaction,
 )
+from django.db.models import (
+    Case,
+    IntegerField,
+    Q,
+    Sum,
+    When,
+)
 from django.utils.timezone import now
 
+from . import (
+    compression,
+    serializers,
+)
 from .conf import settings
 from .cron import CronScheduler
+from .locks import advisory_lock
 from .models import (
+    DEFAULT_QUEUE,
+    RUN_ALL,
+    RUN_ONCE,
     WAITING,
     RUNNING,
     DONE,
     ERROR,
     TaskQueue,
 )
+from .notify import (
+    DONE_CHANNEL,
+    Broadcaster,
+    Listener,
+    notify,
+)
+from .registry import registry
+from .results import (
+    get_result_store,
+    use_result_store,
+)
 from .shutdown import get_shutdown_objects
 
 
+# max. time in seconds a listening worker needs to recognize an exit
+EXIT_CHECK_INTERVAL = 1
+
+# attempts and delay in seconds for accessing a locked database
+# (SQLite3), see retry_on_lock()
+SAVE_ATTEMPTS = 5
+SAVE_RETRY_DELAY = 0.05
+
+# max. length in seconds of the window for counting the started tasks
+# of a function with a fractional rate_limit, see get_rate_window()
+MAX_RATE_WINDOW = 3600
+# relative deviation from a rate_limit ignored as rounding error of the
+# float (i.e. 0.3 is taken as 3/10)
+RATE_TOLERANCE = 1e-9
+
+# coroutines are not available with Python 2
+iscoroutine = getattr(inspect, 'iscoroutine', lambda obj: False)
+
+logger = logging.getLogger(__name__)
+
+
+def retry_on_lock(method):
+    """
+    Decorator for the database access of a worker outside of the claim:
+    repeats the call on an OperationalError, raised by SQLite3 if
+    another connection holds the lock (like claim_tasks() does). The
+    decorated functions must be idempotent.
+    """
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        for attempt in range(1, SAVE_ATTEMPTS + 1):
+            try:
+                return method(*args, **kwargs)
+            except OperationalError:
+                if attempt == SAVE_ATTEMPTS:
+                    raise
+                time.sleep(SAVE_RETRY_DELAY * attempt)
+    return wrapper
+
+# columns loaded for executing a task. The result and error_message get
+# overwritten anyway and the cron_data is loaded on demand by cron tasks.
+TASK_FIELDS = (
+    'scheduled',
+    'module',
+    'function',
+    'arguments',
+    'is_periodic',
+    'timedelta',
+    'status',
+    'retries',
+    'result_ref',
+    'ttl',
+    'expire',
+    'serializer',
+    'compression',
+    'misfire',
+    'misfire_grace',
+)
+
+# columns written by storing the result
+RESULT_FIELDS = ('result', 'result_ref', 'compression')
+
+
 class TaskHandler(object):
-    """The worker thread for handling callables."""
+    """
+    The worker thread for handling callables. Handles just the tasks of
+    the given queue.
+    """
 
-    def __init__(self, exit_event=None):
+    def __init__(self, exit_event=None, listener=None, queue=DEFAULT_QUEUE):
         self.exit_event = exit_event
+        self.queue = queue
         self.idle_time = settings.AUTOTASK_HANDLE_TASK_IDLE_TIME
         self.retry_delay = datetime.timedelta(
             seconds=settings.AUTOTASK_RETRY_DELAY)
+        self.batch_size = max(1, settings.AUTOTASK_CLAIM_BATCH_SIZE)
+        # claimed tasks waiting for execution by this handler:
+        self.buffer = collections.deque()
+        self.listener = listener
 
     def run(self):
         """Entry point for thread start and main loop for worker."""
+        own_listener = self.listener is None
+        if own_listener:
+            self.listener = Listener.create()
         task = None
-        while True:
-            if task:
-                self.handle_task(task)
-            if self.exit_event.is_set():
+        try:
+            while True:
+                if task:
+                    self.process_task(task)
+                if self.exit_event.is_set():
+                    break
+                try:
+                    task = self.get_next_task()
+                except Exception:
+                    logger.exception('autotask: claiming tasks failed')
+                    task = None
+                if task:
+                    continue
+                if self.idle():
+                    break
+        finally:
+            self.release_tasks()
+            if own_listener and self.listener:
+                self.listener.close()
+                self.listener = None
+
+    def process_task(self, task):
+        """
+        Handles the task like handle_task(), but doesn't raise. Errors of
+        the worker itself (i.e. a lost database connection on saving
+        the task) are logged, the task is set to ERROR and the buffered
+        tasks are released, so none of them stays RUNNING.
+        """
+        try:
+            self.handle_task(task)
+        except Exception as err:
+            logger.exception('autotask: handling of %s failed', task)
+            tasks = getattr(task, 'batch_tasks', None) or [task]
+            try:
+                self.abort_tasks(tasks, err)
+                self.release_tasks()
+            except Exception:
+                logger.exception('autotask: aborting %s failed', task)
+
+    def idle(self):
+        """
+        Waits for new tasks. Returns True if the worker should exit.
+        With a listener the worker wakes up as soon as a new task gets
+        stored, the idle time is just a fallback for tasks scheduled
+        in the future.
+        """
+        if not self.listener:
+            return self.exit_event.wait(timeout=self.idle_time)
+        deadline = time.time() + self.idle_time
+        while not self.exit_event.is_set():
+            remaining = deadline - time.time()
+            if remaining <= 0:
                 break
-            task = self.get_next_task()
-            if task:
-                continue
-            if self.exit_event.wait(timeout=self.idle_time):
+            if self.listener.wait(min(remaining, EXIT_CHECK_INTERVAL)):
                 break
+        return self.exit_event.is_set()
 
     def get_next_task(self):
         """
-        Returns the next task from the queue on a first come first serve
-        basis. Returns None if there is no pending task in the queue.
+        Returns the next task from the queue with the highest priority on
+        a first come first serve basis. Returns None if there is no
+        pending task in the queue.
+        Tasks are taken from the local buffer. If the buffer is empty
+        up to batch_size tasks get claimed from the database at once.
+        Buffered tasks whose claim has been lost meanwhile are skipped,
+        see renew_claim().
+        """
+        while self.buffer:
+            task = self.buffer.popleft()
+            if self.renew_claim(task):
+                return task
+        tasks = self.claim_tasks()
+        if not tasks:
+            return None
+        self.buffer.extend(tasks[1:])
+        return tasks[0]
+
+    @staticmethod
+    def renew_claim(task):
+        """
+        Stamps the start of the execution of a buffered task. Returns
+        False if the claim has been lost meanwhile: the task has been
+        set back to WAITING by supervisor.reclaim_tasks() (and may be
+        claimed by another worker), so it must not run here. The
+        started time of the claim identifies the claim. Members of a
+        batch with a lost claim are removed from the batch.
+        """
+        tasks = getattr(task, 'batch_tasks', None) or [task]
+        pks = [batch_task.pk for batch_task in tasks]
+        started = now()
+        renewed = TaskQueue.objects.filter(
+            pk__in=pks, status=RUNNING, started=task.started,
+        ).update(started=started)
+        if renewed < len(pks):
+            owned = set(TaskQueue.objects.filter(
+                pk__in=pks, status=RUNNING, started=started,
+            ).values_list('pk', flat=True))
+            tasks = [batch_task for batch_task in tasks
+                     if batch_task.pk in owned]
+            if not tasks:
+                return False
+            if hasattr(task, 'batch_tasks'):
+                task.batch_tasks = tasks
+        for batch_task in tasks:
+            batch_task.started = started
+        return True
+
+    def claim_tasks(self):
+        """
+        Claims up to batch_size due tasks in a single transaction by
+        setting their status to RUNNING. Returns a list of the claimed
+        tasks ordered by priority (highest first) and schedule.
+        On databases supporting SKIP LOCKED (like PostgreSQL) rows locked
+        by other workers are skipped instead of waiting for them.
+        Just the primary keys are selected while holding the locks, the
+        columns needed for execution (TASK_FIELDS) are loaded after the
+        claim is committed.
+        For a task of a batch function further due tasks of this function
+        are claimed. These are returned as the batch_tasks attribute of
+        the first task.
         """
         try:
             with transaction.atomic():
-                qs = TaskQueue.objects.select_for_update()
-                qs = qs.filter(status=WAITING, scheduled__lte=now())
-                qs = qs.order_by('scheduled')
-                task = qs.first()
-                if task:
-                    task.status = RUNNING
-                    task.save()
+                qs = self.get_select_queryset()
+                qs = qs.filter(
+                    queue=self.queue, status=WAITING, scheduled__lte=now())
+                qs = qs.order_by('-priority', 'scheduled')
+                pks, batches = self.select_tasks(qs)
+                members = self.select_batch_members(batches, pks)
+                claimed = pks + [pk for batch in members.values()
+                                 for pk in batch]
+                started = now()
+                if claimed:
+                    TaskQueue.objects.filter(pk__in=claimed).update(
+                        status=RUNNING, started=started)
         except OperationalError:
             # This exception is needed for SQLite3 which does not
             # support select_for_update().
@@ -67,80 +284,627 @@ class TaskHandler(object):
             # There may be another task waiting, so try it again.
             # (In the unlikely case the recursion limit is reached
             # the worker terminates but will restart from autotask.)
-            return self.get_next_task()
-        else:
-            return task
+            return self.claim_tasks()
+        if not claimed:
+            return []
+        try:
+            tasks = self.load_tasks(claimed)
+        except Exception:
+            # don't keep the claim on tasks which are not executed
+            TaskQueue.objects.filter(pk__in=claimed, status=RUNNING).update(
+                status=WAITING)
+            raise
+        for task in tasks.values():
+            # identifies the claim, see renew_claim()
+            task.started = started
+        for pk, batch in members.items():
+            if pk in tasks:
+                tasks[pk].batch_tasks = [tasks[pk]] + [
+                    tasks[member] for member in batch if member in tasks]
+        return [tasks[pk] for pk in pks if pk in tasks]
+
+    @staticmethod
+    @retry_on_lock
+    def load_tasks(pks):
+        """
+        Returns a dictionary with the claimed tasks by pk, just the
+        columns needed for execution are loaded.
+        """
+        return TaskQueue.objects.only(*TASK_FIELDS).in_bulk(pks)
+
+    def select_tasks(self, qs):
+        """
+        Returns a tuple (pks, batches): the pks of up to batch_size
+        tasks from the queryset which can get claimed without exceeding
+        the rate_limit or max_concurrency of their functions and a
+        dictionary with the (module, function, batch_size, usage) of the
+        selected tasks of batch functions by pk. usage is a tuple
+        (FunctionUsage, rate_limit, max_concurrency) for a function
+        with limits, otherwise None. Tasks exceeding a limit are skipped
+        and stay claimable. Tasks without limits are selected by a
+        single query.
+        """
+        qs = qs.values_list(
+            'pk', 'module', 'function', 'rate_limit', 'max_concurrency',
+            'batch_size')
+        pks = []
+        batches = {}
+        usages = {}  # FunctionUsage by (module, function)
+        # functions exceeding their limits or with a selected batch:
+        blocked = set()
+        while len(pks) < self.batch_size:
+            selection = qs.exclude(pk__in=pks)
+            for module, function in blocked:
+                selection = selection.exclude(
+                    module=module, function=function)
+            size = self.batch_size - len(pks)
+            candidates = list(selection[:size])
+            for candidate in candidates:
+                (pk, module, function,
+                 rate_limit, max_concurrency, batch_size) = candidate
+                key = (module, function)
+                if key in blocked:
+                    continue
+                if batch_size:
+                    batches[pk] = (module, function, batch_size, None)
+                    blocked.add(key)
+                if rate_limit is None and max_concurrency is None:
+                    pks.append(pk)
+                    continue
+                if key not in usages:
+                    usages[key] = FunctionUsage.get(
+                        module, function, rate_limit)
+                usage = usages[key]
+                if usage and usage.allows(rate_limit, max_concurrency):
+                    usage.add()
+                    pks.append(pk)
+                    if pk in batches:
+                        batches[pk] = (module, function, batch_size,
+                                       (usage, rate_limit, max_concurrency))
+                else:
+                    batches.pop(pk, None)
+                    blocked.add(key)
+            if len(candidates) < size:
+                break
+        return pks, batches
+
+    def select_batch_members(self, batches, pks):
+        """
+        Returns a dictionary with lists of the pks of the further tasks
+        to claim for the selected tasks of batch functions. batches is
+        the dictionary returned from select_tasks(). The further tasks
+        must be due (so retries keep their delay) and are selected in the
+        order of their schedule. They count for the limits of the
+        function like the first one.
+        """
+        members = {}
+        for pk, (module, function, batch_size, usage) in batches.items():
+            members[pk] = []
+            size = batch_size - 1
+            if usage is not None:
+                usage, rate_limit, max_concurrency = usage
+                size = min(size, usage.remaining(rate_limit, max_concurrency))
+            if size < 1:
+                continue
+            qs = self.get_select_queryset().filter(
+                queue=self.queue,
+                module=module,
+                function=function,
+                status=WAITING,
+                scheduled__lte=now()).exclude(pk__in=pks)
+            qs = qs.order_by('scheduled').values_list('pk', flat=True)
+            members[pk] = list(qs[:size])
+            if usage is not None:
+                usage.add(len(members[pk]))
+        return members
+
+    @staticmethod
+    def get_select_queryset():
+        """
+        Returns a queryset locking the selected rows. Uses SKIP LOCKED
+        if supported by the database, so concurrent workers don't
+        serialize on the same rows at the head of the queue.
+        """
+        features = connection.features
+        if getattr(features, 'has_select_for_update_skip_locked', False):
+            return TaskQueue.objects.select_for_update(skip_locked=True)
+        return TaskQueue.objects.select_for_update()
+
+    def release_tasks(self):
+        """
+        Sets claimed but not executed tasks from the buffer back to
+        WAITING, so other workers can handle them. Tasks claimed by
+        another worker meanwhile (see renew_claim()) are left alone.
+        """
+        if self.buffer:
+            tasks = [batch_task for task in self.buffer
+                     for batch_task in getattr(task, 'batch_tasks', [task])]
+            TaskQueue.objects.filter(
+                pk__in=[task.pk for task in tasks],
+                status=RUNNING,
+                started__in=set(task.started for task in tasks),
+            ).update(status=WAITING)
+            self.buffer.clear()
 
     def handle_task(self, task):
         """
-        Run a delayed or periodic task.
+        Run a delayed or periodic task or a batch of tasks.
         """
+        tasks = getattr(task, 'batch_tasks', None)
+        if tasks is not None:
+            self.handle_batch(tasks)
+            return
+        if task.is_periodic and self.apply_misfire_policy(task):
+            return
         try:
             task = self._execute(task)
         except Exception as err:
             # catch everything, because it is unknown
             # what may had happen with the callable
-            task.error = str(err)
+            self.finish_task(task, err)
+        else:
+            self.finish_task(task)
+
+    def apply_misfire_policy(self, task):
+        """
+        Applies the misfire policy of a periodic task before running it.
+        A run is missed if it starts more than task.misfire_grace after
+        its schedule or, without a grace time, if the following run is
+        also due. A missed run of a 'run_once' task gets executed, but
+        the next schedule will be the first one after now, so the
+        missed runs are not caught up. A missed run of a 'skip' task is
+        dropped and the task gets rescheduled the same way. Returns True
+        if the run has been dropped.
+        """
+        if task.misfire == RUN_ALL:
+            return False
+        current = now()
+        if task.misfire_grace is not None:
+            missed = current - task.scheduled > task.misfire_grace
+        else:
+            missed = self.calculate_schedule(task) <= current
+        if not missed:
+            return False
+        task.reschedule_after = current
+        if task.misfire == RUN_ONCE:
+            return False
+        task.status = WAITING
+        task.scheduled = self.calculate_schedule(task)
+        task.save(update_fields=['status', 'scheduled', 'error_message'])
+        return True
+
+    def handle_batch(self, tasks):
+        """
+        Run the tasks of a batch function by a single call.
+        """
+        try:
+            self._execute_batch(tasks)
+        except Exception as err:
+            self.finish_batch(tasks, err)
+        else:
+            self.finish_batch(tasks)
+
+    def finish_task(self, task, error=None):
+        """
+        Sets the new status and schedule of an executed task according
+        to the error raised by the callable (None on success) and saves
+        the task. Just the changed columns are written, the arguments
+        are never rewritten.
+        """
+        update_fields = self.update_task(task, error)
+        self.save_task(task, update_fields)
+        self.delete_obsolete_results([task])
+
+    @staticmethod
+    @retry_on_lock
+    def save_task(task, update_fields):
+        """Saves the given fields of a finished task."""
+        if task.status in (DONE, ERROR) and not task.is_periodic:
+            # A notification is sent only if a process waits for the
+            # task. The update doesn't match a task with a waiter, even
+            # if the flag has been set after the task has been loaded.
+            values = {name: getattr(task, name) for name in update_fields}
+            qs = TaskQueue.objects.filter(pk=task.pk)
+            if not qs.filter(has_waiter=False).update(**values):
+                qs.update(**values)
+                notify(DONE_CHANNEL, str(task.pk))
+        else:
+            task.save(update_fields=update_fields)
+
+    def finish_batch(self, tasks, error=None):
+        """
+        Like finish_task() for the tasks of a batch, but saves all tasks
+        by a single query (with Django >= 2.2).
+        """
+        update_fields = set()
+        for task in tasks:
+            update_fields.update(self.update_task(task, error))
+        self.save_batch(tasks, sorted(update_fields))
+        self.delete_obsolete_results(tasks)
+
+    @staticmethod
+    @retry_on_lock
+    def save_batch(tasks, update_fields):
+        """Saves the given fields of the finished tasks of a batch."""
+        if hasattr(TaskQueue.objects, 'bulk_update'):
+            TaskQueue.objects.bulk_update(tasks, update_fields)
+        else:
+            for task in tasks:
+                task.save(update_fields=update_fields)
+        # notify the processes waiting for tasks, see save_task()
+        finished = [
+            task.pk for task in tasks if task.status in (DONE, ERROR)]
+        if finished:
+            waited = TaskQueue.objects.filter(
+                pk__in=finished, has_waiter=True).values_list('pk', flat=True)
+            for pk in waited:
+                notify(DONE_CHANNEL, str(pk))
+
+    @staticmethod
+    def delete_obsolete_results(tasks):
+        """
+        Deletes the results of previous runs replaced by store_result()
+        from the result store. Called after saving the tasks, so a task
+        never refers to a deleted result.
+        """
+        for task in tasks:
+            ref = getattr(task, 'obsolete_result_ref', '')
+            if ref:
+                get_result_store().delete(ref)
+                task.obsolete_result_ref = ''
+
+    @staticmethod
+    def abort_tasks(tasks, error):
+        """
+        Sets the tasks to ERROR after a failure of the worker itself
+        (i.e. on saving the result), so they don't stay RUNNING. Just
+        the status columns are updated.
+        """
+        for task in tasks:
+            TaskQueue.objects.filter(pk=task.pk, status=RUNNING).update(
+                status=ERROR,
+                error_message=str(error),
+                expire=now() + (task.ttl or datetime.timedelta()))
+
+    def update_task(self, task, error=None):
+        """
+        Sets the new status and schedule of an executed task without
+        saving it. Returns a list with the names of the changed fields.
+        """
+        update_fields = ['status', 'error_message']
+        if error is not None:
+            task.error_message = str(error)
             task.status = ERROR
             if task.is_periodic:
                 task.scheduled = self.calculate_schedule(task)
+                update_fields.append('scheduled')
             elif task.retries > 0:
                 task.retries -= 1
                 task.scheduled = now() + self.retry_delay
                 task.status = WAITING
+                update_fields.extend(('retries', 'scheduled'))
             else:
                 # not scheduled again:
                 task.expire = now() + task.ttl
+                update_fields.append('expire')
         else:
-            task.error = ''  # empty: no error
+            task.error_message = ''  # empty: no error
+            update_fields.extend(RESULT_FIELDS)
             if task.is_periodic:
                 task.status = WAITING
                 task.scheduled = self.calculate_schedule(task)
+                update_fields.append('scheduled')
             else:
                 task.status = DONE
                 task.expire = now() + task.ttl
-        task.save()
+                update_fields.append('expire')
+        return update_fields
 
     def calculate_schedule(self, task):
         """
         Returns the next schedule for a repeating task.
         If task.timedelta is set it is a periodic task, otherwise it is
         a cron task and the next schedule as to be calculated after every
-        run.
+        run. If the task has a reschedule_after attribute (set by
+        apply_misfire_policy()) the next schedule is the first one after
+        this time.
         """
+        after = getattr(task, 'reschedule_after', None)
         if task.function.endswith('_cron'):
             try:
-                cron_data = pickle.loads(task.cron_data)
+                cron_data = serializers.loads(
+                    task.cron_data, task.serializer)
             except Exception as err:
                 # don't break on any error.
                 # report the error and stay in error-state
                 # without a new schedule.
-                task.error = str(err)
+                task.error_message = str(err)
                 task.status = ERROR
                 return task.scheduled
             cs = CronScheduler(last_schedule=task.scheduled, **cron_data)
-            next_schedule = cs.get_next_schedule()
+            next_schedule = cs.get_next_schedule(after)
         else:
             next_schedule = task.scheduled + task.timedelta
+            if after is not None and next_schedule <= after:
+                # keep the phase of the period:
+                periods = int((after - task.scheduled).total_seconds() //
+                              task.timedelta.total_seconds())
+                next_schedule = task.scheduled + task.timedelta * periods
+                while next_schedule <= after:
+                    next_schedule += task.timedelta
         return next_schedule
 
     def _execute(self, task):
         """
         Find callable, call it and store the result.
         """
-        module = importlib.import_module(task.module)
-        callable = getattr(module, task.function)
-        args, kwargs = pickle.loads(task.arguments)
+        callable, args, kwargs = self.prepare_call(task)
         result = callable(*args, **kwargs)
-        task.result = pickle.dumps(result)
+        if iscoroutine(result):
+            # async function executed by a synchronous worker
+            from .aio import run_coroutine
+            result = run_coroutine(result)
+        self.store_result(task, result)
         return task
 
+    def _execute_batch(self, tasks):
+        """
+        Find the callable of the batch function, call it with the
+        arguments of all tasks and store the results.
+        """
+        callable, items = self.prepare_batch(tasks)
+        results = callable(items)
+        if iscoroutine(results):
+            from .aio import run_coroutine
+            results = run_coroutine(results)
+        self.store_batch_results(tasks, results)
+
+    @classmethod
+    def prepare_call(cls, task):
+        """
+        Returns the callable of the task and the arguments for calling
+        it as a tuple: (callable, args, kwargs)
+        """
+        callable = registry.resolve(task.module, task.function)
+        args, kwargs = cls.load_arguments(task)
+        return callable, args, kwargs
+
+    @classmethod
+    def prepare_batch(cls, tasks):
+        """
+        Returns the callable of a batch function and a list with the
+        tuples of positional arguments of the tasks as a tuple:
+        (callable, items)
+        """
+        callable = registry.resolve(tasks[0].module, tasks[0].function)
+        items = [tuple(cls.load_arguments(task)[0]) for task in tasks]
+        return callable, items
 
-def start_worker():
+    @staticmethod
+    def load_arguments(task):
+        """Returns the arguments of the task as a tuple (args, kwargs)."""
+        codec = compression.get_codec(
+            task.compression, compression.ARGUMENTS)
+        arguments = compression.decompress(task.arguments, codec)
+        return serializers.loads(arguments, task.serializer)
+
+    @classmethod
+    def store_batch_results(cls, tasks, results):
+        """
+        Stores the results returned from a batch function: a sequence
+        with a result for every task or None.
+        """
+        if results is None:
+            results = [None] * len(tasks)
+        results = list(results)
+        if len(results) != len(tasks):
+            raise ValueError(
+                'batch function returned {} results for {} tasks'.format(
+                    len(results), len(tasks)))
+        for task, result in zip(tasks, results):
+            cls.store_result(task, result)
+
+    @staticmethod
+    def store_result(task, result):
+        result = serializers.dumps(result, task.serializer)
+        result, codec = compression.compress(result)
+        task.compression = compression.set_codec(
+            task.compression, compression.RESULT, codec)
+        if task.result_ref:
+            # stored result of a previous run: deleted after the new
+            # reference has been saved, see delete_obsolete_results()
+            task.obsolete_result_ref = task.result_ref
+            task.result_ref = ''
+        if use_result_store(result):
+            task.result_ref = get_result_store().put(result)
+            result = b''
+        task.result = result
+
+
+def get_rate_window(rate_limit):
+    """
+    Returns a tuple (window, allowance): the time in seconds to count
+    the started tasks for and the number of tasks allowed to start in
+    this time for the rate_limit in tasks per second. The window is the
+    shortest one with a whole number of tasks, so a fractional rate is
+    not truncated: 1.5 tasks per second allow 3 tasks in 2 seconds.
+    A rate which is not a fraction with a denominator up to
+    MAX_RATE_WINDOW is approximated from below, so the allowance never
+    exceeds the rate_limit.
+    """
+    if rate_limit * MAX_RATE_WINDOW < 1:
+        # less than one task within MAX_RATE_WINDOW
+        window = math.ceil((1 - RATE_TOLERANCE) / rate_limit)
+        return float(window), 1
+    rate = Fraction(rate_limit).limit_denominator(MAX_RATE_WINDOW)
+    if rate > rate_limit * (1 + RATE_TOLERANCE):
+        rate = get_lower_fraction(rate_limit, MAX_RATE_WINDOW)
+    return float(rate.denominator), rate.numerator
+
+
+def get_lower_fraction(value, max_denominator):
+    """
+    Returns the largest fraction not greater than value with a
+    denominator up to max_denominator: the lower one of the two best
+    approximations found from the continued fraction of value (like
+    Fraction.limit_denominator() does, which returns the closer one).
+    """
+    value = Fraction(value)
+    if value.denominator <= max_denominator:
+        return value
+    p0, q0, p1, q1 = 0, 1, 1, 0
+    n, d = value.numerator, value.denominator
+    while True:
+        a = n // d
+        q2 = q0 + a * q1
+        if q2 > max_denominator:
+            break
+        p0, q0, p1, q1 = p1, q1, p0 + a * p1, q2
+        n, d = d, n - a * d
+    k = (max_denominator - q0) // q1
+    return min(Fraction(p0 + k * p1, q0 + k * q1), Fraction(p1, q1))
+
+
+class FunctionUsage(object):
+    """
+    Number of running and recently started tasks of a function for
+    enforcing the rate_limit and max_concurrency at claim time.
+    """
+
+    def __init__(self, running=0, started=0):
+        self.running = running
+        self.started = started
+
+    @classmethod
+    def get(cls, module, function, rate_limit=None):
+        """
+        Returns the usage of the function from the database counting
+        the tasks started in the rate window of the rate_limit. Returns
+        None if the usage is locked by another worker (PostgreSQL only).
+        """
+        # serializes the claiming of tasks of the function between the
+        # workers. Don't wait for the lock to prevent deadlocks:
+        name = 'limits.{}.{}'.format(module, function)
+        if not advisory_lock(name, wait=False):
+            return None
+        since = now()
+        if rate_limit:
+            window, _ = get_rate_window(rate_limit)
+            since -= datetime.timedelta(seconds=window)
+        running = Q(status=RUNNING)
+        if settings.AUTOTASK_RECLAIM_TIMEOUT:
+            # older tasks are left behind by killed workers
+            running &= Q(started__gte=now() - datetime.timedelta(
+                seconds=settings.AUTOTASK_RECLAIM_TIMEOUT))
+        qs = TaskQueue.objects.filter(module=module, function=function)
+        qs = qs.filter(running | Q(started__gte=since))
+        counts = qs.aggregate(
+            running=count_if(running),
+            started=count_if(Q(started__gte=since)))
+        return cls(counts['running'] or 0, counts['started'] or 0)
+
+    def allows(self, rate_limit, max_concurrency):
+        """
+        Returns a boolean whether one more task can get started without
+        exceeding the limits.
+        """
+        if max_concurrency is not None and self.running >= max_concurrency:
+            return False
+        if rate_limit:
+            _, allowance = get_rate_window(rate_limit)
+            if self.started >= allowance:
+                return False
+        return True
+
+    def remaining(self, rate_limit, max_concurrency):
+        """
+        Returns the number of further tasks which can get started
+        without exceeding the limits or None if there is no limit.
+        """
+        remaining = []
+        if max_concurrency is not None:
+            remaining.append(max_concurrency - self.running)
+        if rate_limit:
+            _, allowance = get_rate_window(rate_limit)
+            remaining.append(allowance - self.started)
+        if remaining:
+            return max(0, min(remaining))
+        return None
+
+    def add(self, count=1):
+        """Counts started tasks."""
+        self.running += count
+        self.started += count
+
+
+def count_if(condition):
+    """Returns an aggregate counting the rows matching the condition."""
+    return Sum(Case(
+        When(condition, then=1), default=0, output_field=IntegerField()))
+
+
+def start_worker(prefork=None, queue=DEFAULT_QUEUE):
     """
     Entry-Point to start the worker from the run_autotask management
     command. This command should not invoked manually.
+    If prefork is given, the process becomes a master forking the given
+    number of workers. The worker handles the tasks of the given queue.
     """
     _, exit_event = get_shutdown_objects()
-    th = TaskHandler(exit_event)
-    th.run()
+    if prefork:
+        from .prefork import run_prefork
+        run_prefork(exit_event, prefork, queue)
+    elif settings.AUTOTASK_WORKER_MODE == 'threads':
+        run_threads(exit_event, settings.AUTOTASK_WORKER_THREADS, queue)
+    elif settings.AUTOTASK_WORKER_MODE == 'asyncio':
+        # import here because of the Python 3 only syntax
+        from .aio import run_event_loop
+        run_event_loop(
+            exit_event, settings.AUTOTASK_ASYNC_CONCURRENCY, queue)
+    else:
+        th = TaskHandler(exit_event, queue=queue)
+        th.run()
+
+
+def run_threads(exit_event, num_threads, queue=DEFAULT_QUEUE):
+    """
+    Runs num_threads TaskHandlers for the given queue in separate
+    threads of the current process. Threads terminated by an unexpected
+    error are restarted.
+    The threads share a single listener for notifications which is
+    served by the calling thread. Returns after the exit_event is set
+    and all threads have terminated.
+    """
+    listener = Listener.create()
+    broadcaster = Broadcaster(listener) if listener else None
+
+    def start_thread():
+        thread = threading.Thread(
+            target=run_handler, args=(exit_event, broadcaster, queue))
+        thread.start()
+        return thread
+
+    threads = [start_thread() for n in range(num_threads)]
+    while not exit_event.is_set():
+        if broadcaster:
+            broadcaster.listen(EXIT_CHECK_INTERVAL)
+        else:
+            exit_event.wait(timeout=EXIT_CHECK_INTERVAL)
+        threads = [thread if thread.is_alive() else start_thread()
+                   for thread in threads]
+    for thread in threads:
+        thread.join()
+    if broadcaster:
+        broadcaster.close()
+
+
+def run_handler(exit_event, listener=None, queue=DEFAULT_QUEUE):
+    """
+    Runs a TaskHandler in the current thread. Django opens a database
+    connection per thread which gets closed when the handler
+    terminates.
+    """
+    try:
+        TaskHandler(exit_event, listener, queue).run()
+    finally:
+        connection.close()